@@ -0,0 +1,199 @@
+"""
+Đánh giá chất lượng và latency của bước retrieval trên gold set (benchmarks/gold/retrieval_gold.jsonl):
+mỗi câu hỏi được gán với các Điều trong sáu văn bản ở data/. Chạy retrieval với nhiều cấu hình
+(chunk_size, k = search.max_results, HyDE, embedding model, gộp chunk gần trùng) và báo cáo recall@k,
+MRR, nDCG@k, số lần gọi ISREL (và số lần lãng phí cho kết quả gần trùng) và latency cạnh nhau.
+
+Mỗi cấu hình index được dựng trong Qdrant in-memory; embedding đi qua CachedEmbeddings nên các lần
+chạy lặp lại gần như không tốn chi phí embedding.
+
+    python -m benchmarks.eval_retrieval --chunk-sizes 500,1000 --k 5,10 --hyde off,on
+    python -m benchmarks.eval_retrieval --models text-embedding-3-large,text-embedding-3-small --grade
+"""
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+from qdrant_client import QdrantClient
+
+from ingest import annotate_structure, deduplicate, index_documents, load_documents, split_documents
+from src.components.dedup import jaccard
+from src.components.vectordb import get_embeddings
+from src.config import cfg
+from src.logger import logger
+
+GOLD_PATH = os.path.join("benchmarks", "gold", "retrieval_gold.jsonl")
+
+
+def load_gold(path: str = GOLD_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def matching_references(metadata: dict, item: dict) -> list:
+    """Các nguồn của chunk (nhiều nguồn nếu chunk gần trùng đã được gộp) khớp với câu hỏi gold"""
+    return [ref for ref in metadata.get("references") or [metadata]
+            if os.path.basename(ref.get("source", "")) == item["source"]
+            and set(ref.get("articles") or []) & set(item["articles"])]
+
+
+def is_relevant(metadata: dict, item: dict) -> bool:
+    return bool(matching_references(metadata, item))
+
+
+def redundant_count(ranked) -> int:
+    """Số kết quả gần trùng (Jaccard >= cfg.ingest.dedup_threshold) với một kết quả xếp trên nó"""
+    threshold = cfg.ingest.dedup_threshold
+    return sum(any(jaccard(doc.page_content, above.page_content) >= threshold for above in ranked[:rank])
+               for rank, doc in enumerate(ranked))
+
+
+def score_ranking(ranked, item: dict, k: int, total_relevant: int) -> dict:
+    """recall@k (theo Điều), reciprocal rank và nDCG@k (relevance nhị phân theo chunk)"""
+    top = ranked[:k]
+    relevance = [is_relevant(doc.metadata, item) for doc in top]
+    covered = set()
+    for doc, relevant in zip(top, relevance):
+        for ref in matching_references(doc.metadata, item) if relevant else []:
+            covered |= set(ref.get("articles") or []) & set(item["articles"])
+    first = next((rank for rank, relevant in enumerate(relevance, 1) if relevant), None)
+    dcg = sum(1 / math.log2(rank + 1) for rank, relevant in enumerate(relevance, 1) if relevant)
+    idcg = sum(1 / math.log2(rank + 1) for rank in range(1, min(k, total_relevant) + 1))
+    return {
+        "recall": len(covered) / len(item["articles"]),
+        "rr": 1 / first if first else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+    }
+
+
+class IndexCache:
+    """Dựng (và tái sử dụng) index in-memory cho mỗi bộ (chunk_size, chunk_overlap, model, dedup)"""
+
+    def __init__(self, pdf_files):
+        self.documents = load_documents(pdf_files)
+        self.client = QdrantClient(location=":memory:")
+        self._indexes = {}
+
+    def get(self, chunk_size: int, chunk_overlap: int, model: str, dedup: bool = False):
+        key = (chunk_size, chunk_overlap, model, dedup)
+        if key not in self._indexes:
+            start = time.perf_counter()
+            splits = annotate_structure(split_documents(self.documents, chunk_size, chunk_overlap))
+            splits = deduplicate(splits, enabled=dedup)
+            name = f"eval_{chunk_size}_{chunk_overlap}_{model}_{int(dedup)}".replace(".", "_")
+            vectorstore = index_documents(splits, embeddings=get_embeddings(model), client=self.client,
+                                          collection_name=name)
+            logger.info(f"Index {key}: {len(splits)} chunks, {time.perf_counter() - start:.1f}s")
+            self._indexes[key] = (vectorstore, splits)
+        return self._indexes[key]
+
+
+def evaluate(index_cache: IndexCache, gold, chunk_size: int, chunk_overlap: int, model: str, k: int,
+             hyde: bool, grade: bool, hyde_cache: dict, dedup: bool = False) -> dict:
+    vectorstore, splits = index_cache.get(chunk_size, chunk_overlap, model, dedup)
+    totals = {"recall": 0.0, "rr": 0.0, "ndcg": 0.0}
+    search_latencies, hyde_latencies = [], []
+    isrel_calls, isrel_kept, redundant = 0, 0, 0
+
+    for item in gold:
+        query = item["question"]
+        if hyde:
+            if query not in hyde_cache:
+                from src.chains.modules import hyde_generator
+                start = time.perf_counter()
+                hyde_cache[query] = (hyde_generator.invoke({"question": query}).content,
+                                     time.perf_counter() - start)
+            query, hyde_latency = hyde_cache[query]
+            hyde_latencies.append(hyde_latency)
+
+        start = time.perf_counter()
+        ranked = vectorstore.similarity_search(query, k=k)
+        search_latencies.append(time.perf_counter() - start)
+
+        total_relevant = sum(is_relevant(chunk.metadata, item) for chunk in splits)
+        for name, value in score_ranking(ranked, item, k, total_relevant).items():
+            totals[name] += value
+
+        # grade_documents_node gọi ISREL một lần cho mỗi chunk được truy xuất
+        isrel_calls += len(ranked)
+        redundant += redundant_count(ranked)
+        if grade:
+            from src.chains.modules import retrieval_grader
+            for doc in ranked:
+                verdict = retrieval_grader.invoke({"question": item["question"], "document": doc.page_content})
+                isrel_kept += verdict.score == "relevant"
+
+    n = len(gold)
+    result = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "model": model,
+        "k": k,
+        "hyde": hyde,
+        "dedup": dedup,
+        "chunks": len(splits),
+        f"recall@{k}": round(totals["recall"] / n, 4),
+        "mrr": round(totals["rr"] / n, 4),
+        f"ndcg@{k}": round(totals["ndcg"] / n, 4),
+        "isrel_calls_per_query": round(isrel_calls / n, 2),
+        # ISREL call lãng phí cho kết quả gần trùng với kết quả xếp trên
+        "redundant_per_query": round(redundant / n, 3),
+        "search_ms_avg": round(sum(search_latencies) / n * 1000, 2),
+        "hyde_ms_avg": round(sum(hyde_latencies) / n * 1000, 2) if hyde_latencies else 0.0,
+    }
+    if grade:
+        result["isrel_kept_per_query"] = round(isrel_kept / n, 2)
+    return result
+
+
+def print_table(results):
+    print(f"{'chunk':>6} {'model':<24} {'k':>3} {'hyde':>5} {'dedup':>5} {'chunks':>6} {'recall':>7} {'mrr':>6} "
+          f"{'ndcg':>6} {'isrel':>6} {'redund':>6} {'search':>8} {'hyde_ms':>8}")
+    for r in results:
+        k = r["k"]
+        print(f"{r['chunk_size']:>6} {r['model']:<24} {k:>3} {str(r['hyde']):>5} {str(r['dedup']):>5} "
+              f"{r['chunks']:>6} {r[f'recall@{k}']:>7.3f} {r['mrr']:>6.3f} {r[f'ndcg@{k}']:>6.3f} "
+              f"{r['isrel_calls_per_query']:>6.1f} {r['redundant_per_query']:>6.2f} "
+              f"{r['search_ms_avg']:>7.1f}ms {r['hyde_ms_avg']:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đánh giá retrieval trên gold set các văn bản luật trong data/")
+    parser.add_argument("--gold", default=GOLD_PATH)
+    parser.add_argument("--chunk-sizes", default="500")
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--k", default="5,10", help="Các giá trị search.max_results")
+    parser.add_argument("--hyde", default="off", help="off, on hoặc off,on")
+    parser.add_argument("--dedup", default="off,on", help="Gộp chunk gần trùng khi ingest: off, on hoặc off,on")
+    parser.add_argument("--models", default="text-embedding-3-large")
+    parser.add_argument("--grade", action="store_true", help="Chạy retrieval_grader thật trên kết quả")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/retrieval-<time>.json)")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold)
+    index_cache = IndexCache(sorted(glob.glob("data/*.pdf")))
+    hyde_cache = {}
+    results = []
+    for chunk_size, model, k, hyde, dedup in itertools.product(
+        [int(v) for v in args.chunk_sizes.split(",")],
+        args.models.split(","),
+        [int(v) for v in args.k.split(",")],
+        [v == "on" for v in args.hyde.split(",")],
+        [v == "on" for v in args.dedup.split(",")],
+    ):
+        results.append(evaluate(index_cache, gold, chunk_size, args.chunk_overlap, model, k, hyde,
+                                args.grade, hyde_cache, dedup))
+    print_table(results)
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"retrieval-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"timestamp": datetime.now(timezone.utc).isoformat(), "questions": len(gold)},
+                   "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả: {output}")
@@ -0,0 +1,149 @@
+"""
+So sánh retrieval phẳng và retrieval hai tầng (src/components/hierarchy.py) khi corpus lớn dần từ sáu văn
+bản trong data/ tới hàng chục nghìn văn bản: latency mỗi truy vấn (mean/p50/p95) và recall@k so với top-k
+chính xác (brute force bằng numpy trên toàn bộ chunk).
+
+Corpus là vector tổng hợp có cấu trúc văn bản -> chương -> chunk (tâm văn bản, chương lệch khỏi tâm văn
+bản, chunk lệch khỏi tâm chương; chương đầu mỗi văn bản không có "chapter" như phần mở đầu), không cần
+gọi embedding. Truy vấn là vector của một chunk ngẫu nhiên cộng nhiễu. Mỗi kích thước corpus được index
+vào collection tạm <collection>_bench_hierarchy (xoá sau khi chạy) của Qdrant theo cfg.qdrant, hoặc
+Qdrant in-memory với --location :memory: (chỉ nên dùng cho corpus nhỏ: Qdrant local duyệt filter bằng
+Python, không có payload index, nên latency hai tầng ở chế độ này không đại diện cho server).
+
+    python -m benchmarks.hierarchy --docs 6,60,600,6000,20000
+    python -m benchmarks.hierarchy --docs 6,60,600 --location :memory: --queries 50
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from src.components.hierarchy import build_sections, search, sections_collection
+from src.components.vectordb import get_client
+from src.config import cfg
+
+
+def _unit(matrix):
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def synthetic_corpus(rng, docs: int, chapters: int, chunks_per_chapter: int, dim: int,
+                     chapter_noise: float, chunk_noise: float):
+    """Vector chunk (docs * chapters * chunks_per_chapter x dim) và (văn bản, chương) của từng chunk"""
+    laws = _unit(rng.standard_normal((docs, dim), dtype=np.float32))
+    centers = _unit(laws[:, None, :] + chapter_noise * _unit(
+        rng.standard_normal((docs, chapters, dim), dtype=np.float32)))
+    vectors = _unit(centers[:, :, None, :] + chunk_noise * _unit(
+        rng.standard_normal((docs, chapters, chunks_per_chapter, dim), dtype=np.float32)))
+    law_ids, chapter_ids, _ = np.indices((docs, chapters, chunks_per_chapter)).reshape(3, -1)
+    return vectors.reshape(-1, dim), law_ids, chapter_ids
+
+
+def index_corpus(client, collection_name: str, vectors, law_ids, chapter_ids, batch_size: int = 1024):
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(collection_name, vectors_config=models.VectorParams(
+        size=vectors.shape[1], distance=models.Distance.COSINE))
+    for start in range(0, len(vectors), batch_size):
+        end = min(start + batch_size, len(vectors))
+        client.upsert(collection_name, wait=True, points=models.Batch(
+            ids=list(range(start, end)),
+            vectors=vectors[start:end].tolist(),
+            payloads=[{"page_content": "", "metadata": {
+                "source": f"law-{law}", "chapter": f"Chương {chapter}" if chapter else None}}
+                for law, chapter in zip(law_ids[start:end], chapter_ids[start:end])],
+        ))
+
+
+def exact_top_k(vectors, queries, k: int, batch_size: int = 65536):
+    """Top-k chính xác theo cosine (vector đã chuẩn hoá) của từng truy vấn"""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(vectors), batch_size):
+        scores = queries @ vectors[start:start + batch_size].T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores, ids = np.hstack([best_scores, scores]), np.hstack([best_ids, ids])
+        top = np.argsort(-scores, axis=1)[:, :k]
+        best_scores, best_ids = np.take_along_axis(scores, top, 1), np.take_along_axis(ids, top, 1)
+    return [set(row.tolist()) for row in best_ids]
+
+
+def measure(run, queries, truth, k: int) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        points = run(query.tolist())
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({point.id for point in points} & expected) / k)
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "latency_ms_mean": round(float(np.mean(latencies)), 2),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency và recall của retrieval phẳng vs hai tầng theo kích thước corpus")
+    parser.add_argument("--docs", default="6,60,600,6000,20000", help="Số văn bản của từng corpus")
+    parser.add_argument("--chapters", type=int, default=8, help="Số chương mỗi văn bản")
+    parser.add_argument("--chunks-per-chapter", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--chapter-noise", type=float, default=0.8, help="Độ lệch tâm chương khỏi tâm văn bản")
+    parser.add_argument("--chunk-noise", type=float, default=1.0, help="Độ lệch chunk khỏi tâm chương")
+    parser.add_argument("--query-noise", type=float, default=0.8, help="Độ lệch truy vấn khỏi chunk gốc")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=cfg.search.max_results)
+    parser.add_argument("--top-laws", type=int, default=cfg.hierarchy.top_laws)
+    parser.add_argument("--top-chapters", type=int, default=cfg.hierarchy.top_chapters)
+    parser.add_argument("--location", help="Qdrant location (vd. :memory:); mặc định server theo cfg.qdrant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/hierarchy-<time>.json)")
+    args = parser.parse_args()
+
+    client = QdrantClient(location=args.location) if args.location else get_client()
+    collection_name = f"{cfg.qdrant.collection_name}_bench_hierarchy"
+    rng = np.random.default_rng(args.seed)
+    results = []
+    try:
+        for docs in [int(v) for v in args.docs.split(",")]:
+            vectors, law_ids, chapter_ids = synthetic_corpus(
+                rng, docs, args.chapters, args.chunks_per_chapter, args.dim, args.chapter_noise, args.chunk_noise)
+            start = time.perf_counter()
+            index_corpus(client, collection_name, vectors, law_ids, chapter_ids)
+            build_sections(client, collection_name)
+            index_seconds = time.perf_counter() - start
+
+            picks = rng.integers(0, len(vectors), args.queries)
+            queries = _unit(vectors[picks] + args.query_noise * _unit(
+                rng.standard_normal((args.queries, args.dim), dtype=np.float32)))
+            truth = exact_top_k(vectors, queries, args.k)
+            for mode, run in (
+                ("flat", lambda q: client.query_points(collection_name, query=q, limit=args.k).points),
+                ("hierarchical", lambda q: search(client, q, args.k, collection_name,
+                                                  top_laws=args.top_laws, top_chapters=args.top_chapters)),
+            ):
+                results.append({"docs": docs, "chunks": len(vectors), "mode": mode,
+                                "index_seconds": round(index_seconds, 1), **measure(run, queries, truth, args.k)})
+    finally:
+        for name in (collection_name, sections_collection(collection_name)):
+            if client.collection_exists(name):
+                client.delete_collection(name)
+
+    print(f"{'docs':>6} {'chunks':>8} {'mode':<13} {'recall@' + str(args.k):>9} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in results:
+        print(f"{r['docs']:>6} {r['chunks']:>8} {r['mode']:<13} {r['recall']:>9.3f} {r['latency_ms_mean']:>8.2f} "
+              f"{r['latency_ms_p50']:>7.2f} {r['latency_ms_p95']:>7.2f}")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"hierarchy-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"timestamp": datetime.now(timezone.utc).isoformat(), "location": args.location,
+                            **{key: value for key, value in vars(args).items() if key not in ("output", "location")}},
+                   "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả: {output}")
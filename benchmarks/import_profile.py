@@ -0,0 +1,83 @@
+"""
+Đo thời gian import (cold start) của các entry point bằng `python -X importtime`, mỗi module
+trong một process riêng. In tổng thời gian và các module tốn nhiều nhất (cumulative), ghi JSON
+vào benchmarks/results/ và tuỳ chọn fail khi vượt ngân sách --max-ms.
+
+    python -m benchmarks.import_profile
+    python -m benchmarks.import_profile src.server.app --top 15 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+DEFAULT_MODULES = ["src.config", "ingest", "src.graph.workflow", "src.server.app"]
+
+
+def profile_import(module: str):
+    """Import module trong process mới; trả về (wall ms, [(cumulative us, self us, tên module)])"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} thất bại:\n{proc.stderr[-2000:]}")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return wall_ms, entries
+
+
+def summarize(module: str, wall_ms: float, entries, top: int) -> dict:
+    # Chỉ lấy module cấp cao nhất của mỗi cây import để tổng không bị đếm trùng
+    roots = [(cum, name.strip()) for cum, _, name in entries if not name.startswith("  ")]
+    heaviest = sorted(((cum, name.strip()) for cum, _, name in entries), reverse=True)[:top]
+    return {
+        "module": module,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(cum for cum, _ in roots) / 1000, 1),
+        "modules_imported": len(entries),
+        "top": [{"module": name, "cumulative_ms": round(cum / 1000, 1)} for cum, name in heaviest],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo thời gian import các entry point")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10, help="Số module nặng nhất in ra cho mỗi entry point")
+    parser.add_argument("--max-ms", type=float, help="Ngân sách import_ms; exit code 1 nếu vượt")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/import-<time>.json)")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        wall_ms, entries = profile_import(module)
+        result = summarize(module, wall_ms, entries, args.top)
+        results.append(result)
+        print(f"{module}: import {result['import_ms']:.1f}ms, wall {result['wall_ms']:.1f}ms, "
+              f"{result['modules_imported']} modules")
+        for item in result["top"]:
+            print(f"    {item['cumulative_ms']:>9.1f}ms  {item['module']}")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"import-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"timestamp": datetime.now(timezone.utc).isoformat(), "python": sys.version},
+                   "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả: {output}")
+
+    over = [r["module"] for r in results if args.max_ms is not None and r["import_ms"] > args.max_ms]
+    if over:
+        print(f"Vượt ngân sách {args.max_ms}ms: {', '.join(over)}")
+        sys.exit(1)
@@ -0,0 +1,250 @@
+"""
+End-to-end load test: khởi chạy stub server (LLM/embedding/OCR) và ứng dụng (Qdrant in-memory seed từ
+data/*.pdf) thành các subprocess, rồi gửi /chat và /chat/upload ở nhiều mức concurrency.
+
+Báo cáo throughput, latency p50/p95/p99, số LLM call/request và peak RSS của ứng dụng; kết quả ghi
+ra JSON để so sánh giữa các commit.
+
+    python -m benchmarks.load_test --levels 1,4,16 --requests 40
+    python -m benchmarks.load_test compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+import httpx
+
+QUESTIONS = [
+    "Điều kiện để được hưởng trợ cấp thất nghiệp theo quy định mới là gì?",
+    "Luật quy định thời giờ làm việc tối đa của người lao động như thế nào?",
+    "Doanh nghiệp phải thực hiện nghĩa vụ gì khi chấm dứt hợp đồng lao động?",
+    "Văn bản này có hiệu lực thi hành từ ngày nào?",
+    "Quy định về xử phạt vi phạm hành chính trong lĩnh vực này ra sao?",
+]
+
+DOCUMENT_CONTEXT = """# HỢP ĐỒNG LAO ĐỘNG
+## Điều 3. Thời giờ làm việc
+Người lao động làm việc 10 giờ/ngày, 6 ngày/tuần, không được nghỉ phép năm."""
+
+
+def tiny_png() -> bytes:
+    """Ảnh PNG 1x1 hợp lệ cho endpoint upload"""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"\x00\xff\xff\xff")) + chunk(b"IEND", b""))
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb(pid: int) -> float:
+    """Peak resident set size (VmHWM) của process, Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def wait_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} không sẵn sàng sau {timeout}s")
+
+
+async def _send(client: httpx.AsyncClient, endpoint: str, index: int, image: bytes):
+    question = QUESTIONS[index % len(QUESTIONS)]
+    if endpoint == "chat":
+        payload = {"question": question}
+        if index % 2:
+            payload["document_context"] = DOCUMENT_CONTEXT
+        return await client.post("/api/v1/chat", json=payload)
+    return await client.post(
+        "/api/v1/chat/upload",
+        data={"question": question},
+        files={"image": ("scan.png", image, "image/png")},
+    )
+
+
+async def run_level(app_url: str, stub_url: str, endpoint: str, concurrency: int, total: int,
+                    timeout: float, app_pid: int) -> dict:
+    image = tiny_png()
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=stub_url) as stub:
+        await stub.post("/stats/reset")
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                index = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await _send(client, endpoint, index, image)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+        stats = (await stub.get("/stats")).json()
+
+    completed = len(latencies) or 1
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "llm_calls_per_request": round(stats.get("chat_completions", 0) / completed, 2),
+        "embedding_calls_per_request": round(stats.get("embeddings", 0) / completed, 2),
+        "peak_rss_mb": round(peak_rss_mb(app_pid), 1),
+    }
+
+
+async def run(args) -> dict:
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    python = sys.executable
+    stub = subprocess.Popen([python, "-m", "benchmarks.stubs", "--port", str(args.stub_port),
+                             "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms)])
+    app = None
+    try:
+        await wait_ready(f"{stub_url}/stats", 30)
+        app = subprocess.Popen([python, "-m", "benchmarks.serve_app", "--stub-url", stub_url,
+                                "--port", str(args.app_port), "--max-pages", str(args.max_pages)])
+        await wait_ready(f"{app_url}/health", args.startup_timeout)
+
+        results = []
+        for endpoint in args.endpoints:
+            for level in args.levels:
+                total = max(args.requests, level)
+                result = await run_level(app_url, stub_url, endpoint, level, total, args.timeout, app.pid)
+                print(f"{endpoint:>7} c={level:<3} {result['throughput_rps']:>7.2f} req/s  "
+                      f"p50={result['latency_p50_ms']:>8.1f}ms p95={result['latency_p95_ms']:>8.1f}ms "
+                      f"p99={result['latency_p99_ms']:>8.1f}ms llm/req={result['llm_calls_per_request']:.2f} "
+                      f"rss={result['peak_rss_mb']:.0f}MB errors={result['errors']}")
+                results.append(result)
+        # Latency/token theo chain cộng dồn trên toàn bộ lần chạy
+        async with httpx.AsyncClient(base_url=app_url) as client:
+            chains = (await client.get("/metrics/chains")).json()["chains"]
+        for row in chains:
+            print(f"{row['chain']:>22} {row['latency_share']:>6.1%} latency  {row['token_share']:>6.1%} tokens  "
+                  f"mean={row['latency_mean_ms']:>7.1f}ms llm_calls={row['llm_calls']} model={row['model']}")
+    finally:
+        for process in (app, stub):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "max_pages": args.max_pages,
+        },
+        "results": results,
+        "chains": chains,
+    }
+
+
+def compare(base_path: str, new_path: str):
+    """In chênh lệch giữa hai file kết quả"""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    base_index = {(r["endpoint"], r["concurrency"]): r for r in base["results"]}
+    print(f"base={base['meta']['commit']} new={new['meta']['commit']}")
+    for result in new["results"]:
+        previous = base_index.get((result["endpoint"], result["concurrency"]))
+        if previous is None:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms",
+                    "llm_calls_per_request", "peak_rss_mb"):
+            before, after = previous[key], result[key]
+            change = (after - before) / before * 100 if before else 0.0
+            deltas.append(f"{key}={after} ({change:+.1f}%)")
+        print(f"{result['endpoint']:>7} c={result['concurrency']:<3} " + " ".join(deltas))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Load test /chat và /chat/upload với stub dependencies")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Các mức concurrency, cách nhau bởi dấu phẩy")
+    parser.add_argument("--requests", type=int, default=20, help="Số request mỗi mức concurrency")
+    parser.add_argument("--endpoints", default="chat,upload")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--max-pages", type=int, default=0, help="Giới hạn số trang seed (0 = tất cả)")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9200)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/<commit>-<time>.json)")
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(",")]
+    args.endpoints = args.endpoints.split(",")
+
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join(
+        "benchmarks", "results",
+        f"load-{report['meta']['commit']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả: {output}")
@@ -0,0 +1,92 @@
+"""
+So sánh các backend trích xuất PDF của ingest (src/components/pdf_parser.py) trên data/*.pdf:
+tốc độ (pages/s, theo số process) và độ trung thực của text so với backend tham chiếu (mặc định
+pypdf, tức text đang được index):
+
+- similarity: tỉ lệ giống nhau trung bình mỗi trang (difflib, sau khi chuẩn hoá khoảng trắng)
+- article_recall: tỉ lệ tiêu đề "Điều N." của tham chiếu còn tìm thấy (ingest dựa vào để gắn metadata)
+- chars_ratio: tổng số ký tự (không tính khoảng trắng) so với tham chiếu
+
+    python -m benchmarks.parse_pdf --backends pypdf,pymupdf --workers 1,4
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+
+from ingest import ARTICLE_PATTERN
+from src.components.pdf_parser import load_pdf_pages
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def articles(documents) -> set:
+    return {(doc.metadata["source"], int(n)) for doc in documents for n in ARTICLE_PATTERN.findall(doc.page_content)}
+
+
+def similarity(text: str, reference: str) -> float:
+    text, reference = normalize(text), normalize(reference)
+    if text == reference:
+        return 1.0
+    return SequenceMatcher(None, text, reference, autojunk=False).ratio()
+
+
+def fidelity(documents, reference) -> dict:
+    ratios = [similarity(doc.page_content, ref.page_content) for doc, ref in zip(documents, reference)]
+    expected = articles(reference)
+    chars = sum(len(re.sub(r"\s", "", doc.page_content)) for doc in documents)
+    ref_chars = sum(len(re.sub(r"\s", "", doc.page_content)) for doc in reference)
+    return {
+        "similarity": round(sum(ratios) / len(ratios), 4) if ratios else 0.0,
+        "exact_pages": sum(doc.page_content == ref.page_content for doc, ref in zip(documents, reference)),
+        "article_recall": round(len(expected & articles(documents)) / len(expected), 4) if expected else 1.0,
+        "chars_ratio": round(chars / ref_chars, 4) if ref_chars else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh backend trích xuất PDF trên data/*.pdf")
+    parser.add_argument("--pdfs", default="data/*.pdf")
+    parser.add_argument("--backends", default="pypdf,pymupdf")
+    parser.add_argument("--workers", default="1,0", help="Số process (0 = số CPU)")
+    parser.add_argument("--reference", default="pypdf", help="Backend tham chiếu cho độ trung thực")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định benchmarks/results/parse-<time>.json)")
+    args = parser.parse_args()
+
+    pdf_files = sorted(glob.glob(args.pdfs))
+    reference = load_pdf_pages(pdf_files, backend=args.reference, workers=0)
+    results = []
+    for backend in args.backends.split(","):
+        for workers in [int(v) for v in args.workers.split(",")]:
+            start = time.perf_counter()
+            documents = load_pdf_pages(pdf_files, backend=backend, workers=workers)
+            elapsed = time.perf_counter() - start
+            results.append({
+                "backend": backend,
+                "workers": workers or os.cpu_count(),
+                "pages": len(documents),
+                "seconds": round(elapsed, 3),
+                "pages_per_s": round(len(documents) / elapsed, 1),
+                **fidelity(documents, reference),
+            })
+
+    print(f"{'backend':<10} {'workers':>7} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'similar':>8} "
+          f"{'exact':>6} {'articles':>9} {'chars':>6}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['workers']:>7} {r['pages']:>6} {r['seconds']:>8.2f} {r['pages_per_s']:>8.1f} "
+              f"{r['similarity']:>8.3f} {r['exact_pages']:>6} {r['article_recall']:>9.3f} {r['chars_ratio']:>6.3f}")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"parse-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"timestamp": datetime.now(timezone.utc).isoformat(), "files": len(pdf_files),
+                            "reference": args.reference, "cpus": os.cpu_count()},
+                   "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả: {output}")
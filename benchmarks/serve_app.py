@@ -0,0 +1,65 @@
+"""
+Khởi chạy src.server.app:app trỏ tới stub LLM/embedding/OCR server và Qdrant in-memory
+được seed từ data/*.pdf. Dùng bởi benchmarks/load_test.py (chạy như subprocess riêng
+để đo RSS của riêng ứng dụng).
+
+    python -m benchmarks.serve_app --stub-url http://127.0.0.1:9100 --port 9200
+"""
+import argparse
+import glob
+import os
+import time
+
+
+def configure(stub_url: str):
+    """Ghi đè cfg trước khi các module chains/graph được import"""
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "sk-benchmark")
+    os.environ.setdefault("QDRANT_HOST", "localhost")
+    os.environ.setdefault("QDRANT_HTTP_PORT", "6333")
+    os.environ.setdefault("QDRANT_API_KEY", "")
+
+    from src.config import cfg
+    cfg.llm.base_url = f"{stub_url}/v1"
+    cfg.deepseek.base_url = stub_url
+    cfg.qdrant.location = ":memory:"
+    # Payload lặp lại giữa các request sẽ chỉ đo được cache thay vì pipeline
+    cfg.cache.response = False
+    cfg.cache.ocr = False
+    cfg.cache.chains = {}
+    return cfg
+
+
+def seed(pdf_glob: str = "data/*.pdf", max_pages: int = 0):
+    """Seed Qdrant in-memory bằng pipeline của ingest.py"""
+    from ingest import annotate_structure, deduplicate, index_documents, load_documents, split_documents
+    from src.components.hierarchy import build_sections
+    from src.config import cfg
+    from src.logger import logger
+
+    start = time.perf_counter()
+    documents = load_documents(sorted(glob.glob(pdf_glob)))
+    if max_pages:
+        documents = documents[:max_pages]
+    splits = deduplicate(annotate_structure(split_documents(documents)))
+    index_documents(splits)
+    if cfg.hierarchy.enabled:
+        build_sections()
+    logger.info(f"Seeded {len(splits)} chunks in {time.perf_counter() - start:.1f}s")
+    return len(splits)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stub-url", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--max-pages", type=int, default=0, help="Giới hạn số trang seed (0 = tất cả)")
+    args = parser.parse_args()
+
+    configure(args.stub_url)
+    seed(max_pages=args.max_pages)
+
+    import uvicorn
+    from src.server.app import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
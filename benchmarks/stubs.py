@@ -0,0 +1,251 @@
+"""
+Stub server OpenAI-compatible (chat completions + embeddings) và DeepSeek OCR dùng cho benchmark.
+Trả lời tất định, có độ trễ cấu hình được, và đếm số lời gọi để tính LLM calls/request.
+
+    python -m benchmarks.stubs --port 9100 --latency-ms 50
+
+Câu trả lời văn bản được stream (SSE) khi request có "stream": true, mỗi từ cách nhau --token-ms;
+/stats đếm số token đã gửi (stream_tokens) và số stream bị client ngắt giữa chừng (stream_aborted).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIM = 256
+
+STUB_OCR_MARKDOWN = """# HỢP ĐỒNG LAO ĐỘNG
+
+## Điều 1. Thời hạn hợp đồng
+Hợp đồng có thời hạn 12 tháng kể từ ngày ký.
+
+## Điều 2. Tiền lương
+Mức lương: 8.000.000 đồng/tháng, trả vào ngày 05 hàng tháng.
+
+## Điều 3. Thời giờ làm việc
+Người lao động làm việc 10 giờ/ngày, 6 ngày/tuần.
+"""
+
+STUB_ANSWER = (
+    "Căn cứ các điều luật được cung cấp, nội dung trong tài liệu cần được đối chiếu với quy định hiện hành. "
+    "Điều khoản về thời giờ làm việc có dấu hiệu vượt quá giới hạn luật định."
+)
+
+
+def _tokens(text: str):
+    return re.findall(r"\w+", text.lower())
+
+
+def embed_text(text: str):
+    """Embedding tất định dạng hashing bag-of-words (chuẩn hoá L2)"""
+    vector = [0.0] * EMBEDDING_DIM
+    for token in _tokens(text):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _structured_content(schema_name: str, prompt: str) -> dict:
+    if schema_name == "RetrieveToken":
+        # Câu hỏi tiếp theo trong một session: dùng lại điều luật đã có
+        return {"decision": "continue" if "Earlier questions of this conversation" in prompt else "yes"}
+    if schema_name == "IsRelToken":
+        # ~70% chunk được đánh giá relevant, tất định theo nội dung
+        digest = hashlib.md5(prompt.encode("utf-8")).digest()
+        return {"score": "relevant" if digest[0] % 10 < 7 else "irrelevant"}
+    if schema_name == "IsSupToken":
+        return {"score": "fully supported"}
+    if schema_name == "IsUseToken":
+        return {"score": 5}
+    if schema_name == "SubQuestions":
+        # Tách theo " và " trong câu hỏi gốc (phần sau "Câu hỏi:" cuối cùng)
+        question = prompt.rsplit("Câu hỏi:", 1)[-1].strip()
+        return {"sub_questions": [part.strip() for part in question.split(" và ") if part.strip()]}
+    return {}
+
+
+def _flatten(messages) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(item.get("text", "") for item in content if isinstance(item, dict))
+    return "\n".join(parts)
+
+
+def _has_image(messages) -> bool:
+    return any(
+        isinstance(item, dict) and item.get("type") == "image_url"
+        for message in messages if isinstance(message.get("content"), list)
+        for item in message["content"]
+    )
+
+
+def create_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+               token_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="stub-llm")
+    stats = Counter()
+    lock = threading.Lock()
+
+    async def _delay():
+        delay = latency_ms + (random.uniform(0, jitter_ms) if jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _failed() -> bool:
+        """Lỗi 503 ngẫu nhiên với xác suất error_rate (kiểm tra retry/circuit breaker)"""
+        if error_rate and random.random() < error_rate:
+            with lock:
+                stats["errors"] += 1
+            return True
+        return False
+
+    def _completion(model: str, message: dict, prompt: str):
+        completion = message.get("content") or json.dumps(message.get("tool_calls", []))
+        return {
+            "id": f"chatcmpl-stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop", "logprobs": None}],
+            "usage": {
+                "prompt_tokens": len(_tokens(prompt)),
+                "completion_tokens": len(_tokens(completion)),
+                "total_tokens": len(_tokens(prompt)) + len(_tokens(completion)),
+            },
+        }
+
+    def _stream(model: str, content: str, prompt: str, include_usage: bool):
+        """SSE chat.completion.chunk, mỗi chunk một từ (kèm khoảng trắng phía trước)"""
+        completion_id = f"chatcmpl-stub-{time.time_ns()}"
+
+        def chunk(delta: dict, finish_reason=None, usage=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                       if usage is None else [], "usage": usage}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events():
+            try:
+                yield chunk({"role": "assistant", "content": ""})
+                for piece in re.findall(r"\s*\S+", content):
+                    if token_ms:
+                        await asyncio.sleep(token_ms / 1000)
+                    with lock:
+                        stats["stream_tokens"] += 1
+                    yield chunk({"content": piece})
+                yield chunk({}, finish_reason="stop")
+                if include_usage:
+                    yield chunk({}, usage={"prompt_tokens": len(_tokens(prompt)),
+                                           "completion_tokens": len(_tokens(content)),
+                                           "total_tokens": len(_tokens(prompt)) + len(_tokens(content))})
+                yield "data: [DONE]\n\n"
+            except (asyncio.CancelledError, GeneratorExit):
+                with lock:
+                    stats["stream_aborted"] += 1
+                raise
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = _flatten(messages)
+        await _delay()
+        if _failed():
+            return JSONResponse({"error": {"message": "stub: service unavailable"}}, status_code=503)
+
+        if _has_image(messages):
+            kind = "ocr"
+            message = {"role": "assistant", "content": STUB_OCR_MARKDOWN}
+        elif (body.get("response_format") or {}).get("type") == "json_schema":
+            schema_name = body["response_format"]["json_schema"]["name"]
+            kind = f"structured:{schema_name}"
+            content = json.dumps(_structured_content(schema_name, prompt))
+            message = {"role": "assistant", "content": content}
+        elif body.get("tools"):
+            function = body["tools"][0]["function"]["name"]
+            kind = f"tool:{function}"
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{time.time_ns()}",
+                    "type": "function",
+                    "function": {"name": function, "arguments": json.dumps(_structured_content(function, prompt))},
+                }],
+            }
+        else:
+            kind = "text"
+            message = {"role": "assistant", "content": STUB_ANSWER}
+
+        with lock:
+            stats["chat_completions"] += 1
+            stats[kind] += 1
+        if body.get("stream") and kind == "text":
+            return _stream(body.get("model", "stub"), message["content"], prompt,
+                           (body.get("stream_options") or {}).get("include_usage", False))
+        return _completion(body.get("model", "stub"), message, prompt)
+
+    @app.post("/v1/embeddings")
+    @app.post("/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await _delay()
+        if _failed():
+            return JSONResponse({"error": {"message": "stub: service unavailable"}}, status_code=503)
+        with lock:
+            stats["embeddings"] += 1
+            stats["embedded_texts"] += len(inputs)
+        return {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embed_text(str(text))}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.get("/stats")
+    def get_stats():
+        with lock:
+            return dict(stats)
+
+    @app.post("/stats/reset")
+    def reset_stats():
+        with lock:
+            stats.clear()
+        return {"status": "reset"}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible/DeepSeek server cho benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ mỗi lời gọi")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Độ trễ ngẫu nhiên cộng thêm")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ lời gọi trả về 503")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Độ trễ giữa các từ khi stream")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.token_ms),
+                host=args.host, port=args.port, log_level="warning")
@@ -1,64 +1,276 @@
 import os
+import re
 import glob
-from langchain_community.document_loaders import PyPDFLoader
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_qdrant import QdrantVectorStore
-from src.components.vectordb import get_embeddings
+from qdrant_client import models
+from src.components.dedup import dedup_chunks
+from src.components.hierarchy import build_sections
+from src.components.pdf_parser import load_pdf_pages
+from src.components.snapshot import create_snapshot, index_metadata, restore_if_needed
+from src.components.vectordb import get_client, get_embeddings
 from src.config import cfg
 from src.logger import logger
 
+ARTICLE_PATTERN = re.compile(r"(?m)^\s*Điều\s+(\d+)\s*[\.:]")
+CHAPTER_PATTERN = re.compile(r"(?m)^\s*Chương\s+([IVXLC]+)\b")
+
 def clean_text(text: str) -> str:
     """Clean text by removing invalid Unicode characters"""
     # Remove surrogate characters and invalid characters
     return text.encode('utf-8', 'ignore').decode('utf-8', 'ignore')
 
-def ingest_data():
+def load_documents(pdf_files, ocr_fallback=None, report=None, backend=None):
+    """
+    Load PDF files into page-level documents, parsed in parallel with the configured backend
+    (cfg.ingest.pdf_backend unless `backend` is given).
+    Scanned pages (no/low text layer) are OCR'd when ocr_fallback (default cfg.ingest.ocr_fallback);
+    OCR statistics are added to `report` if given.
+    """
+    documents = load_pdf_pages(pdf_files, backend=backend)
+    # Clean text in each document
+    for doc in documents:
+        doc.page_content = clean_text(doc.page_content)
+    stats = {"pages": len(documents)}
+    if cfg.ingest.ocr_fallback if ocr_fallback is None else ocr_fallback:
+        stats.update(ocr_sparse_pages(documents))
+    if report is not None:
+        report.update(stats)
+    return documents
+
+def is_sparse(text: str) -> bool:
+    """Page has no (or almost no) text layer"""
+    return len(re.sub(r"\s", "", text)) < cfg.ingest.min_page_chars
+
+def page_image(page):
+    """
+    Largest image of a PDF page as (bytes, mime type), or None.
+    Scanned pages are usually a single full-page JPEG, which is sent as-is; other encodings
+    are converted by pypdf (requires Pillow).
+    """
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    best, best_size = None, 0
+    for name, ref in (xobjects.get_object().items() if xobjects else []):
+        xobj = ref.get_object()
+        if xobj.get("/Subtype") != "/Image":
+            continue
+        size = int(xobj.get("/Width", 0)) * int(xobj.get("/Height", 0))
+        if size <= best_size:
+            continue
+        filters = xobj.get("/Filter")
+        filters = [filters] if isinstance(filters, str) else list(filters or [])
+        if filters == ["/DCTDecode"]:
+            best, best_size = (xobj._data, "image/jpeg"), size
+            continue
+        try:
+            image = page.images[name]
+            extension = os.path.splitext(image.name)[1].lower()
+            if extension in (".jpg", ".jpeg", ".png"):
+                data = image.data
+            else:
+                # JPEG 2000, TIFF (CCITT/JBIG2) -> PNG
+                import io
+
+                buffer = io.BytesIO()
+                image.image.save(buffer, format="PNG")
+                data, extension = buffer.getvalue(), ".png"
+        except Exception as e:
+            logger.warning(f"Cannot extract page image {name}: {e}")
+            continue
+        best, best_size = (data, "image/png" if extension == ".png" else "image/jpeg"), size
+    return best
+
+def ocr_sparse_pages(documents):
+    """
+    OCR (DeepSeek) pages whose text layer is empty or too short, concurrently.
+    Results are cached by page image hash (no TTL), so re-runs never repeat OCR.
+    """
+    from pypdf import PdfReader
+    from src.components.cache import get_cache
+    from src.components.ocr import request_ocr
+
+    sparse = [doc for doc in documents if is_sparse(doc.page_content)]
+    stats = {"ocr_pages": len(sparse), "ocr_cached": 0, "ocr_failed": 0, "ocr_no_image": 0, "ocr_seconds": 0.0}
+    if not sparse:
+        return stats
+    start = time.perf_counter()
+
+    readers, jobs = {}, []
+    for doc in sparse:
+        source = doc.metadata["source"]
+        if source not in readers:
+            readers[source] = PdfReader(source)
+        image = page_image(readers[source].pages[doc.metadata["page"]])
+        if image is None:
+            stats["ocr_no_image"] += 1
+            continue
+        data, mime = image
+        image_sha256 = hashlib.sha256(data).hexdigest()
+        key = hashlib.sha256(f"{cfg.deepseek.model}|{image_sha256}".encode("utf-8")).hexdigest()
+        jobs.append((doc, data, mime, image_sha256, key))
+
+    cache = get_cache("ingest_ocr")
+    cached = cache.get_many(job[4] for job in jobs)
+    stats["ocr_cached"] = sum(job[4] in cached for job in jobs)
+    # Identical page images (e.g. repeated cover pages) are OCR'd once
+    pending = list({job[4]: job for job in jobs if job[4] not in cached}.values())
+    logger.info(f"OCR fallback: {len(sparse)} scanned pages, {stats['ocr_cached']} cached, {len(pending)} to OCR")
+
+    def run(job):
+        doc, data, mime, image_sha256, key = job
+        try:
+            return key, request_ocr(image_sha256, image_bytes=data, mime_type=mime)
+        except Exception as e:
+            logger.error(f"OCR failed for {doc.metadata['source']} page {doc.metadata['page']}: {e}")
+            return key, None
+
+    results = {key: value.decode("utf-8") for key, value in cached.items()}
+    with ThreadPoolExecutor(max_workers=cfg.ingest.ocr_workers) as executor:
+        for key, text in executor.map(run, pending):
+            if text is None:
+                stats["ocr_failed"] += 1
+                continue
+            results[key] = text
+            cache.set(key, text.encode("utf-8"))
+
+    for doc, _, _, _, key in jobs:
+        if key in results:
+            doc.page_content = clean_text(results[key])
+            doc.metadata["ocr"] = True
+    stats["ocr_seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+def split_documents(documents, chunk_size=None, chunk_overlap=None):
+    """Split page-level documents into chunks"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or cfg.chunk_size,    # Example: 500
+        chunk_overlap=chunk_overlap if chunk_overlap is not None else cfg.chunk_overlap, # Example: 50
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return text_splitter.split_documents(documents)
+
+def annotate_structure(splits):
+    """
+    Gắn metadata cấu trúc văn bản luật cho từng chunk (theo thứ tự trong mỗi file):
+    - article: Điều đang hiệu lực tại đầu chunk
+    - articles: tất cả các Điều mà chunk bao phủ
+    - chapter: Chương đang hiệu lực tại đầu chunk
+    """
+    current = {}
+    for chunk in splits:
+        text = chunk.page_content
+        source = chunk.metadata.get("source")
+        article, chapter = current.get(source, (None, None))
+        headings = [int(n) for n in ARTICLE_PATTERN.findall(text)]
+        chapters = CHAPTER_PATTERN.findall(text)
+        starts_with_article = ARTICLE_PATTERN.match(text) is not None
+        starts_with_chapter = CHAPTER_PATTERN.match(text) is not None
+
+        if headings and (starts_with_article or article is None):
+            chunk.metadata["article"] = headings[0]
+        else:
+            chunk.metadata["article"] = article
+        covered = ([article] if article is not None and not starts_with_article else []) + headings
+        chunk.metadata["articles"] = list(dict.fromkeys(covered))
+        if chapters and (starts_with_chapter or chapter is None):
+            chunk.metadata["chapter"] = chapters[0]
+        else:
+            chunk.metadata["chapter"] = chapter
+
+        current[source] = (headings[-1] if headings else article, chapters[-1] if chapters else chapter)
+    return splits
+
+def deduplicate(splits, enabled=None, report=None):
+    """
+    Collapse near-duplicate chunks (boilerplate, quoted amendments) into one point listing all
+    source references in metadata["references"] (cfg.ingest.dedup unless `enabled` is given).
+    """
+    if not (cfg.ingest.dedup if enabled is None else enabled):
+        return splits
+    splits, stats = dedup_chunks(splits)
+    if report is not None:
+        report.update(stats)
+    logger.info(
+        f"Dedup: {stats['chunks_before']} -> {stats['chunks_after']} chunks (-{stats['shrink']:.1%}), "
+        f"{stats['duplicate_groups']} duplicate groups (largest {stats['largest_group']}, "
+        f"{stats['cross_source_groups']} across documents)"
+    )
+    return splits
+
+def index_documents(splits, embeddings=None, client=None, collection_name=None, batch_size=64, metadata=None):
+    """
+    Embed and index chunks into a Qdrant collection.
+    Note: the collection is deleted and recreated from scratch.
+    `metadata` (corpus hash, index config) is stored on the collection, see src/components/snapshot.py.
+    """
+    embeddings = embeddings or get_embeddings()
+    client = client or get_client()
+    collection_name = collection_name or cfg.qdrant.collection_name
+
+    vector_size = len(embeddings.embed_query("dimension probe"))
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+        **({"metadata": metadata} if metadata else {}),
+    )
+    vectorstore = QdrantVectorStore(client=client, collection_name=collection_name, embedding=embeddings)
+    vectorstore.add_documents(splits, batch_size=batch_size)
+    return vectorstore
+
+def ingest_data(pdf_files=None, snapshot=False):
     logger.info("Starting data ingestion process...")
-    
+
     # 1. Load PDF files from data/ directory
-    pdf_files = glob.glob("data/*.pdf")
+    pdf_files = pdf_files or sorted(glob.glob("data/*.pdf"))
     if not pdf_files:
         logger.error("No PDF files found in data/ directory")
         return
 
-    documents = []
     logger.info(f"Found {len(pdf_files)} PDF files")
-    
-    for file_path in pdf_files:
-        logger.info(f"Reading file: {file_path}")
-        loader = PyPDFLoader(file_path)
-        docs = loader.load()
-        # Clean text in each document
-        for doc in docs:
-            doc.page_content = clean_text(doc.page_content)
-        documents.extend(docs)
+    report = {}
+    documents = load_documents(pdf_files, report=report)
+    if report.get("ocr_pages"):
+        logger.info(
+            f"OCR fallback: {report['ocr_pages']}/{report['pages']} pages needed OCR "
+            f"({report['ocr_cached']} cached, {report['ocr_failed']} failed, {report['ocr_no_image']} without image) "
+            f"in {report['ocr_seconds']:.1f}s"
+        )
 
     # 2. Text chunking
     logger.info("Splitting documents into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=cfg.chunk_size,    # Example: 500
-        chunk_overlap=cfg.chunk_overlap, # Example: 50
-        separators=["\n\n", "\n", " ", ""]
-    )
-    splits = text_splitter.split_documents(documents)
+    splits = annotate_structure(split_documents(documents))
     logger.info(f"Created {len(splits)} chunks")
+    splits = deduplicate(splits, report=report)
 
     # 3. Embedding and indexing into Qdrant
     logger.info(f"Uploading to Qdrant collection: {cfg.qdrant.collection_name}...")
-    
-    url = f"http://{cfg.qdrant.host}:{cfg.qdrant.port}"
-    
-    # The from_documents function will automatically embed and upsert
-    QdrantVectorStore.from_documents(
-        documents=splits,
-        embedding=get_embeddings(),
-        url=url,
-        collection_name=cfg.qdrant.collection_name,
-        api_key=cfg.qdrant.api_key,
-        force_recreate=True # Note: True will delete old data and recreate from scratch
-    )
-    
+    metadata = index_metadata(pdf_files)
+    index_documents(splits, metadata=metadata)
+    logger.info(f"Index version: {metadata['index_version']}")
+    if cfg.hierarchy.enabled:
+        build_sections()
+
+    # 4. Versioned snapshot for new nodes (restored on startup without re-embedding)
+    if snapshot:
+        create_snapshot(pdf_files)
+
     logger.success("Completed! Data is ready")
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest data/*.pdf into Qdrant")
+    parser.add_argument("--snapshot", action="store_true", help="Create a versioned snapshot after ingesting")
+    parser.add_argument("--restore", action="store_true",
+                        help="Only restore the latest matching snapshot if the collection is missing or stale")
+    args = parser.parse_args()
+    if args.restore:
+        restore_if_needed()
+    else:
+        ingest_data(snapshot=args.snapshot)
@@ -1,13 +1,21 @@
 import uvicorn
-from src.config import cfg 
+from src.config import cfg
 
 if __name__ == "__main__":
     print(f"🚀 Starting server [{cfg.project_name}]...")
     print(f"🔗 Listening on http://{cfg.server.host}:{cfg.server.port}")
 
-    uvicorn.run(
-        "src.server.app:app",  # Path to the FastAPI app
-        host=cfg.server.host,  
-        port=cfg.server.port,  
-        reload=cfg.server.reload
-    )
\ No newline at end of file
+    if cfg.server.reload:
+        # Development: một process, tự reload khi code thay đổi
+        from src.components.snapshot import restore_on_startup
+        restore_on_startup()
+        uvicorn.run(
+            "src.server.app:app",  # Path to the FastAPI app
+            host=cfg.server.host,
+            port=cfg.server.port,
+            reload=cfg.server.reload
+        )
+    else:
+        # Production: nhiều worker pre-fork, graceful drain khi SIGTERM
+        from src.server.serve import serve
+        serve()
@@ -1,19 +1,64 @@
-from langchain.tools import tool
-from langchain.chat_models import init_chat_model
+import threading
+from dataclasses import asdict
+from functools import lru_cache
 from pydantic import BaseModel, Field
-from typing import Literal
-from langgraph.graph import StateGraph, START, END
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from typing import List, Literal, Optional
 from src.config import cfg
+from src.components.chain_cache import cached_runnable, prompt_of
+from src.components.metrics import track_chain
+from src.components.recorder import recorded_runnable
+from src.components.resilience import resilient_runnable
 from langchain_core.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
 
-llm_params = {
-    "model": cfg.llm.name,
-    "temperature": cfg.llm.temperature,
-}
+# LLM client và các chain được khởi tạo ở lần sử dụng đầu tiên (xem __getattr__ cuối file),
+# nên import module này không kéo theo langchain_openai/openai và không tạo client.
+
+def llm_settings(chain: Optional[str] = None) -> dict:
+    """Tham số ChatOpenAI của một chain: cfg.llm, ghi đè bởi các trường khác None trong cfg.llm.chains[chain]"""
+    settings = {
+        "model": cfg.llm.name,
+        "temperature": cfg.llm.temperature,
+        "base_url": cfg.llm.base_url,
+        "api_key": cfg.llm.api_key,
+        "max_tokens": cfg.llm.max_tokens,
+        "timeout": cfg.llm.timeout,
+        # Retry do src/components/resilience.py đảm nhận
+        "max_retries": 0 if cfg.resilience.enabled else 2,
+    }
+    if chain == "generator" and cfg.speculative.enabled:
+        # Stream để speculative generation bị bỏ có thể dừng giữa chừng (src/graph/nodes.py)
+        settings.update(streaming=True, stream_usage=True)
+    override = cfg.llm.chains.get(chain) if chain else None
+    if override is not None:
+        for key, value in asdict(override).items():
+            if value is not None:
+                settings["model" if key == "name" else key] = value
+    return settings
+
+
+@lru_cache(maxsize=None)
+def _create_llm(**settings):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(**settings)
+
+
+def get_llm(chain: Optional[str] = None):
+    """LLM client của một chain; các chain có cùng cấu hình dùng chung một client"""
+    return _create_llm(**llm_settings(chain))
 
-llm = ChatOpenAI(**llm_params)
+
+def build_chain(runnable, name: str):
+    """Gắn các lớp retry/hedge/circuit breaker, cache (cfg.cache.chains), record/replay và metrics cho một chain"""
+    settings = llm_settings(name)
+    provider = settings["base_url"] or "openai"
+    # Lấy prompt trước khi bọc: key của chain cache là prompt đã render
+    prompt = prompt_of(runnable)
+    runnable = resilient_runnable(runnable, name, provider, hedge=name in cfg.resilience.hedge_chains,
+                                  timeout=settings["timeout"])
+    # Cache hit không đi qua retry/hedge và không tính là LLM call
+    runnable = cached_runnable(runnable, name, settings, prompt=prompt)
+    return track_chain(recorded_runnable(runnable, name), name)
 
 
 # --- SCHEMAS (Định nghĩa Output) ---
@@ -38,18 +83,22 @@ class IsUseToken(BaseModel):
         ..., description="Score 1-5. 5 is best.", ge=1, le=5
     )
 
+class SubQuestions(BaseModel):
+    sub_questions: List[str] = Field(
+        ..., description="Self-contained sub-questions; a single item if the question is not compound."
+    )
+
 # --- CHAINS ---
 
 # 1. Router (Retrieve Token)
-structured_retrieve = llm.with_structured_output(RetrieveToken)
 
 examples = [
-    {"input": "Hi there", "output": "no"},
+    {"input": "Xin chào", "output": "no"},
     {"input": "Viết cho tôi một đoạn code Python tính tổng", "output": "no"},
-    {"input": "Self-RAG là gì?", "output": "yes"},
-    {"input": "Kiến trúc của AgentIAD hoạt động như thế nào?", "output": "yes"},
-    {"input": "Giải thích cơ chế Attention trong Transformer", "output": "no"}, # Kiến thức chung phổ biến
-    {"input": "So sánh Llama-2 và Llama-3", "output": "yes"}, # Cần thông tin cụ thể (spec)
+    {"input": "Thủ tục cấp giấy phép xây dựng nhà ở riêng lẻ gồm những gì?", "output": "yes"},
+    {"input": "Phạm nhân được gặp thân nhân mấy lần mỗi tháng?", "output": "yes"},
+    {"input": "Cảm ơn, câu trả lời rất hữu ích", "output": "no"},
+    {"input": "Hạn mức giao dịch tài khoản tiền di động mỗi tháng là bao nhiêu?", "output": "yes"}, # Cần tra văn bản cụ thể
 ]
 
 # 2. Tạo template cho ví dụ
@@ -69,19 +118,19 @@ few_shot_prompt = FewShotChatMessagePromptTemplate(
 # 4. Ghép vào prompt chính
 retrieve_prompt = ChatPromptTemplate.from_messages([
     ("system", 
-     """You are a retrieval router. Determine if the user's query requires looking up external information.
+     """You are a retrieval router for a Vietnamese legal assistant. Determine if the user's query requires looking up legal documents.
      
      - Use 'no' for general conversation, basic coding, or universal facts.
-     - Use 'yes' for specific entities, paper titles, acronyms (like AgentIAD), or domain-specific queries.
-     """),
+     - Use 'yes' for questions about laws, decrees, procedures, rights, obligations, penalties, or any legal situation.
+     - Use 'continue' only when earlier questions of the conversation are given and the new question is a follow-up
+       that the legal provisions already retrieved for them can answer (clarification, rephrasing, same topic).
+     {history}"""),
     few_shot_prompt, # Chèn ví dụ vào đây
     ("human", "{question}")
-])
+]).partial(history="")
 
-retrieve_router = retrieve_prompt | structured_retrieve
 
 # 2. Retrieval Grader (ISREL Token) - Tối ưu cho legal domain
-structured_isrel = llm.with_structured_output(IsRelToken)
 isrel_prompt = ChatPromptTemplate.from_messages([
     ("system", 
      """Bạn là chuyên gia đánh giá độ liên quan của điều luật. 
@@ -92,23 +141,18 @@ isrel_prompt = ChatPromptTemplate.from_messages([
      Hãy đánh giá một cách cẩn thận, vì điều luật có thể liên quan ngay cả khi không đề cập trực tiếp đến chủ đề."""),
     ("human", "Câu hỏi: {question} \n\nĐiều luật: {document}\n\nĐánh giá độ liên quan:"),
 ])
-retrieval_grader = isrel_prompt | structured_isrel
 
 # 3. Hallucination Grader (ISSUP Token)
-structured_issup = llm.with_structured_output(IsSupToken)
 issup_prompt = ChatPromptTemplate.from_messages([
     ("system", "Assess if generation is supported by facts (fully/partially/no support)."),
     ("human", "Question: {question} \n Facts: {documents} \n Generation: {generation}"),
 ])
-hallucination_grader = issup_prompt | structured_issup
 
 # 4. Answer Grader (ISUSE Token)
-structured_isuse = llm.with_structured_output(IsUseToken)
 isuse_prompt = ChatPromptTemplate.from_messages([
     ("system", "Rate utility 1-5."),
     ("human", "Question: {question} \n Answer: {generation}"),
 ])
-answer_grader = isuse_prompt | structured_isuse
 
 # 5. HyDE Generator (Hypothetical Document Embeddings)
 hyde_prompt = ChatPromptTemplate.from_messages([
@@ -121,7 +165,6 @@ hyde_prompt = ChatPromptTemplate.from_messages([
      Viết bằng tiếng Việt."""),
     ("human", "Câu hỏi: {question}"),
 ])
-hyde_generator = hyde_prompt | llm
 
 # 6. Legal Generator (Sinh câu trả lời với Chain-of-Thought reasoning)
 legal_gen_prompt = ChatPromptTemplate.from_messages([
@@ -149,7 +192,6 @@ legal_gen_prompt = ChatPromptTemplate.from_messages([
      
      Hãy phân tích và trả lời theo quy trình suy luận trên."""),
 ])
-generator = legal_gen_prompt | llm
 
 # 7. Query Rewriter (Tối ưu cho legal domain)
 rewrite_prompt = ChatPromptTemplate.from_messages([
@@ -165,4 +207,52 @@ rewrite_prompt = ChatPromptTemplate.from_messages([
      - Viết bằng tiếng Việt"""),
     ("human", "Câu hỏi gốc: {question}\n\nViết lại câu hỏi để tối ưu tìm kiếm:"),
 ])
-question_rewriter = rewrite_prompt | llm
\ No newline at end of file
+
+# 8. Question Decomposer (tách câu hỏi phức hợp, cfg.decompose)
+decompose_prompt = ChatPromptTemplate.from_messages([
+    ("system", 
+     """Bạn là chuyên gia tìm kiếm pháp lý. Nếu câu hỏi hỏi về nhiều văn bản, nhiều điều khoản hoặc nhiều vấn đề
+     pháp lý khác nhau, hãy tách thành tối đa {max_sub_questions} câu hỏi con, mỗi câu hỏi con:
+     - Tự đầy đủ ý nghĩa (nêu rõ số hiệu văn bản, điều khoản, chủ thể được hỏi)
+     - Chỉ cần tra cứu một nhóm điều luật
+     
+     Nếu câu hỏi chỉ hỏi một vấn đề, trả về đúng một câu hỏi con là câu hỏi gốc.
+     Viết bằng tiếng Việt."""),
+    ("human", "Câu hỏi: {question}"),
+])
+
+
+# --- LAZY CONSTRUCTION ---
+
+_CHAIN_BUILDERS = {
+    "retrieve_router": lambda: retrieve_prompt | get_llm("retrieve_router").with_structured_output(RetrieveToken),
+    "retrieval_grader": lambda: isrel_prompt | get_llm("retrieval_grader").with_structured_output(IsRelToken),
+    "hallucination_grader": lambda: issup_prompt | get_llm("hallucination_grader").with_structured_output(IsSupToken),
+    "answer_grader": lambda: isuse_prompt | get_llm("answer_grader").with_structured_output(IsUseToken),
+    "hyde_generator": lambda: hyde_prompt | get_llm("hyde_generator"),
+    "generator": lambda: legal_gen_prompt | get_llm("generator"),
+    "question_rewriter": lambda: rewrite_prompt | get_llm("question_rewriter"),
+    "question_decomposer": lambda: decompose_prompt | get_llm("question_decomposer").with_structured_output(SubQuestions),
+}
+CHAIN_NAMES = tuple(_CHAIN_BUILDERS)
+
+_build_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Khởi tạo chain (và LLM client) ở lần truy cập đầu tiên, sau đó cache vào module globals"""
+    if name == "llm":
+        return get_llm()
+    builder = _CHAIN_BUILDERS.get(name)
+    if builder is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _build_lock:
+        if name not in globals():
+            globals()[name] = build_chain(builder(), name)
+    return globals()[name]
+
+
+def warm_up():
+    """Khởi tạo trước toàn bộ chain (gọi trong FastAPI lifespan)"""
+    for name in CHAIN_NAMES:
+        __getattr__(name)
@@ -0,0 +1,135 @@
+"""
+Cache Module: key-value store bền vững trên SQLite (một file local, WAL mode) có TTL và
+giới hạn số entry theo LRU. Nhiều namespace (embedding, ocr, response) dùng chung một file và có
+thể được dùng đồng thời từ nhiều thread/process (các worker của src/server/serve.py).
+"""
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+from src.config import cfg
+from src.components.metrics import record_cache
+
+# Số lần ghi giữa hai lần kiểm tra giới hạn kích thước
+_EVICT_EVERY = 64
+
+
+class SqliteCache:
+    def __init__(self, path: str, namespace: str, max_entries: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache (namespace, accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Mỗi thread một connection (sqlite3 connection không chia sẻ được giữa các thread).
+        Connection mở trước khi fork không được dùng lại trong worker con.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found: Dict[str, bytes] = {}
+        conn = self._conn()
+        # SQLite giới hạn số tham số mỗi câu lệnh
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, value, created_at FROM cache WHERE namespace = ? AND key IN ({placeholders})",
+                [self.namespace, *batch],
+            ).fetchall()
+            for key, value, created_at in rows:
+                if not self._expired(created_at, now):
+                    found[key] = value
+        if found:
+            conn.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                [(now, self.namespace, key) for key in found],
+            )
+        for key in keys:
+            record_cache(self.namespace, key in found)
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            [(self.namespace, key, value, now, now) for key, value in items.items()],
+        )
+        self._writes += len(items)
+        if self._writes >= _EVICT_EVERY:
+            self._writes = 0
+            self.evict()
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def evict(self):
+        """Xoá entry hết hạn và các entry ít được truy cập nhất khi vượt max_entries"""
+        conn = self._conn()
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+                         (self.namespace, time.time() - self.ttl_seconds))
+        if self.max_entries is not None:
+            conn.execute(
+                """DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ?
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def get_cache(namespace: str, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None) -> SqliteCache:
+    """Cache dùng chung theo namespace, lưu tại cfg.cache.path"""
+    return SqliteCache(cfg.cache.path, namespace, max_entries=max_entries, ttl_seconds=ttl_seconds)
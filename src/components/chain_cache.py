@@ -0,0 +1,84 @@
+"""
+Chain Cache Module: memoize lời gọi LLM của các chain tất định (temperature 0) trong src/chains/modules.py.
+
+Router, ISREL grader, HyDE và query rewriter nhận lại cùng input rất thường xuyên (giữa các user, giữa các
+vòng rewrite). Kết quả được lưu trong SQLite cache dùng chung (namespace chain:<tên>, LRU theo
+cfg.cache.chain_max_entries) với key gồm model, version của chain (cfg.cache.chains.<tên>.version) và
+prompt đã render, nên đổi template hay model đều không dùng lại kết quả cũ.
+
+Hit/miss: rag_cache_requests_total{cache="chain:<tên>"} và cột cache_hit_rate của GET /metrics/chains.
+
+    python -m src.components.chain_cache --clear retrieval_grader
+"""
+import hashlib
+import json
+from typing import Optional
+
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from src.config import cfg
+from src.components.cache import SqliteCache, get_cache
+from src.components.recorder import decode, encode
+from src.logger import logger
+
+
+def chain_cache(name: str) -> SqliteCache:
+    settings = cfg.cache.chains[name]
+    return get_cache(f"chain:{name}", max_entries=cfg.cache.chain_max_entries, ttl_seconds=settings.ttl_seconds)
+
+
+def prompt_of(runnable) -> Optional[BasePromptTemplate]:
+    """Prompt template đầu tiên của một chain prompt | llm (None nếu không có)"""
+    prompt = getattr(runnable, "first", None)
+    return prompt if isinstance(prompt, BasePromptTemplate) else None
+
+
+def cached_runnable(runnable, name: str, llm: dict, prompt: Optional[BasePromptTemplate] = None):
+    """
+    Bọc chain (prompt | llm) bằng cache theo prompt đã render. `llm` là llm_settings(name).
+    `prompt` là prompt template của chain; mặc định lấy runnable.first, nên phải truyền vào khi runnable
+    đã được bọc (vd. bởi resilient_runnable), nếu không key chỉ gồm input thô và sửa template không làm
+    cache hết hiệu lực.
+    Trả về nguyên runnable khi chain không được bật trong cfg.cache.chains hoặc temperature > 0.
+    """
+    settings = cfg.cache.chains.get(name)
+    if runnable is None or settings is None or not settings.enabled:
+        return runnable
+    if llm["temperature"]:
+        logger.warning(f"Chain cache {name}: bỏ qua vì temperature={llm['temperature']} (không tất định)")
+        return runnable
+
+    cache = chain_cache(name)
+    prompt = prompt or prompt_of(runnable)
+    prefix = json.dumps([name, llm["base_url"], llm["model"], llm["max_tokens"], settings.version])
+
+    def _key(inputs) -> str:
+        rendered = prompt.invoke(inputs).to_string() if prompt else json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(f"{prefix}\x1f{rendered}".encode("utf-8")).hexdigest()
+
+    def _invoke(inputs, config):
+        key = _key(inputs)
+        cached = cache.get(key)
+        if cached is not None:
+            return decode(json.loads(cached))
+        output = runnable.invoke(inputs, config)
+        cache.set(key, json.dumps(encode(output), ensure_ascii=False).encode("utf-8"))
+        return output
+
+    return RunnableLambda(_invoke, name=name)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Số entry / xoá chain cache")
+    parser.add_argument("--clear", nargs="*", help="Xoá cache của các chain (không có tên = mọi chain)")
+    args = parser.parse_args()
+
+    for chain in args.clear or list(cfg.cache.chains):
+        if args.clear is not None:
+            chain_cache(chain).clear()
+            logger.info(f"Đã xoá chain cache {chain}")
+        else:
+            logger.info(f"{chain}: {len(chain_cache(chain))} entries")
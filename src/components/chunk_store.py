@@ -0,0 +1,127 @@
+"""
+Chunk Store Module: GraphState chỉ giữ tham chiếu chunk {"id", "score"} thay vì Document đầy đủ.
+
+Document được giữ một lần trong ChunkStore của request (contextvars, giống RequestStats của metrics):
+retrieve_node thêm vào store, các node sau resolve tham chiếu khi cần nội dung. Nhờ vậy state được copy
+giữa các bước và checkpoint của session chỉ chứa id + score.
+
+Tham chiếu không có trong store (vd. điều luật của lượt trước trong session, chạy ở request khác) được
+lấy lại từ Qdrant theo point id; chunk không lấy lại được là lỗi (ChunkNotFoundError), không bị bỏ qua
+trong im lặng (trừ khi replay, không có Qdrant).
+"""
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import cfg
+from src.logger import logger
+
+
+class ChunkNotFoundError(LookupError):
+    """Tham chiếu chunk không có trong store và không lấy lại được từ Qdrant"""
+
+
+class ChunkStore:
+    """Document theo chunk id của một request"""
+
+    def __init__(self):
+        self._chunks: Dict[str, Document] = {}
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def add(self, documents: Iterable[Document]) -> List[dict]:
+        """Lưu documents, trả về tham chiếu theo cùng thứ tự"""
+        refs = []
+        for doc in documents:
+            ref = chunk_ref(doc)
+            self._chunks.setdefault(ref["id"], doc)
+            refs.append(ref)
+        return refs
+
+    def pairs(self, refs: Iterable) -> List[Tuple[dict, Document]]:
+        """(tham chiếu, Document) theo thứ tự của refs"""
+        # Checkpoint cũ lưu Document đầy đủ thay vì tham chiếu
+        refs = [self.add([ref])[0] if isinstance(ref, Document) else ref for ref in refs or []]
+        missing = [ref["id"] for ref in refs if ref["id"] not in self._chunks]
+        if missing:
+            self._chunks.update(_fetch(missing))
+        return [(ref, self._chunks[ref["id"]]) for ref in refs if ref["id"] in self._chunks]
+
+    def resolve(self, refs: Iterable) -> List[Document]:
+        """Document của các tham chiếu"""
+        return [doc for _, doc in self.pairs(refs)]
+
+
+def chunk_id(doc: Document) -> str:
+    """Point id trong Qdrant; UUID theo nội dung (cùng định dạng point id) nếu document không đến từ Qdrant"""
+    point_id = doc.metadata.get("_id")
+    if point_id is not None:
+        return str(point_id)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"chunk|{doc.page_content}"))
+
+
+def chunk_ref(doc: Document) -> dict:
+    return {"id": chunk_id(doc), "score": doc.metadata.get("score")}
+
+
+def _point_id(value) -> str:
+    """Dạng so sánh của point id: Qdrant server nhận UUID dạng hex nhưng trả về dạng có gạch nối"""
+    value = str(value)
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        return value
+
+
+def _fetch(ids: List[str]) -> Dict[str, Document]:
+    """
+    Lấy lại chunk từ Qdrant theo point id, trả về {id như trong tham chiếu: Document};
+    ChunkNotFoundError nếu có id không còn trong collection
+    """
+    from src.components.recorder import get_recorder
+    from src.components.resilience import call
+    from src.components.vectordb import get_vectorstore
+
+    if get_recorder().replaying:
+        logger.warning(f"Replay: bỏ qua {len(ids)} chunk không có trong store (không có Qdrant)")
+        return {}
+    vectorstore = get_vectorstore()
+    points = call("qdrant", lambda: vectorstore.client.retrieve(
+        cfg.qdrant.collection_name, ids=ids, with_payload=True, with_vectors=False), name="qdrant_retrieve")
+    found = {_point_id(point.id): point for point in points}
+    missing = [point_id for point_id in ids if _point_id(point_id) not in found]
+    if missing:
+        raise ChunkNotFoundError(f"{len(missing)} chunk không còn trong {cfg.qdrant.collection_name}: "
+                                 f"{sorted(missing)[:5]}")
+    documents = {}
+    for point_id in ids:
+        payload = found[_point_id(point_id)].payload
+        documents[point_id] = Document(page_content=payload.get(vectorstore.content_payload_key, ""),
+                                       metadata={**(payload.get(vectorstore.metadata_payload_key) or {}),
+                                                 "_id": point_id, "_collection_name": cfg.qdrant.collection_name})
+    return documents
+
+
+_chunk_store: ContextVar[Optional[ChunkStore]] = ContextVar("chunk_store", default=None)
+
+
+@contextmanager
+def chunk_scope():
+    """Gắn ChunkStore vào context của một lần chạy graph (các node chạy ở thread pool dùng chung object)"""
+    store = ChunkStore()
+    token = _chunk_store.set(store)
+    try:
+        yield store
+    finally:
+        _chunk_store.reset(token)
+
+
+def get_chunk_store() -> ChunkStore:
+    """Store của request hiện tại; ngoài chunk_scope() trả về store tạm (chunk được lấy lại từ Qdrant)"""
+    # So sánh với None: store rỗng (đầu request) có len 0
+    store = _chunk_store.get()
+    return store if store is not None else ChunkStore()
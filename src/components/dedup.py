@@ -0,0 +1,115 @@
+"""
+Dedup Module: phát hiện chunk gần trùng khi ingest (MinHash + LSH).
+
+Văn bản luật/nghị định lặp lại nhiều đoạn khuôn mẫu (phần mở đầu, "Điều khoản thi hành", khối chữ ký,
+điều khoản sửa đổi được trích nguyên văn). Các chunk có độ tương đồng Jaccard (ước lượng bằng MinHash
+trên shingle từ) >= cfg.ingest.dedup_threshold được gộp vào chunk xuất hiện đầu tiên; chunk giữ lại
+liệt kê mọi nguồn trong metadata["references"].
+
+LSH chia chữ ký thành cfg.ingest.dedup_bands band để chỉ so sánh các cặp ứng viên thay vì mọi cặp;
+mỗi cặp ứng viên được xác nhận bằng Jaccard chính xác trước khi gộp (ước lượng MinHash có sai số).
+"""
+import random
+import re
+import zlib
+from collections import defaultdict
+from typing import List, Set, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import cfg
+
+_PRIME = (1 << 31) - 1
+_REFERENCE_KEYS = ("source", "page", "article", "articles", "chapter")
+
+
+def shingles(text: str, size: int = None) -> Set[int]:
+    """Hash của các n-gram từ (chữ thường, bỏ dấu câu)"""
+    size = size or cfg.ingest.dedup_shingle_size
+    tokens = re.findall(r"\w+", text.lower())
+    grams = [" ".join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))]
+    return {zlib.crc32(gram.encode("utf-8")) % _PRIME for gram in grams}
+
+
+def jaccard(a: str, b: str) -> float:
+    """Jaccard chính xác giữa shingle của hai đoạn text"""
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb) if sa or sb else 1.0
+
+
+def signatures(texts: List[str], num_perm: int = None):
+    """Chữ ký MinHash (len(texts) x num_perm) với các hàm băm (a*x + b) mod p cố định"""
+    import numpy as np
+
+    num_perm = num_perm or cfg.ingest.dedup_num_perm
+    rng = random.Random(1)
+    a = np.array([rng.randrange(1, _PRIME) for _ in range(num_perm)], dtype=np.uint64)[:, None]
+    b = np.array([rng.randrange(0, _PRIME) for _ in range(num_perm)], dtype=np.uint64)[:, None]
+    result = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        hashes = np.fromiter(shingles(text), dtype=np.uint64)
+        result[i] = ((a * hashes + b) % _PRIME).min(axis=1)
+    return result
+
+
+def find_duplicates(texts: List[str], threshold: float = None) -> List[int]:
+    """
+    Với mỗi text: chỉ số của text đại diện (xuất hiện trước, không phải bản sao) mà nó gần trùng,
+    hoặc chính nó. Gom nhóm kiểu star (so với đại diện) để không nối chuỗi A~B~C.
+    """
+    threshold = cfg.ingest.dedup_threshold if threshold is None else threshold
+    sigs = signatures(texts)
+    bands = cfg.ingest.dedup_bands
+    rows = sigs.shape[1] // bands
+    buckets = defaultdict(list)
+    owner = list(range(len(texts)))
+    for i in range(len(texts)):
+        candidates = set()
+        keys = [(band, sigs[i, band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        for key in keys:
+            candidates.update(buckets[key])
+        # Ứng viên là các đại diện trước đó; chọn đại diện giống nhất theo Jaccard chính xác vượt ngưỡng
+        best, best_score = None, threshold
+        for j in sorted(candidates):
+            score = jaccard(texts[i], texts[j])
+            if score >= best_score:
+                best, best_score = j, score
+        if best is not None:
+            owner[i] = best
+            continue
+        for key in keys:
+            buckets[key].append(i)
+    return owner
+
+
+def _reference(metadata: dict) -> dict:
+    return {key: metadata[key] for key in _REFERENCE_KEYS if metadata.get(key) is not None}
+
+
+def dedup_chunks(chunks: List[Document]) -> Tuple[List[Document], dict]:
+    """Gộp chunk gần trùng; trả về (chunk giữ lại, thống kê)"""
+    owner = find_duplicates([chunk.page_content for chunk in chunks])
+    groups = defaultdict(list)
+    for i, j in enumerate(owner):
+        groups[j].append(i)
+    kept = []
+    for i, chunk in enumerate(chunks):
+        if owner[i] != i:
+            continue
+        members = groups[i]
+        if len(members) > 1:
+            chunk.metadata["references"] = [_reference(chunks[m].metadata) for m in members]
+            chunk.metadata["duplicates"] = len(members) - 1
+        kept.append(chunk)
+    sizes = [len(members) for members in groups.values() if len(members) > 1]
+    stats = {
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept),
+        "shrink": round(1 - len(kept) / len(chunks), 4) if chunks else 0.0,
+        "duplicate_groups": len(sizes),
+        "largest_group": max(sizes, default=1),
+        "cross_source_groups": sum(
+            len({chunks[m].metadata.get("source") for m in members}) > 1
+            for members in groups.values() if len(members) > 1),
+    }
+    return kept, stats
@@ -0,0 +1,78 @@
+"""
+Document Index Module: chia tài liệu người dùng (Markdown sau OCR) theo heading, embed các section
+vào một index in-memory tạm thời và chỉ chọn các section liên quan đến câu hỏi. Kết quả được dùng
+cho cả query của retrieve_node lẫn prompt của generate_node thay vì cắt 500 ký tự đầu / dán toàn văn.
+
+Index được giữ theo nội dung tài liệu (sha256) trong một LRU nhỏ của process, nên các câu hỏi tiếp
+theo trong cùng session không phải embed lại; vector section cũng nằm trong embedding cache SQLite.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.documents import Document
+
+from src.config import cfg
+from src.components.vectordb import get_embeddings
+from src.logger import logger
+
+# langchain_core.vectorstores / langchain_text_splitters được import trong hàm để import module này nhẹ
+
+_HEADERS = [("#", "h1"), ("##", "h2"), ("###", "h3"), ("####", "h4")]
+
+_indexes: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def split_sections(document_context: str) -> List[Document]:
+    """Section theo heading Markdown; section dài hơn cfg.document.max_section_chars được chia nhỏ tiếp"""
+    from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+    sections = MarkdownHeaderTextSplitter(_HEADERS).split_text(document_context)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=cfg.document.max_section_chars, chunk_overlap=0)
+    chunks = splitter.split_documents(sections)
+    for position, chunk in enumerate(chunks):
+        chunk.metadata["position"] = position
+        # Mỗi đoạn (kể cả phần của một section bị chia nhỏ) mang đường dẫn heading để embedding và LLM biết ngữ cảnh
+        path = " > ".join(chunk.metadata[name] for _, name in _HEADERS if name in chunk.metadata)
+        if path:
+            chunk.page_content = f"[{path}]\n{chunk.page_content}"
+    return chunks
+
+
+def _get_index(document_context: str):
+    """(sections, InMemoryVectorStore) của tài liệu, tạo một lần cho mỗi nội dung tài liệu"""
+    key = hashlib.sha256(document_context.encode("utf-8")).hexdigest()
+    with _lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    from langchain_core.vectorstores import InMemoryVectorStore
+
+    sections = split_sections(document_context)
+    store = InMemoryVectorStore(get_embeddings())
+    store.add_documents(sections)
+    logger.info(f" -> Index tài liệu: {len(sections)} section")
+    with _lock:
+        _indexes[key] = (sections, store)
+        while len(_indexes) > cfg.document.max_indexes:
+            _indexes.popitem(last=False)
+    return sections, store
+
+
+def select_sections(question: str, document_context: str) -> str:
+    """
+    Các section của tài liệu liên quan nhất tới câu hỏi (giữ thứ tự trong tài liệu).
+    Tài liệu ngắn hơn cfg.document.full_text_chars được dùng nguyên văn, không cần embed.
+    """
+    if not document_context or len(document_context) <= cfg.document.full_text_chars:
+        return document_context or ""
+    sections, store = _get_index(document_context)
+    if len(sections) <= cfg.document.top_k:
+        return document_context
+    hits = store.similarity_search(question, k=cfg.document.top_k)
+    hits.sort(key=lambda d: d.metadata["position"])
+    logger.info(f" -> Chọn {len(hits)}/{len(sections)} section của tài liệu")
+    return "\n\n...\n\n".join(d.page_content for d in hits)
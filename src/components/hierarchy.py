@@ -0,0 +1,178 @@
+"""
+Hierarchy Module: retrieval hai tầng cho corpus lớn.
+
+Tìm phẳng trên mọi chunk của cfg.qdrant.collection_name chậm dần và nhiễu hơn khi corpus lớn lên. Ingest
+dựng thêm một tầng thô trong collection <collection><cfg.hierarchy.collection_suffix>: mỗi văn bản (source)
+và mỗi chương (source, chapter) có một vector tóm tắt = trung bình (đã chuẩn hoá) vector các chunk của nó,
+nên không tốn thêm lời gọi embedding.
+
+Khi cfg.hierarchy.enabled, retriever:
+1. chọn cfg.hierarchy.top_laws văn bản gần câu hỏi nhất,
+2. chọn cfg.hierarchy.top_chapters chương trong các văn bản đó,
+3. tìm chunk chỉ trong các chương đã chọn (payload filter theo metadata.source / metadata.chapter).
+
+Collection tầng thô chưa có (chưa dựng lại sau ingest/restore) -> tìm phẳng như cũ.
+
+    python -m src.components.hierarchy   # dựng lại tầng thô từ collection hiện có
+"""
+import uuid
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.components.resilience import call
+from src.components.retrievers import scored_documents, search_by_vector
+from src.config import cfg
+from src.logger import logger
+
+# qdrant_client và numpy được import trong hàm để import module này nhẹ
+
+Section = Tuple[str, Optional[str]]  # (source, chapter); chapter None = phần trước Chương đầu tiên
+
+
+def sections_collection(collection_name: Optional[str] = None) -> str:
+    return f"{collection_name or cfg.qdrant.collection_name}{cfg.hierarchy.collection_suffix}"
+
+
+def _section_id(level: str, source: str, chapter: Optional[str] = None) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{level}|{source}|{chapter or ''}"))
+
+
+def build_sections(client=None, collection_name: Optional[str] = None, batch_size: int = 512) -> dict:
+    """
+    Dựng (lại) collection tầng thô từ vector các chunk đã index; trả về thống kê.
+    Đồng thời tạo payload index cho metadata.source / metadata.chapter để filter ở tầng chunk nhanh.
+    """
+    import numpy as np
+    from qdrant_client import models
+
+    from src.components.vectordb import get_client
+
+    client = client or get_client()
+    collection_name = collection_name or cfg.qdrant.collection_name
+    target = sections_collection(collection_name)
+
+    sums, counts = {}, defaultdict(int)
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name, limit=batch_size, offset=offset,
+                                       with_payload=["metadata"], with_vectors=True)
+        for point in points:
+            metadata = (point.payload or {}).get("metadata") or {}
+            key = (metadata.get("source") or "", metadata.get("chapter"))
+            vector = np.asarray(point.vector, dtype=np.float32)
+            sums[key] = sums[key] + vector if key in sums else vector
+            counts[key] += 1
+        if offset is None:
+            break
+    if not sums:
+        raise ValueError(f"Collection {collection_name} không có chunk, chạy ingest trước")
+
+    laws, law_counts = {}, defaultdict(int)
+    for (source, chapter), vector in sums.items():
+        laws[source] = laws[source] + vector if source in laws else vector.copy()
+        law_counts[source] += counts[(source, chapter)]
+    entries = [("law", source, None, vector, law_counts[source]) for source, vector in laws.items()]
+    entries += [("chapter", source, chapter, vector, counts[(source, chapter)])
+                for (source, chapter), vector in sums.items()]
+
+    if client.collection_exists(target):
+        client.delete_collection(target)
+    client.create_collection(
+        collection_name=target,
+        vectors_config=models.VectorParams(size=len(next(iter(sums.values()))), distance=models.Distance.COSINE),
+    )
+    for start in range(0, len(entries), batch_size):
+        client.upsert(target, points=[
+            models.PointStruct(
+                id=_section_id(level, source, chapter),
+                vector=(vector / (np.linalg.norm(vector) or 1.0)).tolist(),
+                payload={"level": level, "source": source, "chapter": chapter, "chunks": chunks},
+            )
+            for level, source, chapter, vector, chunks in entries[start:start + batch_size]
+        ])
+    for key in ("level", "source"):
+        client.create_payload_index(target, key, models.PayloadSchemaType.KEYWORD)
+    for key in ("metadata.source", "metadata.chapter"):
+        client.create_payload_index(collection_name, key, models.PayloadSchemaType.KEYWORD)
+
+    stats = {"laws": len(laws), "chapters": len(sums), "chunks": sum(counts.values())}
+    logger.info(f"Tầng thô {target}: {stats['laws']} văn bản, {stats['chapters']} chương "
+                f"từ {stats['chunks']} chunk")
+    return stats
+
+
+def top_sections(client, vector: List[float], collection_name: Optional[str] = None,
+                 top_laws: Optional[int] = None, top_chapters: Optional[int] = None) -> List[Section]:
+    """Các chương (source, chapter) gần vector nhất, trong top_laws văn bản gần nhất"""
+    from qdrant_client import models
+
+    target = sections_collection(collection_name)
+    top_laws = cfg.hierarchy.top_laws if top_laws is None else top_laws
+    top_chapters = top_chapters or cfg.hierarchy.top_chapters
+
+    conditions = [models.FieldCondition(key="level", match=models.MatchValue(value="chapter"))]
+    if top_laws:
+        laws = client.query_points(
+            target, query=vector, limit=top_laws, with_payload=["source"],
+            query_filter=models.Filter(must=[models.FieldCondition(key="level", match=models.MatchValue(value="law"))]),
+        ).points
+        conditions.append(models.FieldCondition(
+            key="source", match=models.MatchAny(any=[point.payload["source"] for point in laws])))
+    chapters = client.query_points(target, query=vector, limit=top_chapters, with_payload=["source", "chapter"],
+                                   query_filter=models.Filter(must=conditions)).points
+    return [(point.payload["source"], point.payload.get("chapter")) for point in chapters]
+
+
+def sections_filter(sections: List[Section]):
+    """Payload filter của tầng chunk: chunk thuộc một trong các chương đã chọn"""
+    from qdrant_client import models
+
+    should = []
+    for source, chapter in sections:
+        chapter_condition = (
+            models.IsEmptyCondition(is_empty=models.PayloadField(key="metadata.chapter")) if chapter is None
+            else models.FieldCondition(key="metadata.chapter", match=models.MatchValue(value=chapter)))
+        should.append(models.Filter(must=[
+            models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source)),
+            chapter_condition,
+        ]))
+    return models.Filter(should=should)
+
+
+def search(client, vector: List[float], k: int, collection_name: Optional[str] = None, **kwargs):
+    """Retrieval hai tầng theo vector; trả về ScoredPoint của tầng chunk"""
+    collection_name = collection_name or cfg.qdrant.collection_name
+    sections = top_sections(client, vector, collection_name, **kwargs)
+    if not sections:
+        return []
+    return client.query_points(collection_name, query=vector, limit=k, with_payload=True,
+                               query_filter=sections_filter(sections)).points
+
+
+class HierarchicalRetriever(BaseRetriever):
+    """Retriever hai tầng trên QdrantVectorStore; Document giống ScoredRetriever (metadata["score"])"""
+
+    vectorstore: object
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        store = self.vectorstore
+        vector = store.embeddings.embed_query(query)
+        try:
+            sections = call("qdrant", lambda: top_sections(store.client, vector, store.collection_name),
+                            name="qdrant_sections", hedge=True, timeout=cfg.resilience.qdrant_timeout)
+        except Exception as e:
+            if store.client.collection_exists(sections_collection(store.collection_name)):
+                raise
+            logger.warning(f"Chưa có tầng thô ({e}), tìm phẳng: python -m src.components.hierarchy")
+            sections = []
+        return scored_documents(search_by_vector(
+            store, vector, self.k, filter=sections_filter(sections) if sections else None))
+
+
+if __name__ == "__main__":
+    build_sections()
@@ -0,0 +1,622 @@
+"""
+Metrics Module: registry tương thích Prometheus (text exposition format) và lớp instrumentation
+dựa trên LangChain callbacks cho graph nodes, chains, LLM calls, Qdrant search và caches.
+
+Registry nằm trong bộ nhớ của từng process. Khi server chạy nhiều worker (src/server/serve.py), mỗi worker
+ghi snapshot registry vào một thư mục chung theo chu kỳ; /metrics gộp số liệu hiện tại của worker nhận
+scrape với snapshot mới nhất của các worker khác (enable_multiprocess, current_registry).
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: cần labels {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def labelsets(self) -> list:
+        """Các tổ hợp label đã có giá trị (dùng cho báo cáo nội bộ)"""
+        with self._lock:
+            return [dict(zip(self.labelnames, key)) for key in self._values]
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def _dump(self) -> list:
+        """Giá trị của mọi series dạng [[label values], value] (snapshot của worker)"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def _merge(self, values: list, live: bool):
+        """Cộng snapshot của một worker vào metric; live = worker còn chạy"""
+        raise NotImplementedError
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _empty(self) -> "_Metric":
+        """Metric cùng tên, labels, cấu hình nhưng chưa có giá trị"""
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._lock = threading.Lock()
+        clone._values = {}
+        return clone
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def _merge(self, values: list, live: bool):
+        # Counter của worker đã thoát vẫn được cộng (không giảm khi worker khởi động lại)
+        for key, value in values:
+            key = tuple(key)
+            self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(_Metric):
+    """multiprocess: cách gộp giá trị của các worker còn chạy, sum (mặc định) hoặc max"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), multiprocess: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess = multiprocess
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+    def _merge(self, values: list, live: bool):
+        # Gauge của worker đã thoát (vd. request đang xử lý) không còn ý nghĩa
+        if not live:
+            return
+        for key, value in values:
+            key = tuple(key)
+            current = self._values.get(key)
+            if current is None:
+                self._values[key] = value
+            else:
+                self._values[key] = max(current, value) if self.multiprocess == "max" else current + value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self, **labels) -> Optional[dict]:
+        """Trả về {sum, count} của một series (dùng cho báo cáo nội bộ)"""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return None
+        return {"sum": state["sum"], "count": state["count"]}
+
+    def _samples(self):
+        for key, state in self._values.items():
+            for bound, count in zip(self.buckets, state["buckets"]):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state['sum'])}"
+            yield f"{self.name}_count{labels} {state['count']}"
+
+    def _dump(self) -> list:
+        with self._lock:
+            return [[list(key), {"buckets": list(state["buckets"]), "sum": state["sum"], "count": state["count"]}]
+                    for key, state in self._values.items()]
+
+    def _merge(self, values: list, live: bool):
+        for key, other in values:
+            key = tuple(key)
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            state["buckets"] = [a + b for a, b in zip(state["buckets"], other["buckets"])]
+            state["sum"] += other["sum"]
+            state["count"] += other["count"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} đã được đăng ký")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> _Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+    def dump(self) -> dict:
+        return {name: metric._dump() for name, metric in self._metrics.items()}
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def merged(self, snapshots: Iterable[Tuple[dict, bool]]) -> "Registry":
+        """Registry mới gồm số liệu hiện tại và các snapshot (dump(), worker còn chạy) của worker khác"""
+        registry = Registry()
+        for name, metric in self._metrics.items():
+            merged = registry.register(metric._empty())
+            merged._merge(metric._dump(), live=True)
+            for values, live in snapshots:
+                merged._merge(values.get(name, []), live)
+        return registry
+
+
+REGISTRY = Registry()
+
+# --- METRICS ---
+
+NODE_LATENCY = REGISTRY.register(Histogram(
+    "rag_node_latency_seconds", "Thời gian thực thi mỗi LangGraph node", ["node"]))
+CHAIN_LATENCY = REGISTRY.register(Histogram(
+    "rag_chain_latency_seconds", "Thời gian thực thi mỗi chain (bao gồm OCR)", ["chain"]))
+CHAIN_ERRORS = REGISTRY.register(Counter(
+    "rag_chain_errors_total", "Số lần chain/node thất bại", ["chain"]))
+LLM_CALLS = REGISTRY.register(Counter(
+    "rag_llm_calls_total", "Số lần gọi LLM theo chain", ["chain"]))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_tokens_total", "Số token prompt/completion theo chain", ["chain", "type"]))
+SEARCH_LATENCY = REGISTRY.register(Histogram(
+    "rag_qdrant_search_latency_seconds", "Thời gian truy vấn Qdrant (gồm embedding câu truy vấn)"))
+REQUEST_LOOPS = REGISTRY.register(Histogram(
+    "rag_request_loop_iterations", "Số vòng transform_query -> retrieve mỗi request", buckets=COUNT_BUCKETS))
+REQUEST_LLM_CALLS = REGISTRY.register(Histogram(
+    "rag_request_llm_calls", "Số lần gọi LLM mỗi request", buckets=COUNT_BUCKETS))
+HTTP_INFLIGHT = REGISTRY.register(Gauge(
+    "rag_http_inflight_requests", "Số HTTP request đang xử lý", ["path"]))
+GRAPH_INFLIGHT = REGISTRY.register(Gauge(
+    "rag_graph_inflight_runs", "Số lần chạy graph đang thực thi"))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "rag_http_request_latency_seconds", "Thời gian xử lý HTTP request", ["path", "status"]))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "rag_cache_requests_total", "Số lần tra cứu cache theo kết quả hit/miss", ["cache", "result"]))
+ROUTER_DECISIONS = REGISTRY.register(Counter(
+    "rag_router_decisions_total", "Quyết định retrieve theo nguồn (session, context, keyword, local, llm)",
+    ["source", "decision"]))
+
+SPECULATIVE_RUNS = REGISTRY.register(Counter(
+    "rag_speculative_generations_total",
+    "Speculative generation song song với grade theo kết quả (hit, miss, empty, error)", ["result"]))
+SPECULATIVE_SAVED = REGISTRY.register(Histogram(
+    "rag_speculative_saved_seconds", "Thời gian tiết kiệm trên critical path khi speculative generation hit"))
+SPECULATIVE_WASTED = REGISTRY.register(Histogram(
+    "rag_speculative_wasted_seconds", "Thời gian generator chạy cho speculative generation bị bỏ (miss, empty)"))
+SPECULATIVE_WASTED_TOKENS = REGISTRY.register(Counter(
+    "rag_speculative_wasted_tokens_total", "Token đã sinh (stream) của speculative generation bị bỏ"))
+ISREL_VERDICTS = REGISTRY.register(Counter(
+    "rag_isrel_verdicts_total",
+    "Verdict ISREL theo nguồn: graded (gọi grader), reused (từ candidate pool), skipped (dừng sớm)", ["source"]))
+COALESCED = REGISTRY.register(Counter(
+    "rag_coalesced_requests_total",
+    "Số request/lời gọi trùng nhau chờ chung một lần thực thi đang chạy (chat, ocr, embedding)", ["scope"]))
+REFLECTION_DECISIONS = REGISTRY.register(Counter(
+    "rag_reflection_decisions_total",
+    "Quyết định chạy ISSUP/ISUSE theo chính sách reflection (check, skip, sample)", ["check", "action"]))
+DECOMPOSITIONS = REGISTRY.register(Counter(
+    "rag_question_decompositions_total", "Kết quả tách câu hỏi (single, split, error)", ["result"]))
+
+RETRIES = REGISTRY.register(Counter(
+    "rag_retries_total", "Số lần retry lời gọi ra ngoài sau lỗi tạm thời", ["provider"]))
+HEDGES = REGISTRY.register(Counter(
+    "rag_hedged_requests_total", "Hedged request đã gửi (sent) và số lần bản hedge về trước (won)",
+    ["provider", "result"]))
+BREAKER_TRIPS = REGISTRY.register(Counter(
+    "rag_circuit_breaker_trips_total", "Số lần circuit breaker chuyển sang mở", ["provider"]))
+BREAKER_REJECTIONS = REGISTRY.register(Counter(
+    "rag_circuit_breaker_rejections_total", "Số lời gọi bị từ chối khi circuit breaker mở", ["provider"]))
+BREAKER_OPEN = REGISTRY.register(Gauge(
+    "rag_circuit_breaker_open", "1 nếu circuit breaker của provider đang mở (ở ít nhất một worker)",
+    ["provider"], multiprocess="max"))
+
+
+def record_cache(cache: str, hit: bool):
+    """Ghi nhận một lần tra cứu cache"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def observe_latency(histogram: Histogram, **labels):
+    """Context manager đo thời gian thực thi và ghi vào histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator tương ứng với observe_latency"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe_latency(histogram, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- PER-REQUEST STATS ---
+
+@dataclass
+class RequestStats:
+    llm_calls: int = 0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def track_request():
+    """
+    Gắn RequestStats vào context của request hiện tại.
+    Callback handler cộng dồn số LLM call vào object này; khi kết thúc sẽ ghi vào histogram.
+    """
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    GRAPH_INFLIGHT.inc()
+    try:
+        yield stats
+    finally:
+        GRAPH_INFLIGHT.dec()
+        _request_stats.reset(token)
+        REQUEST_LLM_CALLS.observe(stats.llm_calls)
+
+
+def record_loop_iterations(count: int):
+    REQUEST_LOOPS.observe(count)
+
+
+# --- CALLBACK HANDLER ---
+
+TRACKED_CHAINS = set()
+
+
+def track_chain(runnable, name: str):
+    """Đặt run_name cho chain để callback handler đo latency/token theo tên chain"""
+    TRACKED_CHAINS.add(name)
+    return runnable.with_config(run_name=name)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback handler gắn vào lần invoke graph. Nhờ callbacks được truyền xuống các runnable con,
+    handler nhận được sự kiện của mọi node, mọi chain có run_name, mọi LLM call và retriever.
+    """
+
+    # Chạy inline để giữ nguyên context (RequestStats) của request
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # run_id -> (kind, name, start_time, parent_run_id)
+        self._runs: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, kind: Optional[str], name: Optional[str], parent_run_id: Optional[UUID]):
+        with self._lock:
+            self._runs[run_id] = (kind, name, time.perf_counter(), parent_run_id)
+
+    def _finish(self, run_id: UUID, error: bool = False):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        kind, name, start, _ = run
+        elapsed = time.perf_counter() - start
+        if kind == "node":
+            NODE_LATENCY.observe(elapsed, node=name)
+        elif kind == "chain":
+            CHAIN_LATENCY.observe(elapsed, chain=name)
+        elif kind == "retriever":
+            SEARCH_LATENCY.observe(elapsed)
+        if error and kind in ("node", "chain"):
+            CHAIN_ERRORS.inc(chain=name)
+
+    def _owner_chain(self, run_id: Optional[UUID]) -> str:
+        """Tìm chain có tên gần nhất phía trên một LLM run"""
+        with self._lock:
+            while run_id is not None:
+                run = self._runs.get(run_id)
+                if run is None:
+                    break
+                kind, name, _, parent = run
+                if kind == "chain":
+                    return name
+                run_id = parent
+        return "unknown"
+
+    # Chains & nodes
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        if name in TRACKED_CHAINS:
+            kind = "chain"
+        elif metadata and name == metadata.get("langgraph_node"):
+            kind = "node"
+        else:
+            kind = None
+        self._start(run_id, kind, name, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # Lời gọi bị chủ động dừng (speculative generation bị bỏ) không tính là lỗi
+        self._finish(run_id, error=not getattr(error, "cancelled", False))
+
+    # LLM calls
+    def _on_llm_start(self, run_id, parent_run_id):
+        chain = self._owner_chain(parent_run_id)
+        self._start(run_id, "llm", chain, parent_run_id)
+        LLM_CALLS.inc(chain=chain)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.llm_calls += 1
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._on_llm_start(run_id, parent_run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._on_llm_start(run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        chain = run[1] if run else "unknown"
+        prompt_tokens, completion_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not prompt_tokens and not completion_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        LLM_TOKENS.inc(prompt_tokens, chain=chain, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, chain=chain, type="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if not getattr(error, "cancelled", False):
+            CHAIN_ERRORS.inc(chain=f"llm:{run[1] if run else 'unknown'}")
+
+    # Retriever (Qdrant)
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "retriever", "qdrant", parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=True)
+
+
+metrics_callback = MetricsCallbackHandler()
+
+
+# --- REPORT ---
+
+def chain_report(registry: Optional[Registry] = None) -> list:
+    """
+    Latency và token theo chain kể từ khi server khởi động (mọi worker), sắp xếp theo tổng latency giảm dần,
+    kèm tỉ trọng của từng chain để thấy chain nào nên chuyển sang model nhỏ/nhanh hơn.
+    """
+    registry = registry or current_registry()
+    chain_latency, llm_calls = registry.get(CHAIN_LATENCY.name), registry.get(LLM_CALLS.name)
+    llm_tokens, cache_requests = registry.get(LLM_TOKENS.name), registry.get(CACHE_REQUESTS.name)
+    chains = {labels["chain"] for labels in chain_latency.labelsets()}
+    chains |= {labels["chain"] for labels in llm_calls.labelsets()}
+    rows = []
+    for chain in chains:
+        latency = chain_latency.snapshot(chain=chain) or {"sum": 0.0, "count": 0}
+        prompt_tokens = llm_tokens.value(chain=chain, type="prompt")
+        completion_tokens = llm_tokens.value(chain=chain, type="completion")
+        cache_hits = cache_requests.value(cache=f"chain:{chain}", result="hit")
+        cache_lookups = cache_hits + cache_requests.value(cache=f"chain:{chain}", result="miss")
+        rows.append({
+            "chain": chain,
+            "runs": latency["count"],
+            "latency_total_s": round(latency["sum"], 3),
+            "latency_mean_ms": round(latency["sum"] / latency["count"] * 1000, 1) if latency["count"] else 0.0,
+            "llm_calls": int(llm_calls.value(chain=chain)),
+            "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens),
+            # Chain cache (cfg.cache.chains): tỉ lệ lời gọi không phải gửi tới provider
+            "cache_hits": int(cache_hits),
+            "cache_hit_rate": round(cache_hits / cache_lookups, 4) if cache_lookups else None,
+        })
+    total_latency = sum(row["latency_total_s"] for row in rows) or 1.0
+    total_tokens = sum(row["prompt_tokens"] + row["completion_tokens"] for row in rows) or 1
+    for row in rows:
+        row["latency_share"] = round(row["latency_total_s"] / total_latency, 4)
+        row["token_share"] = round((row["prompt_tokens"] + row["completion_tokens"]) / total_tokens, 4)
+    return sorted(rows, key=lambda row: row["latency_total_s"], reverse=True)
+
+
+def render_metrics() -> str:
+    return current_registry().render()
+
+
+# --- MULTIPROCESS ---
+
+_multiprocess_dir: Optional[str] = None
+
+
+def enable_multiprocess(directory: str):
+    """
+    Gọi trong master trước khi fork các worker: worker ghi snapshot vào `directory` (<pid>.json), /metrics của
+    worker bất kỳ gộp snapshot của mọi worker. Snapshot cũ (lần chạy trước) bị xoá.
+    """
+    global _multiprocess_dir
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, name))
+    _multiprocess_dir = directory
+
+
+def write_snapshot():
+    """Ghi snapshot registry của process hiện tại (file tạm rồi os.replace, người đọc không thấy file dở)"""
+    if _multiprocess_dir is None:
+        return
+    path = os.path.join(_multiprocess_dir, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(REGISTRY.dump(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def reset_after_fork():
+    """
+    Chạy trong worker ngay sau khi fork: xoá số liệu copy từ master. Master đã ghi snapshot của mình trước
+    khi fork, nếu không chúng bị cộng một lần cho mỗi worker.
+    """
+    if _multiprocess_dir is not None:
+        REGISTRY.reset()
+
+
+def start_snapshot_writer(interval: float):
+    """Chạy trong worker sau khi fork: ghi snapshot mỗi `interval` giây trên một thread daemon"""
+    if _multiprocess_dir is None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError:
+                pass  # Thử lại ở chu kỳ sau
+
+    threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def current_registry() -> Registry:
+    """
+    Registry của process; khi chạy nhiều worker là bản gộp với snapshot mới nhất của các worker khác
+    (trễ tối đa một chu kỳ ghi snapshot).
+    """
+    if _multiprocess_dir is None:
+        return REGISTRY
+    snapshots = []
+    for name in os.listdir(_multiprocess_dir):
+        if not name.endswith(".json") or name == f"{os.getpid()}.json":
+            continue
+        try:
+            with open(os.path.join(_multiprocess_dir, name), encoding="utf-8") as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            continue
+        snapshots.append((values, _alive(int(name[:-len(".json")]))))
+    return REGISTRY.merged(snapshots)
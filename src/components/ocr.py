@@ -3,11 +3,20 @@ OCR Module sử dụng DeepSeek API để trích xuất văn bản và cấu tr
 Xuất ra định dạng Markdown để bảo toàn cấu trúc phân cấp và bảng biểu.
 """
 import base64
+import hashlib
+import json
 import requests
-from typing import Optional
+from typing import Iterator, Optional
 from src.config import cfg
+from src.components.cache import get_cache
+from src.components.metrics import CHAIN_LATENCY, timed
+from src.components.recorder import recorded
+from src.components.resilience import call
+from src.components.singleflight import SingleFlight
 from src.logger import logger
 
+_ocr_flights = SingleFlight("ocr")
+
 
 def encode_image_to_base64(image_path: str) -> str:
     """Chuyển đổi ảnh thành base64 string"""
@@ -20,6 +29,79 @@ def encode_image_bytes_to_base64(image_bytes: bytes) -> str:
     return base64.b64encode(image_bytes).decode('utf-8')
 
 
+# Prompt được tinh chỉnh để xuất Markdown với cấu trúc
+OCR_PROMPT = """Bạn là một hệ thống OCR chuyên nghiệp. Nhiệm vụ của bạn là trích xuất văn bản từ ảnh tài liệu pháp lý tiếng Việt.
+
+Yêu cầu:
+1. Trích xuất CHÍNH XÁC tất cả văn bản trong ảnh
+2. Bảo toàn cấu trúc phân cấp của tài liệu:
+   - Sử dụng # cho tiêu đề chính
+   - Sử dụng ## cho tiêu đề phụ
+   - Sử dụng ### cho tiêu đề nhỏ hơn
+3. Bảo toàn định dạng bảng biểu:
+   - Sử dụng Markdown table syntax (| cột1 | cột2 |)
+   - Giữ nguyên số hàng và cột
+4. Giữ nguyên số thứ tự, điều khoản, khoản, điểm
+5. Không thêm thông tin không có trong ảnh
+6. Giữ nguyên định dạng ngày tháng, số tiền, địa chỉ
+
+Xuất ra định dạng Markdown hoàn chỉnh."""
+
+# Bội số của 3 để base64 của từng đoạn nối lại đúng bằng base64 của cả ảnh
+_CHUNK_SIZE = 3 * 256 * 1024
+_IMAGE_PLACEHOLDER = "__IMAGE_DATA__"
+
+
+def iter_image_chunks(image_path: Optional[str] = None, image_bytes: Optional[bytes] = None) -> Iterator[bytes]:
+    """Đọc ảnh theo từng đoạn (từ file hoặc bytes) mà không tạo bản sao toàn bộ ảnh"""
+    if image_path:
+        with open(image_path, "rb") as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                yield chunk
+    else:
+        view = memoryview(image_bytes)
+        for start in range(0, len(view), _CHUNK_SIZE):
+            yield view[start:start + _CHUNK_SIZE]
+
+
+def build_request_body(image_path: Optional[str] = None, image_bytes: Optional[bytes] = None,
+                       mime_type: str = "image/jpeg") -> bytearray:
+    """
+    JSON body của request OCR. Ảnh được base64 từng đoạn thẳng vào buffer của body, nên chỉ có
+    một bản base64 của ảnh trong bộ nhớ (không qua str base64 và json.dumps của cả payload).
+    """
+    payload = {
+        "model": cfg.deepseek.model,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": OCR_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": _IMAGE_PLACEHOLDER
+                        }
+                    }
+                ]
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4000
+    }
+    head, tail = json.dumps(payload).encode("utf-8").split(_IMAGE_PLACEHOLDER.encode("ascii"))
+    body = bytearray(head)
+    body += f"data:{mime_type};base64,".encode("ascii")
+    for chunk in iter_image_chunks(image_path, image_bytes):
+        body += base64.b64encode(chunk)
+    body += tail
+    return body
+
+
+@timed(CHAIN_LATENCY, chain="ocr")
 def extract_text_with_deepseek(
     image_path: Optional[str] = None,
     image_bytes: Optional[bytes] = None,
@@ -30,41 +112,51 @@ def extract_text_with_deepseek(
     Prompt được tinh chỉnh để xuất ra định dạng Markdown.
     
     Args:
-        image_path: Đường dẫn đến file ảnh
+        image_path: Đường dẫn đến file ảnh (ưu tiên dùng, ảnh được đọc theo từng đoạn)
         image_bytes: Bytes của ảnh
-        image_base64: Base64 string của ảnh (nếu đã encode sẵn)
+        image_base64: Base64 string của ảnh (giữ tương thích, được decode về bytes)
     
     Returns:
         Văn bản đã trích xuất ở định dạng Markdown
     """
-    # Xác định base64 image
     if image_base64:
-        base64_image = image_base64
-    elif image_bytes:
-        base64_image = encode_image_bytes_to_base64(image_bytes)
-    elif image_path:
-        base64_image = encode_image_to_base64(image_path)
-    else:
+        image_path, image_bytes = None, base64.b64decode(image_base64)
+    elif not image_bytes and not image_path:
         raise ValueError("Phải cung cấp ít nhất một trong: image_path, image_bytes, hoặc image_base64")
-    
-    # Prompt được tinh chỉnh để xuất Markdown với cấu trúc
-    ocr_prompt = """Bạn là một hệ thống OCR chuyên nghiệp. Nhiệm vụ của bạn là trích xuất văn bản từ ảnh tài liệu pháp lý tiếng Việt.
+    if image_bytes:
+        image_path = None
 
-Yêu cầu:
-1. Trích xuất CHÍNH XÁC tất cả văn bản trong ảnh
-2. Bảo toàn cấu trúc phân cấp của tài liệu:
-   - Sử dụng # cho tiêu đề chính
-   - Sử dụng ## cho tiêu đề phụ
-   - Sử dụng ### cho tiêu đề nhỏ hơn
-3. Bảo toàn định dạng bảng biểu:
-   - Sử dụng Markdown table syntax (| cột1 | cột2 |)
-   - Giữ nguyên số hàng và cột
-4. Giữ nguyên số thứ tự, điều khoản, khoản, điểm
-5. Không thêm thông tin không có trong ảnh
-6. Giữ nguyên định dạng ngày tháng, số tiền, địa chỉ
+    digest = hashlib.sha256()
+    for chunk in iter_image_chunks(image_path, image_bytes):
+        digest.update(chunk)
+    image_sha256 = digest.hexdigest()
+
+    # Cache dùng chung giữa các worker: cùng ảnh + cùng model -> cùng kết quả OCR
+    cache, cache_key = None, None
+    if cfg.cache.ocr:
+        cache = get_cache("ocr", ttl_seconds=cfg.cache.ocr_ttl_seconds)
+        cache_key = hashlib.sha256(f"{cfg.deepseek.model}|{image_sha256}".encode("utf-8")).hexdigest()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("OCR cache hit")
+            return cached.decode("utf-8")
+
+    def ocr() -> str:
+        extracted_text = request_ocr(image_sha256, image_path=image_path, image_bytes=image_bytes)
+        if cache is not None:
+            cache.set(cache_key, extracted_text.encode("utf-8"))
+        return extracted_text
+
+    # Cùng ảnh đang được OCR ở thread khác (request trùng nhau): chờ kết quả thay vì gọi API lần nữa
+    if cfg.coalesce.ocr:
+        return _ocr_flights.do(f"{cfg.deepseek.model}|{image_sha256}", ocr)
+    return ocr()
 
-Xuất ra định dạng Markdown hoàn chỉnh."""
 
+@recorded("ocr", "deepseek_ocr", inputs=lambda image_sha256, **_: {"image_sha256": image_sha256})
+def request_ocr(image_sha256: str, image_path: Optional[str] = None, image_bytes: Optional[bytes] = None,
+                mime_type: str = "image/jpeg") -> str:
+    """Gọi DeepSeek Vision API (record/replay theo sha256 của ảnh)"""
     try:
         # Gọi DeepSeek Vision API
         # Note: DeepSeek có thể sử dụng OpenAI-compatible API
@@ -79,39 +171,21 @@ Xuất ra định dạng Markdown hoàn chỉnh."""
             "Content-Type": "application/json"
         }
         
-        payload = {
-            "model": cfg.deepseek.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": ocr_prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 4000
-        }
-        
+        body = build_request_body(image_path, image_bytes, mime_type)
+
+        def post():
+            response = requests.post(
+                f"{base_url}/v1/chat/completions",
+                headers=headers,
+                data=body,
+                timeout=cfg.resilience.ocr_timeout
+            )
+            response.raise_for_status()
+            return response
+
         logger.info("Đang gọi DeepSeek OCR API...")
-        response = requests.post(
-            f"{base_url}/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        
-        response.raise_for_status()
-        result = response.json()
+        # Retry lỗi tạm thời (timeout, 429, 5xx); OCR tốn kém nên không hedge
+        result = call("deepseek", post, name="deepseek_ocr").json()
         
         extracted_text = result["choices"][0]["message"]["content"]
         logger.success(f"Trích xuất thành công {len(extracted_text)} ký tự")
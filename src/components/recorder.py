@@ -0,0 +1,313 @@
+"""
+Record/Replay Module: ghi lại mọi lời gọi ra bên ngoài (LLM chains, embedding, DeepSeek OCR, Qdrant)
+vào fixture file (JSONL) kèm inputs, outputs và latency quan sát được; sau đó phát lại một cách
+tất định (tuỳ chọn mô phỏng latency) để profile/benchmark app_graph mà không cần network.
+
+Chế độ được chọn qua cfg.recorder.mode (biến môi trường RECORDER_MODE): off | record | replay.
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+from src.config import cfg
+from src.logger import logger
+
+# Chuỗi dài hơn ngưỡng này (ảnh base64, context dài) được thay bằng digest trong fixture
+MAX_INLINE_CHARS = 4096
+
+
+class ReplayMissError(KeyError):
+    """Không tìm thấy lời gọi tương ứng trong fixture khi replay"""
+
+
+# --- SERIALIZATION ---
+
+def encode(value: Any) -> Any:
+    """Chuyển output của chain (message, Document, pydantic model) thành JSON-compatible"""
+    if isinstance(value, BaseMessage):
+        return {"__type__": "message", "data": message_to_dict(value)}
+    if isinstance(value, Document):
+        return {"__type__": "document", "page_content": value.page_content, "metadata": encode(value.metadata)}
+    if isinstance(value, BaseModel):
+        cls = type(value)
+        return {"__type__": "pydantic", "cls": f"{cls.__module__}:{cls.__qualname__}",
+                "data": value.model_dump(mode="json")}
+    if isinstance(value, dict):
+        return {str(k): encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def decode(value: Any) -> Any:
+    """Ngược lại của encode"""
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get("__type__")
+    if kind == "message":
+        return messages_from_dict([value["data"]])[0]
+    if kind == "document":
+        return Document(page_content=value["page_content"], metadata=decode(value["metadata"]))
+    if kind == "pydantic":
+        module_name, qualname = value["cls"].split(":")
+        cls = importlib.import_module(module_name)
+        for attr in qualname.split("."):
+            cls = getattr(cls, attr)
+        return cls.model_validate(value["data"])
+    return {k: decode(v) for k, v in value.items()}
+
+
+def _compact(value: Any) -> Any:
+    """Thay chuỗi quá dài bằng digest để fixture gọn và key vẫn tất định"""
+    if isinstance(value, str) and len(value) > MAX_INLINE_CHARS:
+        return {"__digest__": hashlib.sha256(value.encode("utf-8")).hexdigest(), "len": len(value)}
+    if isinstance(value, bytes):
+        return {"__digest__": hashlib.sha256(value).hexdigest(), "len": len(value)}
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_compact(v) for v in value]
+    return value
+
+
+def call_key(kind: str, name: str, inputs: Any) -> str:
+    payload = json.dumps({"kind": kind, "name": name, "inputs": inputs}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- RECORDER ---
+
+class Recorder:
+    def __init__(self, mode: str, fixture_path: str, simulate_latency: bool = False, latency_scale: float = 1.0):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"recorder.mode không hợp lệ: {mode}")
+        self.mode = mode
+        self.fixture_path = fixture_path
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[dict]]] = None
+        self._cursors: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, kind: str, name: str, inputs: Any, output: Any, latency: float):
+        inputs = _compact(encode(inputs))
+        entry = {
+            "kind": kind,
+            "name": name,
+            "key": call_key(kind, name, inputs),
+            "inputs": inputs,
+            "output": encode(output),
+            "latency": round(latency, 6),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.fixture_path) or ".", exist_ok=True)
+            with open(self.fixture_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _load(self):
+        entries: Dict[str, List[dict]] = {}
+        with open(self.fixture_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry["key"], []).append(entry)
+        logger.info(f"Replay: nạp {sum(map(len, entries.values()))} lời gọi từ {self.fixture_path}")
+        return entries
+
+    def lookup(self, kind: str, name: str, inputs: Any) -> dict:
+        """
+        Trả về entry đã ghi cho lời gọi. Các lời gọi trùng key được phát lại theo thứ tự ghi,
+        hết danh sách thì lặp lại entry cuối.
+        """
+        key = call_key(kind, name, _compact(encode(inputs)))
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            candidates = self._entries.get(key)
+            if not candidates:
+                raise ReplayMissError(f"Không có bản ghi cho {kind}:{name} trong {self.fixture_path}")
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+        return candidates[min(index, len(candidates) - 1)]
+
+    def _delay(self, entry: dict) -> float:
+        return entry["latency"] * self.latency_scale if self.simulate_latency else 0.0
+
+    def replay(self, kind: str, name: str, inputs: Any) -> Any:
+        entry = self.lookup(kind, name, inputs)
+        delay = self._delay(entry)
+        if delay:
+            time.sleep(delay)
+        return decode(entry["output"])
+
+    async def areplay(self, kind: str, name: str, inputs: Any) -> Any:
+        entry = self.lookup(kind, name, inputs)
+        delay = self._delay(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return decode(entry["output"])
+
+
+@lru_cache(maxsize=1)
+def get_recorder() -> Recorder:
+    """Recorder dùng chung, khởi tạo từ cfg.recorder ở lần sử dụng đầu tiên"""
+    return Recorder(
+        mode=cfg.recorder.mode,
+        fixture_path=cfg.recorder.fixture_path,
+        simulate_latency=cfg.recorder.simulate_latency,
+        latency_scale=cfg.recorder.latency_scale,
+    )
+
+
+def __getattr__(name):
+    if name == "recorder":
+        return get_recorder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- WRAPPERS ---
+
+def recorded_runnable(runnable, name: str, kind: str = "chain"):
+    """
+    Bọc một Runnable (chain, retriever) để ghi/phát lại. Khi mode=off trả về nguyên runnable.
+    Khi replay, runnable có thể là None (không cần khởi tạo client thật).
+    """
+    recorder = get_recorder()
+    if not recorder.enabled:
+        return runnable
+
+    def _invoke(inputs, config):
+        if recorder.replaying:
+            return recorder.replay(kind, name, inputs)
+        start = time.perf_counter()
+        output = runnable.invoke(inputs, config)
+        recorder.record(kind, name, inputs, output, time.perf_counter() - start)
+        return output
+
+    async def _ainvoke(inputs, config):
+        if recorder.replaying:
+            return await recorder.areplay(kind, name, inputs)
+        start = time.perf_counter()
+        output = await runnable.ainvoke(inputs, config)
+        recorder.record(kind, name, inputs, output, time.perf_counter() - start)
+        return output
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=name)
+
+
+def recorded(kind: str, name: str, inputs: Optional[Callable[..., Any]] = None):
+    """
+    Decorator ghi/phát lại cho hàm thường (vd: OCR request). `inputs(*args, **kwargs)` chọn
+    phần tham số dùng làm key (mặc định toàn bộ args/kwargs), vd. để bỏ qua đường dẫn file tạm.
+    """
+    def decorator(func):
+        # Chế độ được kiểm tra lúc gọi để việc import module không phải nạp cấu hình
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = get_recorder()
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            call_inputs = inputs(*args, **kwargs) if inputs else {"args": list(args), "kwargs": kwargs}
+            if recorder.replaying:
+                return recorder.replay(kind, name, call_inputs)
+            start = time.perf_counter()
+            output = func(*args, **kwargs)
+            recorder.record(kind, name, call_inputs, output, time.perf_counter() - start)
+            return output
+        return wrapper
+    return decorator
+
+
+class RecordedEmbeddings(Embeddings):
+    """Embeddings wrapper ghi/phát lại embed_documents và embed_query"""
+
+    def __init__(self, embeddings: Optional[Embeddings], name: str):
+        self.embeddings = embeddings
+        self.name = name
+
+    def _call(self, method: str, texts):
+        inputs = {"method": method, "texts": texts}
+        recorder = get_recorder()
+        if recorder.replaying:
+            return recorder.replay("embedding", self.name, inputs)
+        start = time.perf_counter()
+        output = getattr(self.embeddings, method)(texts)
+        recorder.record("embedding", self.name, inputs, output, time.perf_counter() - start)
+        return output
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embed_documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text)
+
+
+# --- CLI ---
+
+def _run(questions: List[str], profile: bool):
+    """Chạy app_graph cho danh sách câu hỏi theo chế độ recorder hiện tại"""
+    import cProfile
+    import pstats
+    from src.graph.workflow import get_app_graph
+    from src.components.chunk_store import chunk_scope
+    from src.components.metrics import metrics_callback
+
+    app_graph = get_app_graph()
+    recorder = get_recorder()
+
+    profiler = cProfile.Profile() if profile else None
+    for question in questions:
+        inputs = {"question": question, "documents": [], "loop_step": 0, "no_relevant_count": 0,
+                  "citations": [], "document_context": None}
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        with chunk_scope():
+            result = app_graph.invoke(inputs, config={"callbacks": [metrics_callback]})
+        if profiler:
+            profiler.disable()
+        logger.info(f"[{recorder.mode}] {time.perf_counter() - start:.3f}s - {question[:60]} -> "
+                    f"{result.get('generation', '')[:80]}")
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chạy app_graph với recorder (RECORDER_MODE=record|replay)")
+    parser.add_argument("questions", nargs="*", help="Các câu hỏi cần chạy")
+    parser.add_argument("--questions-file", help="File chứa mỗi dòng một câu hỏi")
+    parser.add_argument("--profile", action="store_true", help="Bật cProfile và in top hàm theo cumulative time")
+    args = parser.parse_args()
+
+    questions = list(args.questions)
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions.extend(line.strip() for line in f if line.strip())
+    _run(questions, args.profile)
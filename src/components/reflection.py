@@ -0,0 +1,133 @@
+"""
+Reflection Module: chính sách chạy ISSUP (hallucination_grader) và ISUSE (answer_grader) sau generate.
+
+Câu trả lời được coi là đủ tin cậy khi thoả cả ba điều kiện:
+- điểm similarity cao nhất của các điều luật dùng để trả lời >= cfg.reflection.min_score
+- câu trả lời không dài quá cfg.reflection.max_answer_chars ký tự
+- >= cfg.reflection.min_coverage n-gram từ (cfg.reflection.shingle_size) của câu trả lời nằm trong các điều
+  luật đó (citation coverage: câu trả lời chủ yếu trích dẫn điều luật)
+
+cfg.reflection.mode:
+- always: luôn chạy cả hai kiểm tra (mặc định)
+- gated: bỏ qua kiểm tra cho câu trả lời đủ tin cậy; tỉ lệ cfg.reflection.sample_rate trong số đó vẫn được
+  kiểm tra (lấy mẫu theo hash câu trả lời, nên ISSUP và ISUSE cùng được chọn hoặc cùng bị bỏ)
+- shadow: luôn chạy kiểm tra, chỉ ghi lại quyết định gated sẽ đưa ra
+
+Quyết định và verdict (nếu grader được gọi) được ghi ra cfg.reflection.log_path (sink queue). Báo cáo offline từ log của
+shadow/gated: tỉ lệ câu trả lời đủ tin cậy, số lời gọi grader tiết kiệm được và tần suất việc bỏ qua sẽ làm
+thay đổi kết quả (grader đánh trượt một câu trả lời đủ tin cậy):
+
+    python -m src.components.reflection [--log logs/reflection_decisions.jsonl]
+
+Metric: rag_reflection_decisions_total{check="issup|isuse", action="check|skip|sample"}.
+"""
+import hashlib
+import json
+from collections import Counter as Tally
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.components.chunk_store import get_chunk_store
+from src.components.dedup import shingles
+from src.components.metrics import REFLECTION_DECISIONS
+from src.config import cfg
+from src.logger import logger, question_fields, record_logger
+
+
+def citation_coverage(generation: str, documents: List[Document]) -> float:
+    """Tỉ lệ n-gram từ của câu trả lời có trong các điều luật"""
+    size = cfg.reflection.shingle_size
+    answer = shingles(generation, size)
+    if not answer or not documents:
+        return 0.0
+    source = set().union(*(shingles(doc.page_content, size) for doc in documents))
+    return len(answer & source) / len(answer)
+
+
+def assess(generation: str, pairs: List[Tuple[dict, Document]]) -> dict:
+    """Các tín hiệu tin cậy của câu trả lời; pairs là (tham chiếu chunk, Document) của các điều luật đã dùng"""
+    scores = [ref["score"] for ref, _ in pairs if ref.get("score") is not None]
+    top_score = max(scores, default=None)
+    coverage = citation_coverage(generation, [doc for _, doc in pairs])
+    return {
+        "top_score": top_score,
+        "answer_chars": len(generation),
+        "coverage": round(coverage, 4),
+        "confident": top_score is not None and top_score >= cfg.reflection.min_score
+                     and len(generation) <= cfg.reflection.max_answer_chars
+                     and coverage >= cfg.reflection.min_coverage,
+    }
+
+
+def _sampled(generation: str) -> bool:
+    digest = hashlib.sha1(generation.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32 < cfg.reflection.sample_rate
+
+
+def decide(check: str, generation: str, refs: list) -> dict:
+    """
+    Quyết định cho một kiểm tra (issup/isuse) theo tham chiếu các điều luật đã dùng (state["documents"]):
+    action check (chưa đủ tin cậy), skip hoặc sample; run = grader có phải được gọi không.
+    """
+    mode = cfg.reflection.mode
+    if mode == "always":
+        REFLECTION_DECISIONS.inc(check=check, action="check")
+        return {"check": check, "mode": mode, "action": "check", "run": True}
+    assessment = assess(generation, get_chunk_store().pairs(refs))
+    action = "check"
+    if assessment["confident"]:
+        action = "sample" if _sampled(generation) else "skip"
+    run = mode == "shadow" or action != "skip"
+    REFLECTION_DECISIONS.inc(check=check, action=action)
+    logger.info(f" -> Reflection {check}: {action}{' (shadow)' if mode == 'shadow' else ''} "
+                f"(score={assessment['top_score']}, chars={assessment['answer_chars']}, "
+                f"coverage={assessment['coverage']:.2f})")
+    return {"check": check, "mode": mode, "action": action, "run": run, **assessment}
+
+
+def log_decision(decision: dict, question: str, passed: Optional[bool]):
+    """
+    Ghi quyết định và verdict (None nếu không gọi grader) ra cfg.reflection.log_path qua sink queue;
+    câu hỏi chỉ được ghi dưới dạng hash trừ khi bật cfg.reflection.log_questions
+    """
+    if decision["mode"] == "always" or not cfg.reflection.log_decisions:
+        return
+    record_logger(cfg.reflection.log_path).info(json.dumps(
+        {**question_fields(question, cfg.reflection.log_questions), **{k: v for k, v in decision.items() if k != "run"}, "passed": passed},
+        ensure_ascii=False))
+
+
+def report(entries: List[dict]) -> dict:
+    """
+    Theo từng kiểm tra: số quyết định theo action, số lời gọi grader gated bỏ qua (skip) và trong các câu
+    trả lời đủ tin cậy đã được kiểm tra (shadow hoặc sample), tỉ lệ grader đánh trượt, tức việc bỏ qua
+    sẽ làm thay đổi kết quả.
+    """
+    result = {}
+    for check in sorted({entry["check"] for entry in entries}):
+        rows = [entry for entry in entries if entry["check"] == check]
+        audited = [entry for entry in rows if entry["confident"] and entry["passed"] is not None]
+        changed = sum(not entry["passed"] for entry in audited)
+        result[check] = {
+            "decisions": len(rows),
+            "actions": dict(Tally(entry["action"] for entry in rows)),
+            "confident_rate": round(sum(entry["confident"] for entry in rows) / len(rows), 4),
+            "skippable": sum(entry["action"] == "skip" for entry in rows),
+            "audited": len(audited),
+            "would_change": changed,
+            "change_rate": round(changed / len(audited), 4) if audited else None,
+        }
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Báo cáo offline của chính sách reflection")
+    parser.add_argument("--log", default=None, help="Mặc định cfg.reflection.log_path")
+    args = parser.parse_args()
+
+    with open(args.log or cfg.reflection.log_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(report(entries), ensure_ascii=False, indent=2))
@@ -0,0 +1,309 @@
+"""
+Resilience Module: chính sách chung cho các lời gọi ra ngoài (LLM chains, embedding, Qdrant, DeepSeek OCR).
+
+- Timeout theo lời gọi được đặt trên client (ChatOpenAI, OpenAIEmbeddings, QdrantClient, requests).
+- Retry với full-jitter backoff, chỉ cho lỗi tạm thời (timeout, lỗi kết nối, 429, 5xx).
+- Hedged request cho lời gọi idempotent (embedding, Qdrant search, grader/router): nếu lời gọi chưa xong
+  sau percentile latency (cfg.resilience.hedge_percentile) của chính lời gọi đó, gửi thêm một bản sao
+  và dùng kết quả về trước.
+- Circuit breaker theo provider: sau breaker_failure_threshold lỗi tạm thời liên tiếp, các lời gọi bị
+  từ chối ngay (CircuitOpenError) trong breaker_reset_seconds; sau đó đúng một lời gọi thăm dò (half-open)
+  được đi qua, các lời gọi khác vẫn bị từ chối cho tới khi lời gọi thăm dò xong.
+
+SDK của các client được tắt retry nội bộ (max_retries=0) để không retry chồng hai lớp.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+
+from src.config import cfg
+from src.components.metrics import BREAKER_OPEN, BREAKER_REJECTIONS, BREAKER_TRIPS, HEDGES, RETRIES
+from src.logger import logger
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Provider đang bị ngắt mạch, lời gọi bị từ chối mà không gửi đi"""
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    def __init__(self, provider: str, failure_threshold: int, reset_seconds: float):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False  # Đang có một lời gọi thăm dò (half-open)
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def check(self) -> bool:
+        """
+        Từ chối ngay khi breaker mở; sau reset_seconds cho đúng một lời gọi đi qua để thử lại (half-open),
+        các lời gọi tới trong lúc lời gọi thăm dò chưa xong vẫn bị từ chối.
+        Trả về True nếu lời gọi này là lời gọi thăm dò.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed" or (state == "half_open" and not self._probing):
+                self._probing = state == "half_open"
+                return self._probing
+        BREAKER_REJECTIONS.inc(provider=self.provider)
+        raise CircuitOpenError(f"{self.provider}: circuit breaker đang mở")
+
+    def release(self):
+        """Lời gọi thăm dò kết thúc mà không xác định được provider đã ổn chưa (lỗi không tạm thời)"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._opened_at is not None:
+                self._opened_at = None
+                BREAKER_OPEN.set(0, provider=self.provider)
+                logger.info(f"Circuit breaker {self.provider}: đóng lại")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            half_open = self._opened_at is not None
+            if half_open or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._failures = 0
+                BREAKER_TRIPS.inc(provider=self.provider)
+                BREAKER_OPEN.set(1, provider=self.provider)
+                logger.warning(f"Circuit breaker {self.provider}: mở trong {self.reset_seconds}s")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                provider, cfg.resilience.breaker_failure_threshold, cfg.resilience.breaker_reset_seconds)
+        return breaker
+
+
+# --- Hedging ---
+
+class LatencyWindow:
+    """Latency của các lời gọi thành công gần nhất cho một tên lời gọi"""
+
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < cfg.resilience.hedge_min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+_windows: Dict[str, LatencyWindow] = {}
+_pool_thread = threading.local()  # in_pool: thread đang chạy một lần thử trong thread pool hedge
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _window(name: str) -> LatencyWindow:
+    window = _windows.get(name)
+    if window is None:
+        window = _windows.setdefault(name, LatencyWindow(cfg.resilience.hedge_window))
+    return window
+
+
+def _get_executor():
+    """Thread pool cho hedged request (tạo lại trong worker sau khi fork)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+            _executor = ContextThreadPoolExecutor(max_workers=cfg.resilience.hedge_workers,
+                                                  thread_name_prefix="hedge")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _in_pool(fn: Callable[[], Any]) -> Callable[[], Any]:
+    def run():
+        _pool_thread.in_pool = True
+        try:
+            return fn()
+        finally:
+            _pool_thread.in_pool = False
+    return run
+
+
+def _hedged(provider: str, fn: Callable[[], Any], delay: float, timeout: Optional[float] = None,
+            hedge_fn: Optional[Callable[[], Any]] = None) -> Any:
+    """
+    Chạy fn; nếu sau `delay` giây chưa xong thì chạy thêm một bản sao (hedge_fn, mặc định là fn),
+    lấy kết quả thành công đầu tiên.
+    Tổng thời gian chờ bị giới hạn bởi `timeout` (timeout của lời gọi): hết hạn -> TimeoutError (retry được),
+    kể cả khi lần thử còn nằm trong hàng đợi của thread pool.
+    """
+    executor = _get_executor()
+    deadline = time.monotonic() + timeout if timeout else None
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+    primary = executor.submit(_in_pool(fn))
+    done, _ = wait([primary], timeout=delay if deadline is None else min(delay, remaining()))
+    if done:
+        return primary.result()
+    if deadline is not None and remaining() <= 0:
+        primary.cancel()
+        raise TimeoutError(f"{provider}: không có kết quả sau {timeout}s")
+    HEDGES.inc(provider=provider, result="sent")
+    hedge = executor.submit(_in_pool(hedge_fn or fn))
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                future.cancel()  # Lần thử chưa bắt đầu (còn trong hàng đợi) không chạy nữa
+            raise TimeoutError(f"{provider}: không có kết quả sau {timeout}s")
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    HEDGES.inc(provider=provider, result="won")
+                # Bản còn lại tiếp tục chạy nền, kết quả bị bỏ qua
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+# --- Retry ---
+
+def is_retryable(error: BaseException) -> bool:
+    """Lỗi tạm thời: timeout, lỗi kết nối, HTTP 408/409/429/5xx, gRPC UNAVAILABLE/DEADLINE_EXCEEDED"""
+    if isinstance(error, CircuitOpenError) or getattr(error, "resilience_exhausted", False):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+
+    import httpx
+    import openai
+    import requests
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, httpx.TimeoutException,
+                          httpx.TransportError, requests.Timeout, requests.ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if callable(code):  # grpc.RpcError (Qdrant prefer_grpc)
+        try:
+            return getattr(code(), "name", "") in {"UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED"}
+        except Exception:
+            return False
+    # qdrant_client ResponseHandlingException bọc lỗi transport
+    return type(error).__name__ == "ResponseHandlingException"
+
+
+def call(provider: str, fn: Callable[[], Any], name: Optional[str] = None, hedge: bool = False,
+         timeout: Optional[float] = None, hedge_fn: Optional[Callable[[], Any]] = None) -> Any:
+    """
+    Gọi fn() với circuit breaker của provider, retry cho lỗi tạm thời và (nếu hedge) hedged request.
+    `name` xác định cửa sổ latency dùng để tính thời điểm hedge (mặc định là provider).
+    `timeout` giới hạn thời gian chờ một lần thử được hedge (timeout của client không áp dụng khi lần thử
+    còn nằm trong hàng đợi của thread pool). `hedge_fn` là bản sao gửi thêm khi hedge (mặc định là fn).
+    Chỉ nên hedge lời gọi lá: lời gọi lồng bên trong một lần thử đang chạy trên thread pool hedge không được
+    hedge nữa, để lần thử ngoài không chờ một lần thử trong xếp hàng phía sau nó trên cùng pool.
+    """
+    if not cfg.resilience.enabled:
+        return fn()
+    settings = cfg.resilience
+    breaker = get_breaker(provider)
+    window = _window(name or provider)
+    hedge = hedge and settings.hedge and not getattr(_pool_thread, "in_pool", False)
+    for attempt in range(settings.max_attempts):
+        probe = breaker.check()
+        start = time.perf_counter()
+        try:
+            delay = window.percentile(settings.hedge_percentile) if hedge else None
+            result = _hedged(provider, fn, delay, timeout, hedge_fn) if delay is not None else fn()
+        except BaseException as e:
+            if not isinstance(e, Exception) or not is_retryable(e):
+                if probe:  # Chỉ lời gọi thăm dò mới giải phóng lượt half-open
+                    breaker.release()
+                raise
+            breaker.record_failure()
+            if attempt == settings.max_attempts - 1:
+                # Lớp bọc ngoài (vd. retriever bọc embedding) không retry lại lỗi này
+                e.resilience_exhausted = True
+                raise
+            backoff = random.uniform(0, min(settings.backoff_max, settings.backoff_base * 2 ** attempt))
+            RETRIES.inc(provider=provider)
+            logger.warning(f"{name or provider}: {type(e).__name__}, thử lại sau {backoff:.2f}s "
+                           f"({attempt + 1}/{settings.max_attempts})")
+            time.sleep(backoff)
+            continue
+        breaker.record_success()
+        window.add(time.perf_counter() - start)
+        return result
+
+
+# --- Wrappers ---
+
+def resilient_runnable(runnable, name: str, provider: str, hedge: bool = False, timeout: Optional[float] = None):
+    """
+    Bọc Runnable (chain, retriever) bằng call(); runnable None (replay) được trả về nguyên trạng.
+    Bản sao hedge chạy không có callbacks để latency/token của chain không bị đếm hai lần
+    (lần chính vẫn báo callbacks khi xong, kể cả khi bản sao về trước).
+    """
+    if runnable is None or not cfg.resilience.enabled:
+        return runnable
+
+    def invoke(inputs, config):
+        # callbacks [] chứ không phải None: None bị thay bằng callbacks của config cha (ensure_config)
+        return call(provider, lambda: runnable.invoke(inputs, config), name=name, hedge=hedge, timeout=timeout,
+                    hedge_fn=lambda: runnable.invoke(inputs, {**config, "callbacks": []}))
+
+    return RunnableLambda(invoke, name=name)
+
+
+class ResilientEmbeddings(Embeddings):
+    """Embeddings wrapper: embedding là idempotent nên được hedge"""
+
+    def __init__(self, embeddings: Embeddings, provider: str = "embedding"):
+        self.embeddings = embeddings
+        self.provider = provider
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return call(self.provider, lambda: self.embeddings.embed_documents(texts),
+                    name=f"{self.provider}:documents", hedge=True, timeout=cfg.resilience.embedding_timeout)
+
+    def embed_query(self, text: str) -> List[float]:
+        return call(self.provider, lambda: self.embeddings.embed_query(text),
+                    name=f"{self.provider}:query", hedge=True, timeout=cfg.resilience.embedding_timeout)
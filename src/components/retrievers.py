@@ -0,0 +1,44 @@
+"""
+Retriever Module: retriever trên QdrantVectorStore giữ điểm similarity (cosine) của từng chunk trong
+metadata["score"]. Tham chiếu chunk trong state ({"id", "score"}), relevance_score của citation và
+chính sách reflection (src/components/reflection.py) dùng điểm này.
+
+Import trong hàm get_retriever() (langchain_core.retrievers nặng khi import).
+
+Retriever không được hedge nguyên khối; embedding câu truy vấn (ResilientEmbeddings) và Qdrant search
+(search_by_vector) là các lời gọi lá, được hedge riêng.
+"""
+from typing import Iterable, List, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.components.resilience import call
+from src.config import cfg
+
+
+def scored_documents(pairs: Iterable[Tuple[Document, float]]) -> List[Document]:
+    """(Document, điểm) -> Document có metadata["score"]"""
+    documents = []
+    for doc, score in pairs:
+        doc.metadata["score"] = round(float(score), 4)
+        documents.append(doc)
+    return documents
+
+
+def search_by_vector(vectorstore, vector: List[float], k: int, name: str = "qdrant_search", **kwargs):
+    """similarity_search_with_score_by_vector qua resilience.call (hedge, timeout theo cfg.resilience.qdrant_timeout)"""
+    return call("qdrant", lambda: vectorstore.similarity_search_with_score_by_vector(vector, k=k, **kwargs),
+                name=name, hedge=True, timeout=cfg.resilience.qdrant_timeout)
+
+
+class ScoredRetriever(BaseRetriever):
+    """Như vectorstore.as_retriever(search_type="similarity") nhưng giữ điểm similarity"""
+
+    vectorstore: object
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self.vectorstore.embeddings.embed_query(query)
+        return scored_documents(search_by_vector(self.vectorstore, vector, self.k))
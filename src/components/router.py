@@ -0,0 +1,219 @@
+"""
+Router Module: bộ phân loại local (TF-IDF + logistic regression, thuần Python) cho quyết định
+retrieve / không retrieve trong route_after_ocr, để không phải gọi retrieve_router LLM cho phần
+lớn câu hỏi. LLM chỉ được gọi khi độ tin cậy của bộ phân loại thấp.
+
+- Dữ liệu huấn luyện: exemplar gán nhãn tay (cfg.router.seed_path) + traffic đã log, trong đó
+  quyết định của LLM được dùng làm nhãn (cfg.router.log_path). Log chỉ chứa hash câu hỏi trừ khi
+  bật cfg.router.log_questions (ROUTER_LOG_QUESTIONS=true); chỉ các dòng có toàn văn dùng để train được.
+- Model lưu dạng JSON tại cfg.router.model_path; nếu chưa có file thì train từ seed ở lần dùng đầu.
+
+    python -m src.components.router train            # seed + traffic -> cfg.router.model_path
+    python -m src.components.router predict "Thủ tục cấp phép xây dựng?"
+"""
+import json
+import math
+import os
+import random
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.config import cfg
+from src.logger import logger, question_fields, record_logger
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def extract_terms(text: str) -> List[str]:
+    """Unigram, bigram từ và char 3-gram trong từ (bắt được biến thể như 'phạt' / 'xử phạt')"""
+    words = _TOKEN_PATTERN.findall(text.lower())
+    terms = [f"w:{w}" for w in words]
+    terms += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        terms += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return terms
+
+
+class LocalRouter:
+    def __init__(self, idf: Dict[str, float], weights: Dict[str, float], bias: float, meta: Optional[dict] = None):
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        self.meta = meta or {}
+
+    # --- Features ---
+
+    @staticmethod
+    def _vectorize(text: str, idf: Dict[str, float]) -> Dict[str, float]:
+        counts = Counter(term for term in extract_terms(text) if term in idf)
+        vector = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    def predict_proba(self, question: str) -> float:
+        """Xác suất câu hỏi cần retrieve"""
+        vector = self._vectorize(question, self.idf)
+        score = self.bias + sum(self.weights.get(term, 0.0) * value for term, value in vector.items())
+        return 1 / (1 + math.exp(-max(min(score, 30), -30)))
+
+    def decide(self, question: str, threshold: float) -> Tuple[Optional[str], float]:
+        """('yes' | 'no', p) khi đủ tin cậy, (None, p) khi cần hỏi LLM"""
+        p = self.predict_proba(question)
+        if p >= threshold:
+            return "yes", p
+        if p <= 1 - threshold:
+            return "no", p
+        return None, p
+
+    # --- Training ---
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, int]], epochs: int = 30, learning_rate: float = 0.5,
+              l2: float = 1e-4, seed: int = 0) -> "LocalRouter":
+        """Logistic regression bằng SGD trên vector TF-IDF thưa"""
+        documents = [set(extract_terms(text)) for text, _ in samples]
+        df = Counter(term for terms in documents for term in terms)
+        n = len(samples)
+        idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        vectors = [(cls._vectorize(text, idf), label) for text, label in samples]
+
+        weights: Dict[str, float] = {}
+        bias = 0.0
+        rng = random.Random(seed)
+        order = list(range(n))
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for i in order:
+                vector, label = vectors[i]
+                score = bias + sum(weights.get(term, 0.0) * value for term, value in vector.items())
+                error = 1 / (1 + math.exp(-max(min(score, 30), -30))) - label
+                for term, value in vector.items():
+                    w = weights.get(term, 0.0)
+                    weights[term] = w - rate * (error * value + l2 * w)
+                bias -= rate * error
+        weights = {term: w for term, w in weights.items() if abs(w) > 1e-6}
+        return cls(idf, weights, bias, {"samples": n, "positives": sum(label for _, label in samples)})
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"idf": self.idf, "weights": self.weights, "bias": self.bias, "meta": self.meta},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalRouter":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["idf"], data["weights"], data["bias"], data.get("meta"))
+
+
+# --- Data ---
+
+def _read_jsonl(path: str) -> Iterable[dict]:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_samples(seed_path: Optional[str] = None, log_path: Optional[str] = None) -> List[Tuple[str, int]]:
+    """
+    Seed exemplar + quyết định của LLM trong traffic đã log (câu hỏi trùng lặp: nhãn mới nhất).
+    Quyết định do chính bộ phân loại đưa ra không được dùng lại để tránh tự củng cố.
+    """
+    labels: Dict[str, int] = {}
+    for row in _read_jsonl(seed_path):
+        labels[row["question"].strip()] = int(row["label"] == "yes")
+    hashed = 0
+    for row in _read_jsonl(log_path):
+        if row.get("source") != "llm":
+            continue
+        if "question" not in row:
+            hashed += 1
+            continue
+        labels[row["question"].strip()] = int(row["decision"] == "yes")
+    if hashed:
+        logger.info(f"Bỏ qua {hashed} quyết định LLM chỉ có hash câu hỏi (bật router.log_questions để train từ traffic)")
+    return list(labels.items())
+
+
+def log_decision(question: str, decision: str, source: str, probability: Optional[float] = None):
+    """
+    Ghi quyết định routing ra cfg.router.log_path để train lại bộ phân loại (qua sink queue, không chặn request).
+    Toàn văn câu hỏi chỉ được ghi khi bật cfg.router.log_questions, mặc định chỉ có hash.
+    """
+    if not cfg.router.log_decisions:
+        return
+    record_logger(cfg.router.log_path).info(json.dumps(
+        {**question_fields(question, cfg.router.log_questions), "decision": decision, "source": source,
+         "p": None if probability is None else round(probability, 4)}, ensure_ascii=False))
+
+
+@lru_cache(maxsize=1)
+def get_local_router() -> LocalRouter:
+    if os.path.exists(cfg.router.model_path):
+        router = LocalRouter.load(cfg.router.model_path)
+        logger.info(f"Router: nạp model từ {cfg.router.model_path}")
+    else:
+        router = LocalRouter.train(load_samples(cfg.router.seed_path))
+        logger.info(f"Router: chưa có {cfg.router.model_path}, train từ {cfg.router.seed_path}")
+    return router
+
+
+# --- CLI ---
+
+def cross_validate(samples: List[Tuple[str, int]], threshold: float, folds: int = 5, seed: int = 0) -> dict:
+    """Accuracy, tỉ lệ câu hỏi quyết định được local (coverage) và accuracy trên phần đó"""
+    shuffled = list(samples)
+    random.Random(seed).shuffle(shuffled)
+    correct = covered = covered_correct = 0
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        train = [s for i, s in enumerate(shuffled) if i % folds != fold]
+        router = LocalRouter.train(train)
+        for text, label in test:
+            decision, p = router.decide(text, threshold)
+            correct += (p >= 0.5) == bool(label)
+            if decision is not None:
+                covered += 1
+                covered_correct += (decision == "yes") == bool(label)
+    n = len(samples)
+    return {
+        "samples": n,
+        "accuracy": round(correct / n, 4),
+        "coverage": round(covered / n, 4),
+        "covered_accuracy": round(covered_correct / covered, 4) if covered else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train/thử bộ phân loại retrieve local")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train")
+    train_parser.add_argument("--seed", default=None, help="Mặc định cfg.router.seed_path")
+    train_parser.add_argument("--log", default=None, help="Mặc định cfg.router.log_path")
+    train_parser.add_argument("--output", default=None, help="Mặc định cfg.router.model_path")
+    predict_parser = sub.add_parser("predict")
+    predict_parser.add_argument("questions", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        samples = load_samples(args.seed or cfg.router.seed_path, args.log or cfg.router.log_path)
+        report = cross_validate(samples, cfg.router.threshold)
+        print(json.dumps(report, ensure_ascii=False))
+        output = args.output or cfg.router.model_path
+        LocalRouter.train(samples).save(output)
+        print(f"Model: {output}")
+    else:
+        router = get_local_router()
+        for question in args.questions:
+            decision, p = router.decide(question, cfg.router.threshold)
+            print(f"{p:.3f} {decision or 'llm'}  {question}")
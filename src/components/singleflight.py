@@ -0,0 +1,97 @@
+"""
+Single-flight Module: gộp các lời gọi trùng nhau đang chạy đồng thời thành một lần thực thi.
+
+Khi một câu hỏi/tài liệu được chia sẻ rộng, nhiều request giống hệt nhau tới trong vài giây, trước khi
+response cache có entry. Request đầu tiên (leader) thực thi; các request trùng key tới trong lúc đó chờ
+và nhận cùng kết quả (hoặc cùng exception). Key hết hiệu lực ngay khi leader xong, kết quả lâu dài do
+các cache SQLite đảm nhận.
+
+- AsyncSingleFlight: trong event loop (chạy graph cho /chat, src/server/routes.py)
+- SingleFlight: giữa các thread (OCR, embedding câu truy vấn; node của graph chạy trong thread pool)
+
+Phạm vi là một process: các worker của src/server/serve.py không chờ lẫn nhau.
+Metric: rag_coalesced_requests_total{scope}.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from src.components.metrics import COALESCED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Single-flight giữa các thread"""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            COALESCED.inc(scope=self.scope)
+            return flight.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """Single-flight trong event loop"""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        coalesced = False
+        while key in self._flights:
+            flight = self._flights[key]
+            if not coalesced:
+                COALESCED.inc(scope=self.scope)
+                coalesced = True
+            try:
+                # shield: request chờ bị huỷ (client ngắt kết nối) không huỷ lần thực thi chung
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # Leader bị huỷ: request chờ tự thực thi (hoặc chờ leader mới)
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            flight.exception()  # Đánh dấu đã đọc: không log "exception was never retrieved" khi không ai chờ
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            self._flights.pop(key, None)
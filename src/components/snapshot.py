@@ -0,0 +1,270 @@
+"""
+Snapshot Module: snapshot có phiên bản của Qdrant collection để node mới phục vụ ngay mà không phải
+chạy lại ingest (parse + embedding).
+
+- ingest.py ghi metadata vào collection: index_version, corpus_hash (sha256 các file PDF) và cấu hình
+  index (embedding model, chunk_size, chunk_overlap, pdf_backend, dedup_threshold).
+- `python ingest.py --snapshot` tạo snapshot và tải về cfg.snapshot.dir (mặc định QDRANT_SNAPSHOT_PATH)
+  cùng manifest JSON: <collection>-<version>.snapshot và <collection>-<version>.json.
+- Khi khởi động (main.py / src/server/serve.py, trước khi fork) hoặc `python ingest.py --restore`:
+  nếu collection chưa có hoặc đã cũ (corpus/cấu hình khác), snapshot mới nhất khớp corpus và cấu hình
+  hiện tại được khôi phục. Tầng thô của retrieval hai tầng (cfg.hierarchy) không nằm trong snapshot mà
+  được dựng lại từ vector các chunk.
+
+Qdrant khôi phục snapshot từ file:// khi cfg.snapshot.server_dir (đường dẫn của cùng thư mục phía
+Qdrant, vd. /qdrant/snapshots trong docker-compose) được cấu hình, ngược lại snapshot được upload qua HTTP.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.config import cfg
+from src.logger import logger
+
+INDEX_CONFIG_KEYS = ("embedding_model", "chunk_size", "chunk_overlap", "pdf_backend", "dedup_threshold")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def corpus_hash(pdf_files: List[str]) -> Optional[str]:
+    """Hash của corpus theo (tên file, nội dung), không phụ thuộc thứ tự/đường dẫn thư mục"""
+    if not pdf_files:
+        return None
+    entries = sorted(f"{os.path.basename(path)}:{file_sha256(path)}" for path in pdf_files)
+    return hashlib.sha256("\n".join(entries).encode("utf-8")).hexdigest()
+
+
+def index_config() -> dict:
+    """Các tham số quyết định nội dung index; khác nhau -> index cũ không dùng lại được"""
+    return {
+        "embedding_model": cfg.embedding.model,
+        "chunk_size": cfg.chunk_size,
+        "chunk_overlap": cfg.chunk_overlap,
+        "pdf_backend": cfg.ingest.pdf_backend,
+        "dedup_threshold": cfg.ingest.dedup_threshold if cfg.ingest.dedup else None,
+    }
+
+
+def index_metadata(pdf_files: List[str]) -> dict:
+    """Metadata ghi vào collection khi ingest (đi kèm trong snapshot)"""
+    digest = corpus_hash(pdf_files)
+    return {
+        "index_version": f"{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{(digest or 'empty')[:8]}",
+        "corpus_hash": digest,
+        **index_config(),
+    }
+
+
+def is_current(metadata: Optional[dict], expected_corpus_hash: Optional[str]) -> bool:
+    return bool(metadata) and metadata.get("corpus_hash") == expected_corpus_hash and all(
+        metadata.get(key) == value for key, value in index_config().items())
+
+
+# --- Qdrant ---
+
+def _base_url() -> str:
+    return f"http://{cfg.qdrant.host}:{cfg.qdrant.port}"
+
+
+def _headers() -> dict:
+    return {"api-key": cfg.qdrant.api_key} if cfg.qdrant.api_key else {}
+
+
+def _admin_client(timeout: Optional[float] = None):
+    """
+    Client HTTP riêng cho snapshot (đóng sau khi dùng): có thể chạy trong master trước khi fork
+    mà không tạo client gRPC dùng chung của get_client().
+    Mặc định là timeout của thao tác snapshot (cfg.snapshot.timeout, vài phút); lời gọi metadata nhanh
+    truyền timeout ngắn để Qdrant không phản hồi không chặn khởi động lâu như vậy.
+    """
+    from qdrant_client import QdrantClient
+
+    return QdrantClient(url=_base_url(), api_key=cfg.qdrant.api_key or None, prefer_grpc=False,
+                        timeout=timeout or cfg.snapshot.timeout)
+
+
+def collection_metadata(client, collection_name: str) -> Optional[dict]:
+    """Metadata của collection; None nếu collection chưa tồn tại"""
+    if not client.collection_exists(collection_name):
+        return None
+    return client.get_collection(collection_name).config.metadata or {}
+
+
+# --- Manifest ---
+
+def _path(name: str) -> str:
+    return os.path.join(cfg.snapshot.dir, name)
+
+
+def list_manifests(collection_name: Optional[str] = None) -> List[dict]:
+    """Manifest trong cfg.snapshot.dir, mới nhất trước"""
+    collection_name = collection_name or cfg.qdrant.collection_name
+    manifests = []
+    for path in glob.glob(_path(f"{collection_name}-*.json")):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if os.path.exists(_path(manifest["snapshot"])):
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+
+def find_snapshot(expected_corpus_hash: Optional[str]) -> Optional[dict]:
+    """Snapshot mới nhất khớp cấu hình index hiện tại (và corpus, nếu node có corpus local)"""
+    for manifest in list_manifests():
+        if all(manifest["config"].get(key) == value for key, value in index_config().items()) and (
+                expected_corpus_hash is None or manifest["corpus_hash"] == expected_corpus_hash):
+            return manifest
+    return None
+
+
+def _prune():
+    for manifest in list_manifests()[cfg.snapshot.keep:]:
+        for name in (manifest["snapshot"], f"{cfg.qdrant.collection_name}-{manifest['version']}.json"):
+            if os.path.exists(_path(name)):
+                os.remove(_path(name))
+        logger.info(f"Xoá snapshot cũ {manifest['version']}")
+
+
+# --- Create / restore ---
+
+def create_snapshot(pdf_files: List[str]) -> dict:
+    """Snapshot collection hiện tại vào cfg.snapshot.dir kèm manifest; trả về manifest"""
+    import httpx
+
+    collection_name = cfg.qdrant.collection_name
+    client = _admin_client()
+    try:
+        metadata = collection_metadata(client, collection_name)
+        if metadata is None:
+            raise ValueError(f"Collection {collection_name} chưa tồn tại, chạy ingest trước")
+        info = client.get_collection(collection_name)
+        start = time.perf_counter()
+        description = client.create_snapshot(collection_name, wait=True)
+        version = metadata.get("index_version") or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        name = f"{collection_name}-{version}.snapshot"
+        os.makedirs(cfg.snapshot.dir, exist_ok=True)
+        # Tải về qua HTTP rồi xoá bản phía server (thư mục snapshot của Qdrant có thể không dùng chung)
+        with httpx.stream("GET", f"{_base_url()}/collections/{collection_name}/snapshots/{description.name}",
+                          headers=_headers(), timeout=cfg.snapshot.timeout) as response:
+            response.raise_for_status()
+            with open(_path(name) + ".part", "wb") as f:
+                for chunk in response.iter_bytes(1024 * 1024):
+                    f.write(chunk)
+        os.replace(_path(name) + ".part", _path(name))
+        client.delete_snapshot(collection_name, description.name, wait=True)
+    finally:
+        client.close()
+
+    manifest = {
+        "version": version,
+        "collection": collection_name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "corpus_hash": metadata.get("corpus_hash"),
+        "files": [{"name": os.path.basename(path), "sha256": file_sha256(path)} for path in sorted(pdf_files)],
+        "config": {key: metadata.get(key) for key in INDEX_CONFIG_KEYS},
+        "points": info.points_count,
+        "snapshot": name,
+        "snapshot_sha256": description.checksum or file_sha256(_path(name)),
+        "snapshot_bytes": os.path.getsize(_path(name)),
+    }
+    with open(_path(f"{collection_name}-{version}.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"Snapshot {name}: {manifest['points']} points, {manifest['snapshot_bytes'] / 1e6:.1f} MB "
+                f"trong {time.perf_counter() - start:.1f}s")
+    _prune()
+    return manifest
+
+
+def restore_snapshot(manifest: dict):
+    """Khôi phục collection từ snapshot của manifest (ghi đè collection hiện có)"""
+    import httpx
+
+    collection_name = cfg.qdrant.collection_name
+    start = time.perf_counter()
+    if cfg.snapshot.server_dir:
+        client = _admin_client()
+        try:
+            client.recover_snapshot(collection_name, f"file://{cfg.snapshot.server_dir.rstrip('/')}/{manifest['snapshot']}",
+                                    checksum=manifest["snapshot_sha256"], priority="snapshot", wait=True)
+        finally:
+            client.close()
+    else:
+        with open(_path(manifest["snapshot"]), "rb") as f:
+            response = httpx.post(
+                f"{_base_url()}/collections/{collection_name}/snapshots/upload",
+                params={"priority": "snapshot", "wait": "true", "checksum": manifest["snapshot_sha256"]},
+                files={"snapshot": (manifest["snapshot"], f, "application/octet-stream")},
+                headers=_headers(), timeout=cfg.snapshot.timeout,
+            )
+        response.raise_for_status()
+    logger.info(f"Khôi phục snapshot {manifest['version']} ({manifest['points']} points) vào {collection_name} "
+                f"trong {time.perf_counter() - start:.1f}s")
+
+
+def restore_if_needed() -> bool:
+    """
+    Khôi phục snapshot khi collection chưa có hoặc đã cũ so với corpus (cfg.snapshot.corpus_glob, nếu node
+    có corpus) và cấu hình index hiện tại. Trả về True nếu đã khôi phục.
+    """
+    if cfg.qdrant.location:
+        return False  # Qdrant in-memory/local không hỗ trợ snapshot
+    expected = corpus_hash(sorted(glob.glob(cfg.snapshot.corpus_glob)))
+    # Kiểm tra collection với timeout của Qdrant: chỉ thao tác khôi phục mới cần cfg.snapshot.timeout
+    client = _admin_client(cfg.resilience.qdrant_timeout)
+    try:
+        metadata = collection_metadata(client, cfg.qdrant.collection_name)
+    finally:
+        client.close()
+    manifest = find_snapshot(expected)
+    if expected is None and manifest is not None:
+        expected = manifest["corpus_hash"]
+    if is_current(metadata, expected):
+        logger.info(f"Collection {cfg.qdrant.collection_name} đã cập nhật (index {metadata.get('index_version')})")
+        sync_sections()
+        return False
+    reason = "chưa tồn tại" if metadata is None else "đã cũ"
+    if manifest is None:
+        logger.warning(f"Collection {cfg.qdrant.collection_name} {reason} và không có snapshot phù hợp trong "
+                       f"{cfg.snapshot.dir}: chạy `python ingest.py --snapshot`")
+        return False
+    logger.info(f"Collection {cfg.qdrant.collection_name} {reason}, khôi phục snapshot {manifest['version']}")
+    restore_snapshot(manifest)
+    sync_sections(rebuild=True)
+    return True
+
+
+def sync_sections(rebuild: bool = False):
+    """
+    Tầng thô của retrieval hai tầng (src/components/hierarchy.py) không nằm trong snapshot:
+    dựng lại từ vector các chunk sau khi khôi phục, hoặc khi chưa có.
+    """
+    if not cfg.hierarchy.enabled:
+        return
+    from src.components.hierarchy import build_sections, sections_collection
+
+    client = _admin_client()
+    try:
+        if rebuild or not client.collection_exists(sections_collection()):
+            build_sections(client)
+    finally:
+        client.close()
+
+
+def restore_on_startup():
+    """Gọi khi server khởi động; lỗi (vd. Qdrant chưa sẵn sàng) chỉ được log"""
+    if not cfg.snapshot.restore_on_startup:
+        return
+    try:
+        restore_if_needed()
+    except Exception as e:
+        logger.warning(f"Không khôi phục được snapshot: {e}")
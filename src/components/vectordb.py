@@ -1,42 +1,145 @@
 # src/components/vectordb.py
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
+import hashlib
+from array import array
+from functools import lru_cache
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
 from src.config import cfg
+from src.components.cache import SqliteCache, get_cache
+from src.components.recorder import RecordedEmbeddings, get_recorder, recorded_runnable
+from src.components.resilience import ResilientEmbeddings, resilient_runnable
+from src.components.singleflight import SingleFlight
 
-def get_embeddings():
-    """Khởi tạo Embedding Model (OpenAI text-embedding-3-small)"""
-    return OpenAIEmbeddings(
-        model="text-embedding-3-large",
-        api_key=cfg.llm.api_key
+# langchain_openai, langchain_qdrant và qdrant_client được import trong hàm để import module này nhẹ
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper cache vector theo (base_url, model, text) trong SQLite cache dùng chung,
+    để việc ingest/evaluate lặp lại không phải embed lại cùng một đoạn văn bản.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: SqliteCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self._prefix = f"{cfg.llm.base_url or 'openai'}|{model}|"
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256((self._prefix + text).encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = {key: array("f", vector).tobytes() for key, vector in zip(missing, vectors)}
+            self.cache.set_many(fresh)
+            cached.update(fresh)
+        return [array("f", cached[key]).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        value = self.cache.get(key)
+        if value is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, array("f", vector).tobytes())
+            return vector
+        return array("f", value).tolist()
+
+class CoalescedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper gộp các lời gọi embed_query trùng (model, text) đang chạy đồng thời ở nhiều thread
+    (src/components/singleflight.py); embed_documents (ingest theo batch) đi thẳng xuống dưới.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str):
+        self.embeddings = embeddings
+        self._prefix = f"{cfg.llm.base_url or 'openai'}|{model}|"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return _embedding_flights.do(self._prefix + text, lambda: self.embeddings.embed_query(text))
+
+
+_embedding_flights = SingleFlight("embedding")
+
+def get_embeddings(model: Optional[str] = None):
+    """Khởi tạo Embedding Model (mặc định cfg.embedding.model)"""
+    model = model or cfg.embedding.model
+    recorder = get_recorder()
+    if recorder.replaying:
+        embeddings = RecordedEmbeddings(None, "openai_embeddings")
+    else:
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(
+            model=model,
+            api_key=cfg.llm.api_key,
+            base_url=cfg.llm.base_url,
+            # Server OpenAI-compatible (base_url tuỳ chỉnh) thường không nhận input dạng token ids
+            check_embedding_ctx_length=cfg.llm.base_url is None,
+            timeout=cfg.resilience.embedding_timeout,
+            # Retry do src/components/resilience.py đảm nhận
+            max_retries=0 if cfg.resilience.enabled else 2,
+        )
+        embeddings = ResilientEmbeddings(embeddings)
+        if recorder.enabled:
+            embeddings = RecordedEmbeddings(embeddings, "openai_embeddings")
+    if cfg.coalesce.embedding:
+        embeddings = CoalescedEmbeddings(embeddings, model)
+    if cfg.embedding.cache:
+        embeddings = CachedEmbeddings(
+            embeddings, model, get_cache("embedding", max_entries=cfg.cache.embedding_max_entries)
+        )
+    return embeddings
+
+@lru_cache(maxsize=1)
+def get_client():
+    """
+    QdrantClient dùng chung cho cả process (tái sử dụng kết nối gRPC/HTTP giữa các request).
+    - qdrant.location = ":memory:" -> Qdrant in-memory (test/benchmark)
+    - Ngược lại kết nối tới http://{host}:{port}
+    """
+    from qdrant_client import QdrantClient
+
+    if cfg.qdrant.location:
+        return QdrantClient(location=cfg.qdrant.location)
+    return QdrantClient(
+        url=f"http://{cfg.qdrant.host}:{cfg.qdrant.port}",
+        api_key=cfg.qdrant.api_key,
+        prefer_grpc=True,
+        timeout=cfg.resilience.qdrant_timeout
     )
 
+@lru_cache(maxsize=1)
 def get_vectorstore():
     """
-    Kết nối tới Vector DB (Qdrant).
-    Nếu chưa có collection, nó sẽ tự tạo (logic của langchain-qdrant).
-    """
-    embeddings = get_embeddings()
-    
-    # Kết nối Qdrant (Local hoặc Cloud)
-    # Nếu chạy Docker: url="http://localhost:6333"
-    # Nếu chạy In-Memory (test): location=":memory:"
-    
-    url = f"http://{cfg.qdrant.host}:{cfg.qdrant.port}"
-    
-    vectorstore = QdrantVectorStore.from_existing_collection(
-        embedding=embeddings,
+    Kết nối tới Vector DB (Qdrant) với collection đã được tạo bởi ingest.py.
+    """
+    from langchain_qdrant import QdrantVectorStore
+
+    return QdrantVectorStore(
+        client=get_client(),
         collection_name=cfg.qdrant.collection_name,
-        url=url,
-        api_key=cfg.qdrant.api_key,
-        prefer_grpc=True
+        embedding=get_embeddings(),
     )
-    return vectorstore
 
 def get_retriever():
     """Trả về retriever object để dùng trong LangChain"""
+    # Replay không cần kết nối Qdrant
+    if get_recorder().replaying:
+        return recorded_runnable(None, "qdrant_retriever", kind="retriever")
     vectorstore = get_vectorstore()
-    return vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": cfg.search.max_results}
-    )
\ No newline at end of file
+    if cfg.hierarchy.enabled:
+        from src.components.hierarchy import HierarchicalRetriever
+
+        retriever = HierarchicalRetriever(vectorstore=vectorstore, k=cfg.search.max_results)
+    else:
+        from src.components.retrievers import ScoredRetriever
+
+        retriever = ScoredRetriever(vectorstore=vectorstore, k=cfg.search.max_results)
+    # Không hedge cả retriever: embedding câu truy vấn và Qdrant search bên trong được hedge riêng (lời gọi lá)
+    retriever = resilient_runnable(retriever, "qdrant_retriever", "qdrant")
+    return recorded_runnable(retriever, "qdrant_retriever", kind="retriever")
\ No newline at end of file
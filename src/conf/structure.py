@@ -1,11 +1,28 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 @dataclass
 class ServerConfig:
     host: str
     port: int
     reload: bool
+    warmup: bool = True
+    workers: int = 0                  # 0 -> os.cpu_count() (chỉ dùng khi reload = false)
+    graceful_timeout: float = 30.0    # Thời gian chờ request đang chạy khi nhận SIGTERM
+    gzip_min_size: int = 1024         # Nén gzip response lớn hơn ngưỡng (bytes, 0 = tắt)
+    gzip_level: int = 6
+    metrics_dir: Optional[str] = None  # Thư mục snapshot metrics của các worker (None = thư mục tạm)
+    metrics_interval: float = 5.0     # Chu kỳ (giây) mỗi worker ghi snapshot metrics
+
+@dataclass
+class ChainLLMConfig:
+    """Ghi đè cấu hình LLM cho một chain; trường None lấy giá trị của LLMConfig"""
+    name: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
 
 @dataclass
 class LLMConfig:
@@ -14,6 +31,10 @@ class LLMConfig:
     deployment: str
     base_url: Optional[str] = None 
     api_key: Optional[str] = None
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    # Theo tên chain trong src/chains/modules.py (retrieve_router, retrieval_grader, generator, ...)
+    chains: Dict[str, ChainLLMConfig] = field(default_factory=dict)
 
 @dataclass
 class QdrantConfig:
@@ -21,6 +42,161 @@ class QdrantConfig:
     host: str
     port: int
     api_key: Optional[str] = None
+    location: Optional[str] = None  # ":memory:" để dùng Qdrant in-memory
+
+@dataclass
+class EmbeddingConfig:
+    model: str = "text-embedding-3-large"
+    cache: bool = True  # Cache embedding theo (base_url, model, text) trong cfg.cache.path
+
+@dataclass
+class ChainCacheConfig:
+    """Memoize một chain temperature 0 (src/components/chain_cache.py)"""
+    enabled: bool = True
+    version: str = "1"                   # Đổi khi prompt/schema output thay đổi để bỏ kết quả cũ
+    ttl_seconds: Optional[float] = None
+
+@dataclass
+class CacheConfig:
+    path: str = ".cache/rag_cache.sqlite"
+    embedding_max_entries: Optional[int] = 500000
+    ocr: bool = True
+    ocr_ttl_seconds: Optional[float] = 7 * 24 * 3600
+    response: bool = True
+    response_ttl_seconds: Optional[float] = 3600
+    # Theo tên chain trong src/chains/modules.py; chain không khai báo không được cache
+    chains: Dict[str, ChainCacheConfig] = field(default_factory=dict)
+    chain_max_entries: Optional[int] = 100000  # Giới hạn LRU cho mỗi chain
+
+@dataclass
+class CoalesceConfig:
+    """Single-flight cho các lời gọi trùng nhau đang chạy đồng thời (trong một worker)"""
+    chat: bool = True        # Chạy graph cho /chat: câu hỏi đã chuẩn hoá + hash tài liệu
+    ocr: bool = True         # DeepSeek OCR theo sha256 của ảnh
+    embedding: bool = True   # Embedding câu truy vấn theo (model, text)
+
+@dataclass
+class UploadConfig:
+    max_bytes: int = 20 * 1024 * 1024  # Giới hạn kích thước ảnh upload
+    max_body_bytes: int = 28 * 1024 * 1024  # Giới hạn body JSON/multipart (ảnh base64 lớn hơn ảnh gốc 4/3)
+    spool_dir: Optional[str] = None     # None -> thư mục tạm của hệ thống
+    chunk_size: int = 1024 * 1024       # Kích thước mỗi lần đọc/ghi khi spool
+
+@dataclass
+class RouterConfig:
+    local: bool = True                 # Dùng bộ phân loại local trước khi gọi retrieve_router LLM
+    threshold: float = 0.8             # p >= threshold -> yes, p <= 1 - threshold -> no, còn lại hỏi LLM
+    model_path: str = "models/router.json"
+    seed_path: str = "data/router_seed.jsonl"
+    log_decisions: bool = True
+    log_questions: bool = False        # Ghi toàn văn câu hỏi (cần để train từ traffic), mặc định chỉ hash
+    log_path: str = "logs/router_decisions.jsonl"
+
+@dataclass
+class LoggingConfig:
+    level: str = "INFO"                               # stderr
+    json: bool = False                                # stderr dạng JSON lines thay vì text
+    file_path: Optional[str] = "logs/app_{time:YYYY-MM-DD}.log"
+    file_level: str = "DEBUG"
+    file_json: bool = True
+    enqueue: bool = True                              # Ghi log ở thread riêng, không chặn request
+    document_sample_rate: float = 0.1                 # Tỉ lệ lần grade ghi log chi tiết từng điều luật
+
+@dataclass
+class SpeculativeConfig:
+    enabled: bool = False   # Sinh câu trả lời trên top_k điều luật trong khi grade_documents đang chạy
+    top_k: int = 4          # Giữ kết quả khi mọi điều luật qua grade nằm trong top_k
+
+@dataclass
+class CandidatePoolConfig:
+    enabled: bool = True        # Giữ verdict ISREL theo chunk id qua các vòng transform_query -> retrieve
+    min_relevant: int = 0       # > 0: dừng grade khi pool đã có đủ số điều luật relevant
+    max_documents: int = 10     # Số điều luật (vòng hiện tại trước, rồi các vòng trước) đưa vào generate
+    max_stale_rounds: int = 2   # Số vòng liên tiếp không có chunk mới và không có điều luật relevant -> no_answer
+
+@dataclass
+class DecomposeConfig:
+    enabled: bool = False       # Tách câu hỏi phức hợp, retrieve + grade từng câu hỏi con song song
+    min_chars: int = 60         # Câu hỏi ngắn hơn không gọi question_decomposer
+    max_sub_questions: int = 3
+
+@dataclass
+class ReflectionConfig:
+    mode: str = "always"          # always | gated: bỏ qua ISSUP/ISUSE khi đủ tin cậy | shadow: luôn chạy, chỉ ghi quyết định
+    min_score: float = 0.6        # Điểm similarity cao nhất của điều luật dùng để trả lời
+    max_answer_chars: int = 800   # Câu trả lời dài hơn luôn được kiểm tra
+    min_coverage: float = 0.6     # Tỉ lệ n-gram của câu trả lời có trong điều luật đã dẫn
+    shingle_size: int = 3
+    sample_rate: float = 0.1      # gated: tỉ lệ câu trả lời đủ tin cậy vẫn được kiểm tra (giám sát)
+    log_decisions: bool = True
+    log_questions: bool = False   # Ghi toàn văn câu hỏi, mặc định chỉ hash
+    log_path: str = "logs/reflection_decisions.jsonl"
+
+@dataclass
+class HierarchyConfig:
+    enabled: bool = False       # Retrieval hai tầng: chọn văn bản/chương trước, rồi tìm chunk trong đó
+    top_laws: int = 3           # Số văn bản được chọn (0 = chọn chương trực tiếp trên toàn corpus)
+    top_chapters: int = 8       # Số chương (trong các văn bản đã chọn) được tìm chunk
+    collection_suffix: str = "_sections"  # Collection vector tóm tắt: <qdrant.collection_name><suffix>
+
+@dataclass
+class DocumentConfig:
+    full_text_chars: int = 3000      # Tài liệu ngắn hơn được dùng nguyên văn
+    max_section_chars: int = 1500    # Section dài hơn được chia nhỏ
+    top_k: int = 4                   # Số section liên quan đưa vào query và prompt
+    retrieval_query_chars: int = 500 # Độ dài tối đa của phần tài liệu trong query retrieve (HyDE/embedding)
+    max_indexes: int = 32            # Số index tài liệu giữ trong bộ nhớ mỗi process
+
+@dataclass
+class SessionConfig:
+    enabled: bool = True                       # /chat nhận session_id, state được checkpoint giữa các lượt
+    path: str = ".cache/sessions.sqlite"
+    ttl_seconds: Optional[float] = 24 * 3600   # Phiên không hoạt động quá TTL bị xoá
+    max_checkpoints: int = 3                   # Số checkpoint giữ lại cho mỗi phiên
+    max_history: int = 5                       # Số câu hỏi trước đó đưa vào router khi hỏi tiếp
+
+@dataclass
+class ResilienceConfig:
+    enabled: bool = True
+    max_attempts: int = 3                # Số lần thử tối đa cho lỗi tạm thời (timeout, kết nối, 429, 5xx)
+    backoff_base: float = 0.25           # Full jitter: chờ ngẫu nhiên trong [0, min(backoff_max, base * 2^n)]
+    backoff_max: float = 4.0
+    hedge: bool = True                   # Hedged request cho lời gọi idempotent
+    hedge_percentile: float = 0.95       # Gửi bản sao khi lời gọi chậm hơn percentile này
+    hedge_min_samples: int = 20          # Chỉ hedge khi đã có đủ mẫu latency
+    hedge_window: int = 200              # Số mẫu latency gần nhất giữ cho mỗi lời gọi
+    hedge_workers: int = 32
+    # Các chain LLM idempotent được hedge (grader/router trả về nhãn, temperature 0)
+    hedge_chains: List[str] = field(default_factory=lambda: [
+        "retrieve_router", "retrieval_grader", "hallucination_grader", "answer_grader"])
+    breaker_failure_threshold: int = 5   # Số lỗi tạm thời liên tiếp trước khi ngắt mạch provider
+    breaker_reset_seconds: float = 30.0
+    embedding_timeout: float = 20.0
+    qdrant_timeout: int = 10
+    ocr_timeout: float = 60.0
+
+@dataclass
+class IngestConfig:
+    ocr_fallback: bool = True   # OCR (DeepSeek) các trang PDF scan không có lớp text
+    min_page_chars: int = 50    # Trang có ít ký tự (không tính khoảng trắng) hơn được coi là trang scan
+    ocr_workers: int = 4        # Số trang OCR song song
+    pdf_backend: str = "pypdf"  # pypdf | pymupdf (native, `uv sync --extra pdf`)
+    parse_workers: int = 0      # Số process parse PDF song song (0 = số CPU, 1 = tuần tự)
+    pages_per_task: int = 8     # Số trang liên tiếp mỗi task của process pool
+    dedup: bool = True              # Gộp chunk gần trùng (MinHash + LSH)
+    dedup_threshold: float = 0.9    # Jaccard (ước lượng) để coi là gần trùng; thấp hơn dễ gộp nhầm điều khoản chỉ khác chủ thể
+    dedup_shingle_size: int = 5     # Số từ mỗi shingle
+    dedup_num_perm: int = 128       # Số hàm băm MinHash
+    dedup_bands: int = 32           # Số band LSH (num_perm / bands hàng mỗi band)
+
+@dataclass
+class SnapshotConfig:
+    dir: str = "snapshots"                  # Nơi lưu snapshot + manifest (QDRANT_SNAPSHOT_PATH)
+    server_dir: Optional[str] = None        # Cùng thư mục nhìn từ Qdrant (recover bằng file://); None -> upload HTTP
+    restore_on_startup: bool = True         # Khôi phục khi collection chưa có hoặc đã cũ
+    corpus_glob: str = "data/*.pdf"         # Corpus local để kiểm tra collection/snapshot còn khớp
+    keep: int = 3                           # Số phiên bản snapshot giữ lại
+    timeout: int = 600
 
 @dataclass
 class SearchConfig:
@@ -32,6 +208,13 @@ class DeepSeekConfig:
     base_url: Optional[str] = None
     model: str = "deepseek-chat"
 
+@dataclass
+class RecorderConfig:
+    mode: str = "off"  # off | record | replay
+    fixture_path: str = "fixtures/recording.jsonl"
+    simulate_latency: bool = False  # Replay với latency đã ghi nhận
+    latency_scale: float = 1.0
+
 @dataclass
 class AppConfig:
     project_name: str
@@ -42,4 +225,21 @@ class AppConfig:
     llm: LLMConfig
     qdrant: QdrantConfig
     search: SearchConfig
-    deepseek: DeepSeekConfig
\ No newline at end of file
+    deepseek: DeepSeekConfig
+    recorder: RecorderConfig = field(default_factory=RecorderConfig)
+    ingest: IngestConfig = field(default_factory=IngestConfig)
+    snapshot: SnapshotConfig = field(default_factory=SnapshotConfig)
+    embedding: EmbeddingConfig = field(default_factory=EmbeddingConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    coalesce: CoalesceConfig = field(default_factory=CoalesceConfig)
+    upload: UploadConfig = field(default_factory=UploadConfig)
+    router: RouterConfig = field(default_factory=RouterConfig)
+    session: SessionConfig = field(default_factory=SessionConfig)
+    document: DocumentConfig = field(default_factory=DocumentConfig)
+    speculative: SpeculativeConfig = field(default_factory=SpeculativeConfig)
+    decompose: DecomposeConfig = field(default_factory=DecomposeConfig)
+    candidate_pool: CandidatePoolConfig = field(default_factory=CandidatePoolConfig)
+    hierarchy: HierarchyConfig = field(default_factory=HierarchyConfig)
+    reflection: ReflectionConfig = field(default_factory=ReflectionConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    resilience: ResilienceConfig = field(default_factory=ResilienceConfig)
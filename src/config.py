@@ -1,23 +1,46 @@
 import os
-from hydra import compose, initialize
-from omegaconf import DictConfig
+from functools import lru_cache
 import dacite
 from src.conf.structure import AppConfig
-from dotenv import load_dotenv
+from src.logger import configure_logging, logger
 
-load_dotenv()
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conf")
 
 def load_config() -> AppConfig:
-    initialize(version_base=None, config_path="src/conf")
-    dict_cfg = compose(config_name="config")
-    
+    # Import Hydra tại đây để việc import src.config không kéo theo Hydra/OmegaConf
+    from dotenv import load_dotenv
+    from hydra import compose, initialize_config_dir
+    from omegaconf import OmegaConf
+
+    load_dotenv()
+    with initialize_config_dir(version_base=None, config_dir=CONFIG_DIR):
+        dict_cfg = compose(config_name="config")
+
     config_obj = dacite.from_dict(
-        data_class=AppConfig, 
-        data=dict_cfg,
+        data_class=AppConfig,
+        # Container thuần (dict/list) để dacite dựng được các field kiểu Dict
+        data=OmegaConf.to_container(dict_cfg, resolve=True),
         config=dacite.Config(cast=[int, float, bool])
     )
     return config_obj
 
-cfg = load_config()
+@lru_cache(maxsize=1)
+def get_config() -> AppConfig:
+    """Nạp cấu hình ở lần sử dụng đầu tiên"""
+    config_obj = load_config()
+    log = config_obj.logging
+    configure_logging(level=log.level, json_format=log.json, file_path=log.file_path, file_level=log.file_level,
+                      file_json=log.file_json, enqueue=log.enqueue)
+    logger.info("Configuration loaded successfully.")
+    return config_obj
+
+class LazyConfig:
+    """Proxy của AppConfig: chỉ nạp cấu hình khi một thuộc tính được truy cập lần đầu"""
+
+    def __getattr__(self, name):
+        return getattr(get_config(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_config(), name, value)
 
-print("Configuration loaded successfully.")
+cfg = LazyConfig()
@@ -1,20 +1,25 @@
+import random
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
 from langchain_core.documents import Document
+from langchain_core.runnables.config import ContextThreadPoolExecutor, ensure_config
 from src.components.vectordb import get_retriever
+from src.components.chunk_store import get_chunk_store
+from src.components.document_index import select_sections
+from src.components.metrics import (DECOMPOSITIONS, ISREL_VERDICTS, SPECULATIVE_RUNS, SPECULATIVE_SAVED,
+                                    SPECULATIVE_WASTED, SPECULATIVE_WASTED_TOKENS)
 from src.components.ocr import extract_text_with_deepseek
 from src.state import GraphState
 from src.config import cfg
-from src.chains.modules import (
-    retrieval_grader, 
-    generator, 
-    question_rewriter,
-    hyde_generator
-)
+# Chain được truy cập qua module để chỉ khởi tạo ở lần chạy node đầu tiên
+from src.chains import modules as chains
 from src.logger import logger
 
 def ocr_node(state: GraphState):
     """Node xử lý OCR từ ảnh đầu vào"""
     logger.info("---NODE: OCR PROCESSING---")
-    image_base64 = state.get("image_base64")
+    image_path = state.get("image_path")
     document_context = state.get("document_context")
     
     # Nếu đã có document_context thì không cần OCR lại
@@ -23,10 +28,10 @@ def ocr_node(state: GraphState):
         return {"document_context": document_context}
     
     # Nếu có ảnh thì thực hiện OCR
-    if image_base64:
+    if image_path:
         try:
             logger.info(" -> Đang trích xuất văn bản từ ảnh...")
-            extracted_text = extract_text_with_deepseek(image_base64=image_base64)
+            extracted_text = extract_text_with_deepseek(image_path=image_path)
             logger.success(f" -> OCR thành công: {len(extracted_text)} ký tự")
             return {"document_context": extracted_text}
         except Exception as e:
@@ -38,18 +43,15 @@ def ocr_node(state: GraphState):
     return {"document_context": ""}
 
 
-def retrieve_node(state: GraphState):
-    """Node truy xuất điều luật với hỗ trợ HyDE"""
-    logger.info("---NODE: RETRIEVE LEGAL PROVISIONS---")
-    question = state["question"]
-    document_context = state.get("document_context", "")
-    
+def _retrieve(question: str, document_context: str) -> list:
+    """Truy xuất điều luật cho một câu hỏi với hỗ trợ HyDE"""
     retriever = get_retriever()
     
-    # Kết hợp câu hỏi và document context để tìm kiếm tốt hơn
+    # Kết hợp câu hỏi và các section liên quan của tài liệu để tìm kiếm tốt hơn
     if document_context:
-        # Sử dụng cả câu hỏi và context để tạo query
-        enhanced_query = f"{question}\n\nNgữ cảnh từ tài liệu:\n{document_context[:500]}"  # Giới hạn để tránh quá dài
+        # Query retrieve ngắn hơn nhiều so với context của generate: các section chỉ dùng để định hướng
+        excerpt = select_sections(question, document_context)[:cfg.document.retrieval_query_chars]
+        enhanced_query = f"{question}\n\nNgữ cảnh từ tài liệu:\n{excerpt}"
         logger.info(" -> Sử dụng enhanced query với document context")
     else:
         enhanced_query = question
@@ -57,7 +59,7 @@ def retrieve_node(state: GraphState):
     # Áp dụng HyDE: Tạo hypothetical document từ câu hỏi
     try:
         logger.info(" -> Tạo hypothetical document (HyDE)...")
-        hypothetical_doc = hyde_generator.invoke({"question": enhanced_query})
+        hypothetical_doc = chains.hyde_generator.invoke({"question": enhanced_query})
         hyde_query = hypothetical_doc.content
         logger.info(f" -> HyDE query: {hyde_query[:100]}...")
         
@@ -69,61 +71,271 @@ def retrieve_node(state: GraphState):
         # Fallback về query gốc nếu HyDE thất bại
         docs = retriever.invoke(enhanced_query)
         logger.info(f" -> Tìm thấy {len(docs)} điều luật.")
-    
-    return {"documents": docs, "question": question}
+    return docs
+
+
+def retrieve_node(state: GraphState):
+    """Node truy xuất điều luật với hỗ trợ HyDE"""
+    logger.info("---NODE: RETRIEVE LEGAL PROVISIONS---")
+    question = state["question"]
+    docs = _retrieve(question, state.get("document_context", ""))
+    # State chỉ giữ tham chiếu (id, score); Document nằm trong chunk store của request
+    return {"documents": get_chunk_store().add(docs), "question": question}
+
+
+def decompose_node(state: GraphState):
+    """Tách câu hỏi phức hợp (nhiều văn bản/điều khoản) thành các câu hỏi con (cfg.decompose)"""
+    logger.info("---NODE: DECOMPOSE QUESTION---")
+    question = state["question"]
+    sub_questions = [question]
+    if len(question) >= cfg.decompose.min_chars:
+        try:
+            result = chains.question_decomposer.invoke({
+                "question": question, "max_sub_questions": cfg.decompose.max_sub_questions})
+            sub_questions = [q.strip() for q in result.sub_questions if q.strip()][:cfg.decompose.max_sub_questions]
+            sub_questions = sub_questions or [question]
+        except Exception as e:
+            DECOMPOSITIONS.inc(result="error")
+            logger.warning(f" -> Tách câu hỏi thất bại, retrieve câu hỏi gốc: {e}")
+            return {"sub_questions": [question]}
+    DECOMPOSITIONS.inc(result="split" if len(sub_questions) > 1 else "single")
+    if len(sub_questions) > 1:
+        logger.info(f" -> Tách thành {len(sub_questions)} câu hỏi con: {sub_questions}")
+    return {"sub_questions": sub_questions}
+
+
+def retrieve_sub_node(state: dict):
+    """Retrieve và grade một câu hỏi con; các nhánh (Send) chạy song song trong cùng một bước của graph"""
+    question = state["question"]
+    logger.info(f"---NODE: RETRIEVE SUB-QUESTION: {question[:60]}---")
+    refs = get_chunk_store().add(_retrieve(question, state.get("document_context") or ""))
+    filtered_docs, verdicts = _grade(question, refs, state.get("candidate_pool"))
+    return {"sub_results": [{"question": question, "documents": filtered_docs, "new": len(verdicts)}],
+            "candidate_pool": verdicts}
+
+
+def merge_evidence_node(state: GraphState):
+    """Gộp điều luật đã grade của các câu hỏi con: xen kẽ theo thứ hạng, bỏ chunk trùng"""
+    logger.info("---NODE: MERGE EVIDENCE---")
+    order = {q: i for i, q in enumerate(state.get("sub_questions") or [])}
+    results = sorted(state.get("sub_results") or [], key=lambda r: order.get(r["question"], len(order)))
+    merged, seen = [], set()
+    for rank in range(max((len(r["documents"]) for r in results), default=0)):
+        for result in results:
+            if rank < len(result["documents"]) and result["documents"][rank]["id"] not in seen:
+                seen.add(result["documents"][rank]["id"])
+                merged.append(result["documents"][rank])
+    logger.info(f" -> {len(merged)} điều luật từ {len(results)} câu hỏi con")
+    new = sum(result.get("new", 0) for result in results)
+    # Pool đã gồm verdict của các nhánh (reducer); thêm điều luật relevant của các vòng trước
+    merged = _evidence(merged, state.get("candidate_pool"), {})
+    return {"documents": merged, "no_relevant_count": _no_relevant_count(state, merged),
+            "stale_rounds": _stale_rounds(state, new, merged),
+            # Xoá kết quả đã gộp để vòng sau / lượt sau trong session bắt đầu lại
+            "sub_results": None, "speculative_generation": None}
+
+def _grade(question: str, refs: list, pool: dict = None):
+    """
+    Grade ISREL các chunk chưa có trong candidate pool; chunk đã grade ở vòng trước dùng lại verdict.
+    Trả về (tham chiếu relevant theo thứ hạng, verdict mới {id: {"score", "relevant"}}).
+    Với cfg.candidate_pool.min_relevant > 0, dừng grade khi pool đã đủ số điều luật relevant.
+    """
+    settings = cfg.candidate_pool
+    pool = (pool or {}) if settings.enabled else {}
+    # Log từng điều luật chỉ cho một phần các lần grade (cfg.logging.document_sample_rate)
+    verbose = random.random() < cfg.logging.document_sample_rate
+    pending = [ref for ref in refs if ref["id"] not in pool]
+    relevant = sum(verdict["relevant"] for verdict in pool.values())
+    verdicts = {}
+    for ref, d in get_chunk_store().pairs(pending):
+        if settings.min_relevant and relevant >= settings.min_relevant:
+            break
+        score_obj = chains.retrieval_grader.invoke({"question": question, "document": d.page_content})
+        verdicts[ref["id"]] = {"score": ref.get("score"), "relevant": score_obj.score == "relevant"}
+        relevant += verdicts[ref["id"]]["relevant"]
+        if verbose:
+            logger.debug(f" -> {'Keep' if verdicts[ref['id']]['relevant'] else 'Filter out'} doc: {d.page_content[:30]}...")
+    reused = len(refs) - len(pending)
+    ISREL_VERDICTS.inc(len(verdicts), source="graded")
+    ISREL_VERDICTS.inc(reused, source="reused")
+    ISREL_VERDICTS.inc(len(pending) - len(verdicts), source="skipped")
+
+    known = {**pool, **verdicts}
+    filtered_docs = [ref for ref in refs if known.get(ref["id"], {}).get("relevant")]
+    logger.info(f" -> Giữ {len(filtered_docs)}/{len(refs)} điều luật (grade {len(verdicts)}, dùng lại {reused})")
+    return filtered_docs, verdicts
+
+def _evidence(filtered_docs: list, pool: dict, verdicts: dict) -> list:
+    """Điều luật relevant của vòng này, tiếp theo là điều luật relevant của các vòng trước"""
+    if not cfg.candidate_pool.enabled:
+        return filtered_docs
+    seen = {ref["id"] for ref in filtered_docs}
+    earlier = [{"id": chunk_id, "score": verdict["score"]} for chunk_id, verdict in (pool or {}).items()
+               if verdict["relevant"] and chunk_id not in seen and chunk_id not in verdicts]
+    return (filtered_docs + earlier)[:cfg.candidate_pool.max_documents]
+
+def _stale_rounds(state: GraphState, new: int, documents: list) -> int:
+    """Vòng retrieve không mang lại chunk mới nào và không có điều luật relevant -> vòng 'bế tắc'"""
+    if documents or new:
+        return 0
+    return state.get("stale_rounds", 0) + 1
+
+class GenerationCancelled(Exception):
+    """Lời gọi generator bị dừng giữa chừng vì kết quả không còn được dùng"""
+
+    cancelled = True  # MetricsCallbackHandler không tính là lỗi
+
+
+class _GenerationWatch(BaseCallbackHandler):
+    """
+    Theo dõi một lời gọi generator đang stream: đếm token và dừng lời gọi ở token tiếp theo khi `stop` được
+    đặt (exception từ callback cắt stream, kết nối HTTP được đóng nên provider ngừng sinh).
+    """
+
+    raise_error = True
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.tokens = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.tokens += 1
+        if self.stop.is_set():
+            raise GenerationCancelled("speculative generation bị bỏ")
+
+
+def _speculative_generate(question: str, documents: list, document_context: str, watch: _GenerationWatch):
+    try:
+        return _generate(question, documents, document_context, watch)
+    finally:
+        watch.elapsed = time.perf_counter() - watch.start
+
+
+def _record_waste(watch: _GenerationWatch):
+    SPECULATIVE_WASTED.observe(watch.elapsed)
+    SPECULATIVE_WASTED_TOKENS.inc(watch.tokens)
+    logger.info(f" -> Speculative generation dừng sau {watch.elapsed:.2f}s, {watch.tokens} token bị bỏ")
+
+def _speculative_grade(question: str, documents: list, document_context: str, pool: dict):
+    """
+    Sinh câu trả lời trên top cfg.speculative.top_k điều luật trong khi grade toàn bộ danh sách.
+    Trả về (filtered_docs, verdicts, generation, candidates): generation được giữ khi mọi điều luật đã dùng
+    để sinh (candidates) đều qua grade, ngược lại là None (lời gọi generator bị dừng, generate_node sinh lại).
+    Khi giữ, candidates là danh sách điều luật của câu trả lời (citations, kiểm tra ISSUP).
+    """
+    candidates = documents[:cfg.speculative.top_k]
+    watch = _GenerationWatch()
+    executor = ContextThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(_speculative_generate, question, candidates, document_context, watch)
+        filtered_docs, verdicts = _grade(question, documents, pool)
+        graded = time.perf_counter() - watch.start
+
+        if not filtered_docs or not {ref["id"] for ref in candidates} <= {ref["id"] for ref in filtered_docs}:
+            # Không chờ lời gọi LLM đang chạy: nó dừng ở token tiếp theo, thời gian và token đã sinh
+            # được tính khi nó kết thúc
+            watch.stop.set()
+            future.cancel()
+            future.add_done_callback(lambda _: _record_waste(watch))
+            SPECULATIVE_RUNS.inc(result="miss" if filtered_docs else "empty")
+            logger.info(" -> Speculative generation: miss, sẽ sinh lại")
+            return filtered_docs, verdicts, None, candidates
+        try:
+            generation = future.result()
+        except Exception as e:
+            SPECULATIVE_RUNS.inc(result="error")
+            logger.warning(f" -> Speculative generation thất bại: {e}")
+            return filtered_docs, verdicts, None, candidates
+    finally:
+        executor.shutdown(wait=False)
+
+    # Tuần tự: graded + generated; song song: max(graded, generated)
+    saved = min(graded, watch.elapsed)
+    SPECULATIVE_RUNS.inc(result="hit")
+    SPECULATIVE_SAVED.observe(saved)
+    logger.success(f" -> Speculative generation: hit, tiết kiệm {saved:.2f}s")
+    return filtered_docs, verdicts, generation, candidates
 
 def grade_documents_node(state: GraphState):
     logger.info("---NODE: GRADE DOCS (ISREL)---")
     question = state["question"]
     documents = state["documents"]
-    no_relevant_count = state.get("no_relevant_count", 0)
+    pool = state.get("candidate_pool") or {}
     
-    filtered_docs = []
-    for d in documents:
-        score_obj = retrieval_grader.invoke({"question": question, "document": d.page_content})
-        if score_obj.score == "relevant":
-            logger.success(f" -> Keep doc: {d.page_content[:30]}...")
-            filtered_docs.append(d)
-        else:
-            logger.warning(f" -> Filter out: {d.page_content[:30]}...")
+    speculative_generation = None
+    if cfg.speculative.enabled and len(documents) > 0:
+        filtered_docs, verdicts, speculative_generation, candidates = _speculative_grade(
+            question, documents, state.get("document_context", ""), pool)
+    else:
+        filtered_docs, verdicts = _grade(question, documents, pool)
+
+    # Speculative generation chỉ dùng được khi không thêm điều luật của các vòng trước
+    evidence = _evidence(filtered_docs, pool, verdicts)
+    if len(evidence) != len(filtered_docs):
+        speculative_generation = None
+    if speculative_generation:
+        # Câu trả lời, citations và ISSUP dùng cùng danh sách điều luật đã dùng để sinh
+        evidence = candidates
+    return {"documents": evidence, "question": question,
+            "no_relevant_count": _no_relevant_count(state, evidence),
+            "stale_rounds": _stale_rounds(state, len(verdicts), evidence),
+            "candidate_pool": verdicts,
+            "speculative_generation": speculative_generation}
+
+def _no_relevant_count(state: GraphState, filtered_docs: list) -> int:
+    """Số lần retrieve liên tiếp không có điều luật liên quan"""
+    if filtered_docs:
+        return 0
+    no_relevant_count = state.get("no_relevant_count", 0) + 1
+    logger.warning(f" -> No relevant docs found. Count: {no_relevant_count}/5")
+    return no_relevant_count
+
+def _reference_label(reference: dict) -> str:
+    label = reference.get("source", "Nguồn không xác định")
+    return f"{label}, Điều {reference['article']}" if reference.get("article") is not None else label
 
-    if not filtered_docs:
-        no_relevant_count += 1
-        logger.warning(f" -> No relevant docs found. Count: {no_relevant_count}/5")
+def build_citations(refs: list) -> list:
+    """Citations trả về cho user từ tham chiếu chunk trong state["citations"]"""
+    # Checkpoint cũ lưu sẵn citation đầy đủ
+    if refs and "content" in refs[0]:
+        return refs
+    return [
+        {
+            "content": d.page_content,
+            "source": d.metadata.get("source", "Nguồn không xác định"),
+            "relevance_score": ref.get("score"),
+            # Chunk gần trùng đã gộp khi ingest: mọi nơi nội dung này xuất hiện
+            "references": [_reference_label(r) for r in d.metadata["references"]] if d.metadata.get("references") else None,
+        }
+        for ref, d in get_chunk_store().pairs(refs)
+    ]
+
+def _with_handler(handler: BaseCallbackHandler) -> dict:
+    """Config của runnable hiện tại thêm một callback handler (giữ các handler của graph)"""
+    callbacks = ensure_config().get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
     else:
-        no_relevant_count = 0
-            
-    return {"documents": filtered_docs, "question": question, "no_relevant_count": no_relevant_count}
+        callbacks = [*(callbacks or []), handler]
+    return {"callbacks": callbacks}
 
-def generate_node(state: GraphState):
-    """Node sinh câu trả lời với legal reasoning và Chain-of-Thought"""
-    logger.info("---NODE: GENERATE WITH LEGAL REASONING---")
-    question = state["question"]
-    documents = state.get("documents", [])
-    document_context = state.get("document_context", "")
-    
+def _generate(question: str, refs: list, document_context: str, handler: BaseCallbackHandler = None) -> str:
+    """Gọi generator với các điều luật và các section liên quan của tài liệu"""
+    documents = get_chunk_store().resolve(refs)
     # Chuẩn bị context từ điều luật
     legal_provisions = ""
-    citations = []
     if documents:
         legal_provisions = "\n\n".join([
             f"Điều luật {i+1}:\n{d.page_content}" 
             for i, d in enumerate(documents)
         ])
-        # Lưu citations để trả về cho user
-        citations = [
-            {
-                "content": d.page_content,
-                "source": d.metadata.get("source", "Nguồn không xác định"),
-                "relevance_score": d.metadata.get("score", None)
-            }
-            for d in documents
-        ]
-        logger.info(f" -> Sử dụng {len(documents)} điều luật")
-    else:
-        logger.warning(" -> Không có điều luật nào được tìm thấy")
     
-    # Kết hợp document context và legal provisions
+    # Kết hợp các section liên quan của tài liệu và legal provisions
+    document_context = select_sections(question, document_context)
     full_context = ""
     if document_context:
         full_context += f"NỘI DUNG TÀI LIỆU:\n{document_context}\n\n"
@@ -131,22 +343,45 @@ def generate_node(state: GraphState):
         full_context += f"CÁC ĐIỀU LUẬT LIÊN QUAN:\n{legal_provisions}\n\n"
     
     # Sinh câu trả lời với legal reasoning
-    generation = generator.invoke({
+    generation = chains.generator.invoke({
         "context": full_context, 
         "question": question,
         "document_context": document_context
-    })
+    }, config=_with_handler(handler) if handler else None)
+    return generation.content
+
+def generate_node(state: GraphState):
+    """Node sinh câu trả lời với legal reasoning và Chain-of-Thought"""
+    logger.info("---NODE: GENERATE WITH LEGAL REASONING---")
+    question = state["question"]
+    documents = state.get("documents", [])
+    document_context = state.get("document_context", "")
+    
+    if documents:
+        logger.info(f" -> Sử dụng {len(documents)} điều luật")
+    else:
+        logger.warning(" -> Không có điều luật nào được tìm thấy")
+
+    # Câu trả lời đã được sinh song song với bước grade (cfg.speculative), chỉ dùng một lần:
+    # nếu bị đánh giá không được hỗ trợ, lần sinh lại sẽ gọi generator
+    generation = state.get("speculative_generation")
+    if generation:
+        logger.info(" -> Dùng câu trả lời speculative")
+    else:
+        generation = _generate(question, documents, document_context)
     
     return {
-        "generation": generation.content,
-        "citations": citations
+        "generation": generation,
+        # Tham chiếu các điều luật đã dùng; citations được dựng khi trả response (build_citations)
+        "citations": list(documents),
+        "speculative_generation": None
     }
 
 def transform_query_node(state: GraphState):
     logger.info("---NODE: TRANSFORM QUERY---")
     question = state["question"]
-    better_question = question_rewriter.invoke({"question": question})
-    return {"question": better_question.content}
+    better_question = chains.question_rewriter.invoke({"question": question})
+    return {"question": better_question.content, "loop_step": state.get("loop_step", 0) + 1}
 
 def detect_contradictions_node(state: GraphState):
     """Node phát hiện mâu thuẫn giữa tài liệu và quy định pháp luật"""
@@ -160,7 +395,7 @@ def detect_contradictions_node(state: GraphState):
         return {"contradictions": []}
     
     # Sử dụng LLM để phát hiện mâu thuẫn
-    from src.chains.modules import llm
+    from src.chains.modules import get_llm, build_chain
     from langchain_core.prompts import ChatPromptTemplate
     
     contradiction_prompt = ChatPromptTemplate.from_messages([
@@ -185,10 +420,11 @@ def detect_contradictions_node(state: GraphState):
          Hãy phát hiện các điểm mâu thuẫn:""")
     ])
     
-    legal_provisions = "\n\n".join([d.page_content for d in documents])
+    legal_provisions = "\n\n".join([d.page_content for d in get_chunk_store().resolve(documents)])
+    document_context = select_sections(state["question"], document_context)
     
     try:
-        chain = contradiction_prompt | llm
+        chain = build_chain(contradiction_prompt | get_llm("contradiction_detector"), "contradiction_detector")
         result = chain.invoke({
             "document_context": document_context[:2000],  # Giới hạn độ dài
             "legal_provisions": legal_provisions[:2000]
@@ -216,14 +452,9 @@ def detect_contradictions_node(state: GraphState):
 
 def prepare_for_final_grade_node(state: GraphState):
     logger.info("---NODE: PREPARE FOR FINAL GRADE---")
-    return {
-        "question": state["question"],
-        "generation": state["generation"],
-        "documents": state.get("documents", []),
-        "citations": state.get("citations", []),
-        "contradictions": state.get("contradictions", [])
-    }
+    # Các trường cần cho bước grade cuối đã có trong state, không copy lại
+    return {}
 
 def no_answer_node(state: GraphState):
-    logger.stop("---NODE: NO ANSWER (Too many failed retrieves)---")
+    logger.warning("---NODE: NO ANSWER (Too many failed retrieves)---")
     return {"generation": "Xin lỗi, tôi không tìm thấy thông tin liên quan để trả lời câu hỏi của bạn."}
\ No newline at end of file
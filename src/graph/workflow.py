@@ -1,9 +1,17 @@
+from functools import lru_cache
 from langgraph.graph import END, StateGraph
+from langgraph.types import Send
 from src.state import GraphState
-from src.chains.modules import retrieve_router, hallucination_grader, answer_grader
+from src.chains import modules as chains
+from src.components import reflection
+from src.components.chunk_store import get_chunk_store
+from src.components.metrics import ROUTER_DECISIONS
+from src.components.router import get_local_router, log_decision
+from src.config import cfg
 from src.graph.nodes import (
     ocr_node, prepare_for_final_grade_node, retrieve_node, grade_documents_node, 
-    generate_node, transform_query_node, no_answer_node, detect_contradictions_node
+    generate_node, transform_query_node, no_answer_node, detect_contradictions_node,
+    decompose_node, retrieve_sub_node, merge_evidence_node
 )
 from src.logger import logger
 
@@ -13,28 +21,78 @@ def route_after_ocr(state):
     """
     Router: Sau khi OCR, quyết định có cần retrieve không.
     Luôn retrieve nếu có document context hoặc câu hỏi liên quan đến pháp lý.
+    Các câu hỏi còn lại đi qua bộ phân loại local; chỉ gọi retrieve_router LLM khi
+    bộ phân loại không đủ tin cậy.
+    Trong một phiên (session_id), câu hỏi tiếp theo có thể dùng lại điều luật đã retrieve ('continue').
     """
     logger.info("---DECISION: AFTER OCR - CHECK IF RETRIEVE NEEDED---")
     document_context = state.get("document_context", "")
     question = state.get("question", "")
+    history = state.get("history") or []
+
+    # Câu hỏi tiếp theo trong một phiên đã có điều luật: hỏi router xem có cần retrieve lại không
+    if len(history) > 1 and state.get("documents"):
+        previous = "\n".join(f"- {q}" for q in history[:-1])
+        res = chains.retrieve_router.invoke({
+            "question": question,
+            "history": f"Earlier questions of this conversation:\n{previous}",
+        })
+        ROUTER_DECISIONS.inc(source="session", decision=res.decision)
+        if res.decision == "continue":
+            logger.info(" -> Follow-up question: dùng lại điều luật của lượt trước")
+            return "generate"
+        if res.decision == "yes" or document_context:
+            return "retrieve"
+        return "generate"
     
     # Nếu có document context hoặc câu hỏi liên quan đến pháp lý, luôn retrieve
-    if document_context or any(keyword in question.lower() for keyword in 
-                                ["luật", "điều", "quy định", "pháp lý", "hợp đồng", "văn bản"]):
+    if document_context:
+        ROUTER_DECISIONS.inc(source="context", decision="yes")
         return "retrieve"
+    if any(keyword in question.lower() for keyword in
+           ["luật", "điều", "quy định", "pháp lý", "hợp đồng", "văn bản"]):
+        ROUTER_DECISIONS.inc(source="keyword", decision="yes")
+        return "retrieve"
+    
+    # Bộ phân loại local (không gọi LLM)
+    probability = None
+    if cfg.router.local:
+        decision, probability = get_local_router().decide(question, cfg.router.threshold)
+        if decision is not None:
+            logger.info(f" -> Local router: {decision} (p={probability:.2f})")
+            ROUTER_DECISIONS.inc(source="local", decision=decision)
+            log_decision(question, decision, "local", probability)
+            return "retrieve" if decision == "yes" else "generate"
     
     # Kiểm tra bằng retrieve router
-    res = retrieve_router.invoke({"question": question})
+    res = chains.retrieve_router.invoke({"question": question})
+    ROUTER_DECISIONS.inc(source="llm", decision=res.decision)
+    # Quyết định của LLM là nhãn để train lại bộ phân loại local
+    log_decision(question, res.decision, "llm", probability)
     if res.decision == "yes":
         return "retrieve"
     return "generate"
 
+def fan_out_sub_questions(state):
+    """
+    Sau decompose: câu hỏi đơn đi theo retrieve -> grade_documents như bình thường; câu hỏi phức hợp
+    tạo một nhánh retrieve_sub (retrieve + grade) cho mỗi câu hỏi con, các nhánh chạy song song và
+    được gộp ở merge_evidence.
+    """
+    sub_questions = state.get("sub_questions") or []
+    if len(sub_questions) <= 1:
+        return "retrieve"
+    return [Send("retrieve_sub", {"question": q, "document_context": state.get("document_context"),
+                                  "candidate_pool": state.get("candidate_pool")})
+            for q in sub_questions]
+
 def decide_to_generate(state):
     """
     Decide after grading documents:
     - If have relevant docs -> generate
     - If no relevant docs -> transform query
     - If no relevant docs for 5 consecutive retrieves -> no_answer
+    - If the last cfg.candidate_pool.max_stale_rounds retrieves found no unseen chunk -> no_answer
     """
     logger.info("---DECISION: AFTER GRADE DOCS---")
     no_relevant_count = state.get("no_relevant_count", 0)
@@ -44,7 +102,10 @@ def decide_to_generate(state):
         return "generate"
     else:
         if no_relevant_count >= 5:
-            logger.stop(" -> No relevant docs for 5 consecutive retrieves. Going to no_answer.")
+            logger.warning(" -> No relevant docs for 5 consecutive retrieves. Going to no_answer.")
+            return "no_answer"
+        if cfg.candidate_pool.enabled and state.get("stale_rounds", 0) >= cfg.candidate_pool.max_stale_rounds:
+            logger.warning(" -> Rewritten queries keep returning already graded chunks. Going to no_answer.")
             return "no_answer"
         else:
             return "transform_query"
@@ -54,19 +115,28 @@ def grade_generation_v_documents(state):
     Decide after Generate:
     - If not supported by facts -> generate again
     - If supported -> prepare for final grade
+    ISSUP có thể được bỏ qua cho câu trả lời đủ tin cậy (cfg.reflection, src/components/reflection.py).
     """
     logger.info("---DECISION: GRADE GENERATION AND DOCS---")
     question = state["question"]
     generation = state["generation"]
     documents = state.get("documents", [])
-    
+
+    decision = reflection.decide("issup", generation, documents)
+    if not decision["run"]:
+        reflection.log_decision(decision, question, None)
+        logger.info(" -> Skip hallucination check (confident answer).")
+        return "supported"
+
     # Check hallucination
-    hallu_score = hallucination_grader.invoke({
+    hallu_score = chains.hallucination_grader.invoke({
         "question": question,
         "generation": generation, 
-        "documents": "\n\n".join([d.page_content for d in documents])
+        "documents": "\n\n".join([d.page_content for d in get_chunk_store().resolve(documents)])
     })
-    if hallu_score.score in ["fully supported", "partially supported"]:
+    supported = hallu_score.score in ["fully supported", "partially supported"]
+    reflection.log_decision(decision, question, supported)
+    if supported:
         logger.info(" -> Generation is supported by facts.")
         return "supported"
     else:
@@ -79,13 +149,21 @@ def grade_generation_v_question(state):
     Decide after Prepare for Final Grade:
     - If useful (score >=4) -> END
     - If not useful -> transform query
+    ISUSE có thể được bỏ qua cho câu trả lời đủ tin cậy (cfg.reflection).
     """
     logger.info("---DECISION: GRADE GENERATION AND QUESTION---")
     generation = state["generation"]
     question = state["question"]
-    
+
+    decision = reflection.decide("isuse", generation, state.get("documents", []))
+    if not decision["run"]:
+        reflection.log_decision(decision, question, None)
+        logger.info(" -> Skip usefulness check (confident answer).")
+        return "useful"
+
     # Check usefulness
-    useful_score = answer_grader.invoke({"generation": generation, "question": question})
+    useful_score = chains.answer_grader.invoke({"generation": generation, "question": question})
+    reflection.log_decision(decision, question, useful_score.score >= 4)
     if useful_score.score >= 4:
         logger.success(" -> Generation is useful.")
         return "useful"
@@ -95,74 +173,100 @@ def grade_generation_v_question(state):
     
 # --- GRAPH BUILD ---
 
-workflow = StateGraph(GraphState)
-
-# 1. Add Nodes to Graph
-workflow.add_node("ocr", ocr_node)  # OCR processing
-workflow.add_node("retrieve", retrieve_node)
-workflow.add_node("grade_documents", grade_documents_node)
-workflow.add_node("generate", generate_node)
-workflow.add_node("detect_contradictions", detect_contradictions_node)  # Phát hiện mâu thuẫn
-workflow.add_node("prepare_for_final_grade", prepare_for_final_grade_node)
-workflow.add_node("transform_query", transform_query_node)
-workflow.add_node("no_answer", no_answer_node)
-
-# 2. Entry Point: Luôn bắt đầu với OCR
-workflow.set_entry_point("ocr")
-
-# 3. After OCR -> decide retrieve or generate
-workflow.add_conditional_edges(
-    "ocr",
-    route_after_ocr,
-    {
-        "retrieve": "retrieve",
-        "generate": "generate"
-    }
-)
+def build_workflow() -> StateGraph:
+    workflow = StateGraph(GraphState)
 
-# 4. Normal Edges
-workflow.add_edge("retrieve", "grade_documents")
-workflow.add_edge("transform_query", "retrieve")
-
-# 4. Conditional Edges
-
-# From Grade Docs -> where? 
-workflow.add_conditional_edges(
-    "grade_documents",
-    decide_to_generate,
-    {
-        "transform_query": "transform_query",
-        "generate": "generate",
-        "no_answer": "no_answer"
-    }
-)
+    # 1. Add Nodes to Graph
+    workflow.add_node("ocr", ocr_node)  # OCR processing
+    workflow.add_node("retrieve", retrieve_node)
+    workflow.add_node("decompose", decompose_node)  # Tách câu hỏi phức hợp (cfg.decompose)
+    workflow.add_node("retrieve_sub", retrieve_sub_node)
+    workflow.add_node("merge_evidence", merge_evidence_node)
+    workflow.add_node("grade_documents", grade_documents_node)
+    workflow.add_node("generate", generate_node)
+    workflow.add_node("detect_contradictions", detect_contradictions_node)  # Phát hiện mâu thuẫn
+    workflow.add_node("prepare_for_final_grade", prepare_for_final_grade_node)
+    workflow.add_node("transform_query", transform_query_node)
+    workflow.add_node("no_answer", no_answer_node)
 
-# From no_answer -> END
-workflow.add_edge("no_answer", END)
+    # 2. Entry Point: Luôn bắt đầu với OCR
+    workflow.set_entry_point("ocr")
 
-# From Generate -> detect contradictions -> check support
-workflow.add_edge("generate", "detect_contradictions")
+    # 3. After OCR -> decide retrieve or generate
+    workflow.add_conditional_edges(
+        "ocr",
+        route_after_ocr,
+        {
+            "retrieve": "decompose" if cfg.decompose.enabled else "retrieve",
+            "generate": "generate"
+        }
+    )
 
-# From Detect Contradictions -> check if supported
-workflow.add_conditional_edges(
-    "detect_contradictions",
-    grade_generation_v_documents, 
-    {
-        "not supported": "generate",       
-        "supported": "prepare_for_final_grade",   
-    }
-)
+    # Decompose -> retrieve (câu hỏi đơn) hoặc retrieve_sub song song cho từng câu hỏi con (Send)
+    workflow.add_conditional_edges("decompose", fan_out_sub_questions, ["retrieve", "retrieve_sub"])
+    workflow.add_edge("retrieve_sub", "merge_evidence")
 
-# From Prepare for Final Grade -> where?
-workflow.add_conditional_edges(
-    "prepare_for_final_grade",
-    grade_generation_v_question, 
-    {
-        "not useful": "transform_query",       
-        "useful": END,   
-    }
-)
+    # 4. Normal Edges
+    workflow.add_edge("retrieve", "grade_documents")
+    workflow.add_edge("transform_query", "retrieve")
+
+    # 4. Conditional Edges
+
+    # From Grade Docs / Merge Evidence -> where? 
+    for node in ("grade_documents", "merge_evidence"):
+        workflow.add_conditional_edges(
+            node,
+            decide_to_generate,
+            {
+                "transform_query": "transform_query",
+                "generate": "generate",
+                "no_answer": "no_answer"
+            }
+        )
+
+    # From no_answer -> END
+    workflow.add_edge("no_answer", END)
+
+    # From Generate -> detect contradictions -> check support
+    workflow.add_edge("generate", "detect_contradictions")
+
+    # From Detect Contradictions -> check if supported
+    workflow.add_conditional_edges(
+        "detect_contradictions",
+        grade_generation_v_documents, 
+        {
+            "not supported": "generate",       
+            "supported": "prepare_for_final_grade",   
+        }
+    )
+
+    # From Prepare for Final Grade -> where?
+    workflow.add_conditional_edges(
+        "prepare_for_final_grade",
+        grade_generation_v_question, 
+        {
+            "not useful": "transform_query",       
+            "useful": END,   
+        }
+    )
+    return workflow
+
+
+@lru_cache(maxsize=1)
+def get_app_graph():
+    """Compile graph ở lần sử dụng đầu tiên (chain bên trong cũng được khởi tạo lazy)"""
+    return build_workflow().compile()
+
+
+@lru_cache(maxsize=1)
+def get_session_graph():
+    """Graph có checkpointer: state của mỗi session_id (thread_id) được giữ lại giữa các lượt hỏi"""
+    from src.components.checkpoint import get_checkpointer
+    return build_workflow().compile(checkpointer=get_checkpointer())
 
 
-# Compile
-app_graph = workflow.compile()
\ No newline at end of file
+def __getattr__(name):
+    # Giữ tương thích với `from src.graph.workflow import app_graph`
+    if name == "app_graph":
+        return get_app_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,15 +1,92 @@
 # src/logger.py
+"""
+Logger của ứng dụng (loguru):
+- Sink dạng queue (enqueue=True): việc ghi stderr/file chạy ở thread riêng, không chặn request.
+- File log dạng JSON lines; stderr dạng text (hoặc JSON với logging.json = true).
+- Mỗi HTTP request có request_id (middleware trong src/server/app.py, qua logger.contextualize dựa
+  trên contextvars) nên mọi dòng log của graph nodes/chains trong request đó mang cùng request_id.
+
+Sink mặc định được tạo khi import; configure_logging() áp dụng cfg.logging khi cấu hình được nạp.
+
+record_logger(path): log dạng bản ghi (quyết định routing, reflection) ghi mỗi message thành một dòng
+vào file riêng qua sink queue, không đi vào stderr/file log của ứng dụng. Câu hỏi của người dùng trong
+các bản ghi này mặc định chỉ được ghi dưới dạng hash (question_fields).
+"""
+import hashlib
+import json
 import sys
+import threading
+import traceback
 from loguru import logger
 
-logger.remove()
+_record_loggers = {}
+_record_lock = threading.Lock()
 
-logger.add(
-    sys.stderr,
-    format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO"
+TEXT_FORMAT = (
+    "<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <magenta>{extra[request_id]}</magenta> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
 )
 
-logger.add("logs/app_{time:YYYY-MM-DD}.log", rotation="1 day", level="DEBUG")
 
-__all__ = ["logger"]
\ No newline at end of file
+def _json_format(record) -> str:
+    """Một dòng JSON mỗi bản ghi (format được tính ở thread gọi log, chỉ việc ghi nằm trong queue)"""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        **record["extra"],
+    }
+    payload.pop("_json", None)
+    if record["exception"] is not None:
+        exc_type, exc_value, exc_tb = record["exception"]
+        payload["exception"] = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def configure_logging(level: str = "INFO", json_format: bool = False,
+                      file_path: str = "logs/app_{time:YYYY-MM-DD}.log", file_level: str = "DEBUG",
+                      file_json: bool = True, enqueue: bool = True):
+    logger.remove()
+    with _record_lock:
+        _record_loggers.clear()  # Sink của record_logger bị xoá cùng, được thêm lại ở lần ghi sau
+    logger.configure(extra={"request_id": "-"})
+    logger.add(sys.stderr, format=_json_format if json_format else TEXT_FORMAT, level=level, enqueue=enqueue,
+               filter=_not_record)
+    if file_path:
+        logger.add(file_path, format=_json_format if file_json else TEXT_FORMAT, rotation="1 day",
+                   level=file_level, enqueue=enqueue, encoding="utf-8", filter=_not_record)
+
+
+def _not_record(record) -> bool:
+    return "record_path" not in record["extra"]
+
+
+def record_logger(path: str):
+    """
+    Logger ghi mỗi message (vd. một dòng JSON) thành một dòng của `path`. Sink chạy trong queue
+    (enqueue=True): lời gọi chỉ đưa message vào queue, mở/ghi file nằm ở thread của loguru.
+    """
+    with _record_lock:
+        bound = _record_loggers.get(path)
+        if bound is None:
+            logger.add(path, format="{message}", level=0, enqueue=True, encoding="utf-8",
+                       filter=lambda record: record["extra"].get("record_path") == path)
+            bound = _record_loggers[path] = logger.bind(record_path=path)
+        return bound
+
+
+def question_fields(question: str, full_text: bool = False) -> dict:
+    """Câu hỏi trong một bản ghi: hash (đếm/ghép câu hỏi trùng), toàn văn chỉ khi được bật rõ ràng"""
+    fields = {"question_hash": hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:16]}
+    if full_text:
+        fields["question"] = question
+    return fields
+
+
+configure_logging()
+
+__all__ = ["logger", "configure_logging", "record_logger", "question_fields"]
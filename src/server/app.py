@@ -1,9 +1,53 @@
-from fastapi import FastAPI
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from src.config import cfg
-from src.server.routes import router
+from src.server.routes import TrackedRoute, router
+from src.components.metrics import HTTP_LATENCY, chain_report, render_metrics
+from src.logger import logger
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
-app = FastAPI(title=cfg.project_name)
+
+def warm_up():
+    """
+    Khởi tạo trước những gì được tạo lazy (chain, graph, router local, Qdrant client) để request đầu tiên
+    không phải trả chi phí này. Lỗi kết nối chỉ được log, không chặn server khởi động.
+    """
+    from src.chains import modules as chains
+    from src.components.recorder import get_recorder
+    from src.components.router import get_local_router
+    from src.components.vectordb import get_vectorstore
+    from src.graph.workflow import get_app_graph, get_session_graph
+
+    start = time.perf_counter()
+    chains.warm_up()
+    get_app_graph()
+    if cfg.session.enabled:
+        get_session_graph()
+    if cfg.router.local:
+        get_local_router()
+    # Replay không cần kết nối Qdrant
+    if not get_recorder().replaying:
+        try:
+            get_vectorstore().client.get_collections()
+        except Exception as e:
+            logger.warning(f"Warm-up: không kết nối được Qdrant: {e}")
+    logger.info(f"Warm-up hoàn tất trong {time.perf_counter() - start:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if cfg.server.warmup:
+        await asyncio.to_thread(warm_up)
+    yield
+
+
+app = FastAPI(title=cfg.project_name, lifespan=lifespan)
+app.router.route_class = TrackedRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,9 +57,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response lớn (citations, document_context) được nén khi client gửi Accept-Encoding: gzip
+if cfg.server.gzip_min_size:
+    app.add_middleware(GZipMiddleware, minimum_size=cfg.server.gzip_min_size, compresslevel=cfg.server.gzip_level)
+
 app.include_router(router, prefix="/api/v1")
 
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """
+    Gắn request_id (header X-Request-ID của client hoặc sinh mới) vào mọi dòng log của request,
+    kể cả log trong graph nodes chạy ở thread pool (contextvars được copy sang)
+    """
+    request_id = request.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex[:16]
+    with logger.contextualize(request_id=request_id):
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Đo latency theo route (số request đang xử lý theo route: TrackedRoute)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Router ghi route đã match vào scope; dùng template path để giới hạn cardinality của label
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_LATENCY.observe(time.perf_counter() - start, path=path, status=str(status))
+
+
 @app.get("/")
 def read_root():
     return {
@@ -26,4 +103,19 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "okkk"}
\ No newline at end of file
+    return {"status": "okkk"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/chains")
+def metrics_chains():
+    """Latency/token theo chain (gộp mọi worker) và model đang dùng (cfg.llm.chains)"""
+    from src.chains.modules import llm_settings
+
+    report = chain_report()
+    for row in report:
+        row["model"] = llm_settings(row["chain"])["model"] if row["llm_calls"] else None
+    return {"chains": report}
@@ -1,74 +1,274 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from fastapi.responses import HTMLResponse
-from typing import Optional
-import base64
-from src.server.schemas import ChatRequest, ChatResponse, LegalCitation
-from src.graph.workflow import app_graph
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.routing import APIRoute
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, Response
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from typing import Optional, get_args
+import hashlib
+from src.config import cfg
+from src.server.schemas import RESPONSE_EXCLUDE, ChatRequest, ChatResponse, LegalCitation, Verbosity
+from src.server.uploads import SpooledImage, limit_body, spool_base64, spool_stream, spool_upload
+from src.graph.nodes import build_citations
+from src.graph.workflow import get_app_graph, get_session_graph
+from src.chains.modules import llm_settings
+from src.components.cache import get_cache
+from src.components.chunk_store import chunk_scope
+from src.components.metrics import HTTP_INFLIGHT, metrics_callback, record_loop_iterations, track_request
+from src.components.singleflight import AsyncSingleFlight
 from src.logger import logger
 
-router = APIRouter()
+
+class TrackedRoute(APIRoute):
+    """
+    Route đếm số request đang xử lý theo template path (rag_http_inflight_requests{path}).
+    Đếm trong handler của route vì route chỉ được biết sau khi router match, tức sau middleware.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def tracked(request: Request):
+            HTTP_INFLIGHT.inc(path=path)
+            try:
+                return await handler(request)
+            finally:
+                HTTP_INFLIGHT.dec(path=path)
+
+        return tracked
+
+
+router = APIRouter(route_class=TrackedRoute)
+
+# /chat nhận JSON (ChatRequest), multipart (question, image, document_context) hoặc
+# body nhị phân là ảnh (question qua query string)
+CHAT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": ChatRequest.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["question"],
+                    "properties": {
+                        "question": {"type": "string"},
+                        "image": {"type": "string", "format": "binary"},
+                        "document_context": {"type": "string"},
+                        "session_id": {"type": "string"},
+                        "verbosity": {"type": "string", "enum": list(get_args(Verbosity))},
+                    },
+                }
+            },
+            "image/*": {"schema": {"type": "string", "format": "binary"}},
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+        },
+    },
+    "parameters": [
+        {"name": "question", "in": "query", "required": False, "schema": {"type": "string"},
+         "description": "Bắt buộc khi body là ảnh nhị phân"},
+        {"name": "session_id", "in": "query", "required": False, "schema": {"type": "string"},
+         "description": "Phiên hội thoại khi body là ảnh nhị phân"},
+        {"name": "verbosity", "in": "query", "required": False,
+         "schema": {"type": "string", "enum": list(get_args(Verbosity))},
+         "description": "Mức chi tiết của response khi body là multipart hoặc ảnh nhị phân"},
+    ],
+}
+
+
+def response_cache_key(question: str, image: Optional[SpooledImage], document_context: Optional[str]) -> str:
+    """Key của response cache: câu hỏi + tài liệu đính kèm + model sinh câu trả lời"""
+    payload = "\x1f".join([llm_settings("generator")["model"], question, image.sha256 if image else "",
+                           document_context or ""])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_verbosity(value: Optional[str]) -> str:
+    if not value:
+        return "full"
+    if value not in get_args(Verbosity):
+        raise HTTPException(status_code=422, detail=f"verbosity phải là một trong {', '.join(get_args(Verbosity))}")
+    return value
+
+
+def json_response(body: bytes) -> Response:
+    # Serialize bằng pydantic-core (model_dump_json) thay cho jsonable_encoder + json.dumps của FastAPI
+    return Response(content=body, media_type="application/json")
+
+
+def render_response(response: ChatResponse, verbosity: str) -> Response:
+    return json_response(response.model_dump_json(exclude=RESPONSE_EXCLUDE[verbosity]).encode("utf-8"))
+
+
+def coalesce_key(question: str, image: Optional[SpooledImage], document_context: Optional[str]) -> str:
+    """Key single-flight của /chat: câu hỏi đã chuẩn hoá (khoảng trắng, hoa/thường) + hash tài liệu"""
+    payload = "\x1f".join([llm_settings("generator")["model"], " ".join(question.split()).casefold(),
+                           image.sha256 if image else "",
+                           hashlib.sha256((document_context or "").encode("utf-8")).hexdigest()])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
+_chat_flights = AsyncSingleFlight("chat")
+
+
+async def run_chat(question: str, image: Optional[SpooledImage] = None,
+                   document_context: Optional[str] = None, session_id: Optional[str] = None,
+                   verbosity: str = "full") -> Response:
     """
-    Endpoint chính để xử lý câu hỏi pháp lý với tài liệu (nếu có)
+    Chạy graph cho một câu hỏi; ảnh (nếu có) đã được spool ra file tạm và bị xoá khi xong.
+    Với session_id, state của lượt trước (document_context, điều luật đã grade, citations) được
+    nạp từ checkpointer: không OCR lại và router có thể bỏ qua retrieve cho câu hỏi tiếp theo.
+    verbosity chỉ ảnh hưởng response trả về; cache luôn lưu response đầy đủ.
+    Request không có session trùng với một request đang chạy (cfg.coalesce.chat) chờ và dùng chung kết quả.
     """
+    if not cfg.session.enabled:
+        session_id = None
+    try:
+        # Response cache dùng chung giữa các worker (SQLite); câu trả lời trong phiên phụ thuộc lượt trước
+        cache = None
+        if cfg.cache.response and session_id is None:
+            cache = get_cache("response", ttl_seconds=cfg.cache.response_ttl_seconds)
+            cache_key = response_cache_key(question, image, document_context)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("Response cache hit")
+                if verbosity == "full":
+                    return json_response(cached)
+                return render_response(ChatResponse.model_validate_json(cached), verbosity)
+
+        async def execute() -> ChatResponse:
+            response = await run_graph(question, image, document_context, session_id)
+            if cache is not None:
+                cache.set(cache_key, response.model_dump_json().encode("utf-8"))
+            return response
+
+        if cfg.coalesce.chat and session_id is None:
+            response = await _chat_flights.do(coalesce_key(question, image, document_context), execute)
+        else:
+            response = await execute()
+        return render_response(response, verbosity)
+    finally:
+        if image:
+            image.remove()
+
+
+async def run_graph(question: str, image: Optional[SpooledImage], document_context: Optional[str],
+                    session_id: Optional[str]) -> ChatResponse:
+    """Một lần chạy graph (tầng dưới response cache và single-flight)"""
     inputs = {
-        "question": req.question,
+        "question": question,
         "generation": "",  # Initialize empty
         "documents": [],  # Initialize empty
         "retrieve": "",  # Initialize empty
         "loop_step": 0,
         "no_relevant_count": 0,
-        "image_base64": req.image_base64,
-        "document_context": req.document_context,
+        "candidate_pool": None,  # Verdict ISREL chỉ dùng lại trong cùng một câu hỏi
+        "stale_rounds": 0,
+        "image_path": image.path if image else None,
+        "document_context": document_context,
         "citations": [],
-        "contradictions": None
+        "contradictions": None,
+        "history": [question],
     }
+    config = {"callbacks": [metrics_callback]}
+    graph = get_app_graph()
+
+    if session_id:
+        graph = get_session_graph()
+        config["configurable"] = {"thread_id": session_id}
+        previous = (await graph.aget_state(config)).values
+        if previous:
+            history = previous.get("history") or []
+            inputs["history"] = (history + [question])[-cfg.session.max_history:]
+            if not image and not document_context:
+                # Cùng tài liệu: giữ document_context, documents, citations trong checkpoint
+                for key in ("document_context", "documents", "citations"):
+                    del inputs[key]
+            logger.info(f"Tiếp tục session {session_id} ({len(history)} câu hỏi trước)")
     
-    logger.info(f"Nhận câu hỏi: {req.question[:100]}...")
-    if req.image_base64:
-        logger.info("Có ảnh đính kèm")
-    if req.document_context:
+    logger.info(f"Nhận câu hỏi: {question[:100]}...")
+    if image:
+        logger.info(f"Có ảnh đính kèm ({image.size} bytes)")
+    if document_context:
         logger.info("Có document context")
     
-    # Invoke Graph
-    result = await app_graph.ainvoke(inputs)
-    
-    # Chuyển đổi citations từ dict sang LegalCitation objects
-    citations = [
-        LegalCitation(**citation) if isinstance(citation, dict) else citation
-        for citation in result.get("citations", [])
-    ]
+    # Invoke Graph (metrics_callback đo latency node/chain, token và số LLM call của request)
+    # chunk_scope: Document của các điều luật nằm trong chunk store, state chỉ giữ tham chiếu
+    with track_request(), chunk_scope():
+        # durability="exit": chỉ ghi checkpoint khi graph chạy xong, không ghi sau từng node
+        result = await graph.ainvoke(inputs, config=config, durability="exit" if session_id else None)
+        record_loop_iterations(result.get("loop_step", 0))
+
+        # Dựng citations từ tham chiếu chunk
+        citations = [LegalCitation(**citation) for citation in build_citations(result.get("citations") or [])]
     
     return ChatResponse(
         answer=result.get("generation", "Không thể tạo câu trả lời"),
         citations=citations,
         document_context=result.get("document_context"),
-        contradictions=result.get("contradictions")
+        contradictions=result.get("contradictions"),
+        session_id=session_id
     )
 
 
+@router.post("/chat", response_model=ChatResponse, openapi_extra=CHAT_OPENAPI)
+async def chat_endpoint(request: Request):
+    """
+    Endpoint chính để xử lý câu hỏi pháp lý với tài liệu (nếu có).
+    Ảnh có thể gửi dạng base64 trong JSON, file multipart hoặc body nhị phân
+    (hai cách sau không tốn thêm 33% dung lượng của base64).
+    """
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        async with limit_body(request).form(max_files=1) as form:
+            question = form.get("question")
+            document_context = form.get("document_context") or None
+            session_id = form.get("session_id") or None
+            verbosity = parse_verbosity(form.get("verbosity") or request.query_params.get("verbosity"))
+            upload = form.get("image")
+            if not isinstance(question, str) or not question:
+                raise HTTPException(status_code=422, detail="Thiếu trường question")
+            image = await spool_upload(upload) if isinstance(upload, StarletteUploadFile) else None
+
+    elif content_type.startswith(("image/", "application/octet-stream")):
+        question = request.query_params.get("question")
+        document_context = None
+        session_id = request.query_params.get("session_id")
+        verbosity = parse_verbosity(request.query_params.get("verbosity"))
+        if not question:
+            raise HTTPException(status_code=422, detail="Thiếu query parameter question")
+        image = await spool_stream(request.stream(), request.headers.get("content-length"))
+
+    else:
+        try:
+            req = ChatRequest.model_validate_json(await limit_body(request).body())
+        except ValidationError as e:
+            # Cùng định dạng lỗi 422 như khi FastAPI tự validate body
+            raise RequestValidationError([{**error, "loc": ("body", *error["loc"])}
+                                          for error in e.errors(include_url=False)])
+        question, document_context, session_id = req.question, req.document_context, req.session_id
+        verbosity = req.verbosity
+        image = spool_base64(req.image_base64) if req.image_base64 else None
+        del req
+
+    return await run_chat(question, image, document_context, session_id, verbosity)
+
+
 @router.post("/chat/upload", response_model=ChatResponse)
 async def chat_with_upload(
     question: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    verbosity: Verbosity = Form("full")
 ):
     """
     Endpoint để upload ảnh và hỏi đáp
-    Hỗ trợ upload file ảnh trực tiếp
+    Hỗ trợ upload file ảnh trực tiếp (ảnh được spool ra file tạm, không đọc toàn bộ vào bộ nhớ)
     """
-    # Đọc và encode ảnh
-    image_bytes = await image.read()
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-    
-    req = ChatRequest(
-        question=question,
-        image_base64=image_base64
-    )
-    
-    return await chat_endpoint(req)
+    spooled = await spool_upload(image)
+    return await run_chat(question, spooled, session_id=session_id, verbosity=verbosity)
 
 
 @router.get("/demo", response_class=HTMLResponse)
@@ -375,18 +575,15 @@ async def demo_page():
             const contradictionsBox = document.getElementById('contradictionsBox');
             const contradictionsList = document.getElementById('contradictionsList');
             
-            let imageBase64 = null;
+            let imageFile = null;
             
             imageInput.addEventListener('change', function(e) {
                 const file = e.target.files[0];
                 if (file) {
-                    const reader = new FileReader();
-                    reader.onload = function(e) {
-                        imageBase64 = e.target.result.split(',')[1];
-                        imagePreview.src = e.target.result;
-                        imagePreview.style.display = 'block';
-                    };
-                    reader.readAsDataURL(file);
+                    // Gửi file gốc qua multipart, không cần đọc thành base64
+                    imageFile = file;
+                    imagePreview.src = URL.createObjectURL(file);
+                    imagePreview.style.display = 'block';
                 }
             });
             
@@ -405,20 +602,16 @@ async def demo_page():
                 resultSection.style.display = 'none';
                 
                 try {
-                    const payload = {
-                        question: question
-                    };
+                    const formData = new FormData();
+                    formData.append('question', question);
                     
-                    if (imageBase64) {
-                        payload.image_base64 = imageBase64;
+                    if (imageFile) {
+                        formData.append('image', imageFile);
                     }
                     
                     const response = await fetch('/api/v1/chat', {
                         method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify(payload)
+                        body: formData
                     });
                     
                     if (!response.ok) {
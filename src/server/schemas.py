@@ -1,11 +1,23 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+
+# Mức chi tiết của response: compact bỏ nội dung tài liệu đã OCR và nội dung điều luật trong citations,
+# minimal chỉ trả câu trả lời (và session_id)
+Verbosity = Literal["full", "compact", "minimal"]
+
+RESPONSE_EXCLUDE = {
+    "full": None,
+    "compact": {"document_context": True, "citations": {"__all__": {"content"}}},
+    "minimal": {"document_context", "citations", "contradictions"},
+}
 
 
 class ChatRequest(BaseModel):
     question: str
     image_base64: Optional[str] = None  # Base64 encoded image
     document_context: Optional[str] = None  # Pre-extracted document text (Markdown)
+    session_id: Optional[str] = None  # Hỏi tiếp trong cùng phiên: dùng lại tài liệu và điều luật đã có
+    verbosity: Verbosity = "full"  # full | compact | minimal (RESPONSE_EXCLUDE)
 
 
 class LegalCitation(BaseModel):
@@ -13,10 +25,12 @@ class LegalCitation(BaseModel):
     content: str  # Nội dung điều luật
     source: Optional[str] = None  # Nguồn (tên văn bản, số điều)
     relevance_score: Optional[float] = None  # Điểm độ liên quan
+    references: Optional[List[str]] = None  # Mọi nguồn có cùng nội dung (chunk gần trùng được gộp khi ingest)
 
 
 class ChatResponse(BaseModel):
     answer: str
     citations: List[LegalCitation] = []  # Danh sách các điều luật được trích dẫn
     document_context: Optional[str] = None  # Nội dung tài liệu đã OCR (nếu có)
-    contradictions: Optional[List[str]] = None  # Danh sách các điểm mâu thuẫn phát hiện được
\ No newline at end of file
+    contradictions: Optional[List[str]] = None  # Danh sách các điểm mâu thuẫn phát hiện được
+    session_id: Optional[str] = None
@@ -0,0 +1,160 @@
+"""
+Production serving: một master pre-fork nhiều worker uvicorn dùng chung một listening socket.
+
+- Master import app và compile graph trước khi fork (không mở kết nối mạng/SQLite nào), nên
+  worker chia sẻ phần bộ nhớ này theo copy-on-write và không phải import lại.
+- LLM/Qdrant client được tạo sau khi fork, trong lifespan warm-up của từng worker
+  (httpx/gRPC client không an toàn khi dùng chung qua fork).
+- SIGTERM/SIGINT: master chuyển tín hiệu cho các worker; mỗi worker ngừng nhận kết nối mới và
+  chờ các graph run đang chạy hoàn tất (tối đa server.graceful_timeout giây). Tín hiệu thứ hai
+  kết thúc worker ngay lập tức.
+- Worker chết bất thường được master khởi động lại.
+
+Cache OCR, embedding và response nằm trong SQLite cache dùng chung (src/components/cache.py),
+nên mọi worker trên cùng host dùng chung một bản cache.
+
+Metrics nằm trong bộ nhớ từng worker: mỗi worker ghi snapshot vào server.metrics_dir (mặc định một thư mục
+tạm của master) mỗi server.metrics_interval giây và khi dừng; /metrics, /metrics/chains gộp mọi worker.
+Số liệu master có trước khi fork nằm trong snapshot của master, worker xoá bản copy của chúng sau fork.
+"""
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+from src.components import metrics
+from src.config import cfg
+from src.logger import logger
+
+
+def preload():
+    """Phần khởi tạo an toàn để chạy trước fork: import module, nạp config, compile graph"""
+    from src.graph.workflow import get_app_graph
+    from src.server.app import app
+
+    start = time.perf_counter()
+    get_app_graph()
+    logger.info(f"Preload hoàn tất trong {time.perf_counter() - start:.2f}s")
+    return app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket):
+    """Chạy trong process con; uvicorn tự xử lý SIGTERM bằng graceful shutdown"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        timeout_graceful_shutdown=cfg.server.graceful_timeout,
+        log_level="warning",
+    )
+    metrics.reset_after_fork()
+    metrics.start_snapshot_writer(cfg.server.metrics_interval)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    finally:
+        metrics.write_snapshot()
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock)
+            except BaseException as e:
+                logger.exception(f"Worker {index} lỗi: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = index
+        logger.info(f"Worker {index} started (pid {pid})")
+
+    def stop(self, signum, frame):
+        sig = signal.SIGTERM
+        if self.stopping:
+            # Tín hiệu thứ hai: không chờ drain nữa
+            sig = signal.SIGKILL
+            logger.warning("Nhận tín hiệu dừng lần hai, kết thúc các worker ngay")
+        else:
+            logger.info(f"Nhận {signal.Signals(signum).name}, chờ các worker xử lý xong request đang chạy...")
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            if not self.stopping:
+                logger.error(f"Worker {index} (pid {pid}) thoát bất thường ({status}), khởi động lại")
+                time.sleep(1)
+                self.spawn(index)
+        self.sock.close()
+        logger.info("Tất cả worker đã dừng")
+
+
+def serve(host: str = None, port: int = None, workers: int = None):
+    host = host or cfg.server.host
+    port = port or cfg.server.port
+    workers = workers or cfg.server.workers or os.cpu_count() or 1
+
+    # Khôi phục snapshot index (nếu cần) một lần trong master, trước khi các worker kết nối Qdrant
+    from src.components.snapshot import restore_on_startup
+    restore_on_startup()
+
+    metrics_dir = None
+    if workers > 1:
+        metrics_dir = cfg.server.metrics_dir or tempfile.mkdtemp(prefix="rag-metrics-")
+        metrics.enable_multiprocess(metrics_dir)
+
+    app = preload()
+    # Số liệu của master (khôi phục snapshot, preload) vào snapshot riêng; worker bắt đầu từ registry rỗng
+    metrics.write_snapshot()
+    sock = bind_socket(host, port)
+    logger.info(f"Serving {cfg.project_name} trên http://{host}:{port} với {workers} worker")
+    try:
+        Master(app, sock, workers).run()
+    finally:
+        if metrics_dir and not cfg.server.metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    serve()
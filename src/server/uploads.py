@@ -0,0 +1,131 @@
+"""
+Upload Module: ghi ảnh của request ra file tạm theo từng chunk, giới hạn bởi cfg.upload.max_bytes,
+để request không giữ nhiều bản sao của một bản scan lớn trong bộ nhớ. GraphState chỉ mang
+đường dẫn file (image_path); OCR đọc thẳng từ file.
+
+Body JSON và multipart bị giới hạn bởi cfg.upload.max_body_bytes (limit_body): từ chối theo
+Content-Length trước khi đọc, và đếm số byte trong lúc đọc cho body không có Content-Length (chunked).
+"""
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import AsyncIterable
+
+from fastapi import HTTPException, Request, UploadFile
+
+from src.config import cfg
+
+
+@dataclass
+class SpooledImage:
+    path: str
+    size: int
+    sha256: str
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Ảnh vượt quá giới hạn {cfg.upload.max_bytes} bytes")
+
+
+def limit_body(request: Request) -> Request:
+    """
+    Request đọc body qua receive có giới hạn cfg.upload.max_body_bytes (413 ngay khi vượt),
+    dùng cho request.body() và request.form()
+    """
+    limit = cfg.upload.max_body_bytes
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Body vượt quá giới hạn {limit} bytes")
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise HTTPException(status_code=413, detail=f"Body vượt quá giới hạn {limit} bytes")
+        return message
+
+    return Request(request.scope, receive)
+
+
+class _Spool:
+    """File tạm + sha256 + kiểm tra giới hạn kích thước khi ghi từng chunk"""
+
+    def __init__(self):
+        if cfg.upload.spool_dir:
+            os.makedirs(cfg.upload.spool_dir, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(prefix="upload-", suffix=".img", dir=cfg.upload.spool_dir,
+                                                delete=False)
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > cfg.upload.max_bytes:
+            self.abort()
+            raise _too_large()
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def abort(self):
+        self.file.close()
+        SpooledImage(self.file.name, 0, "").remove()
+
+    def finish(self) -> SpooledImage:
+        self.file.close()
+        if self.size == 0:
+            SpooledImage(self.file.name, 0, "").remove()
+            raise HTTPException(status_code=400, detail="Ảnh rỗng")
+        return SpooledImage(self.file.name, self.size, self.digest.hexdigest())
+
+
+async def spool_upload(upload: UploadFile) -> SpooledImage:
+    """Ảnh multipart (UploadFile) -> file tạm"""
+    if upload.size is not None and upload.size > cfg.upload.max_bytes:
+        raise _too_large()
+    spool = _Spool()
+    while chunk := await upload.read(cfg.upload.chunk_size):
+        spool.write(chunk)
+    return spool.finish()
+
+
+async def spool_stream(stream: AsyncIterable[bytes], content_length: str = None) -> SpooledImage:
+    """Body nhị phân (Content-Type: image/* hoặc application/octet-stream) -> file tạm"""
+    if content_length and content_length.isdigit() and int(content_length) > cfg.upload.max_bytes:
+        raise _too_large()
+    spool = _Spool()
+    async for chunk in stream:
+        spool.write(chunk)
+    return spool.finish()
+
+
+def spool_base64(data: str) -> SpooledImage:
+    """
+    Ảnh base64 trong JSON (giữ tương thích) -> file tạm, decode theo từng đoạn thay vì
+    tạo thêm một bản bytes của toàn bộ ảnh.
+    """
+    if data.startswith("data:") and "," in data[:100]:
+        data = data[data.index(",") + 1:]
+    if len(data) // 4 * 3 > cfg.upload.max_bytes + 3:
+        raise _too_large()
+    # Mỗi đoạn phải là bội số của 4 ký tự; base64 có xuống dòng thì decode một lần
+    step = cfg.upload.chunk_size // 3 * 4 if "\n" not in data else len(data)
+    spool = _Spool()
+    try:
+        for start in range(0, len(data), step):
+            spool.write(base64.b64decode(data[start:start + step]))
+    except binascii.Error:
+        spool.abort()
+        raise HTTPException(status_code=422, detail="image_base64 không phải base64 hợp lệ")
+    return spool.finish()
@@ -1,13 +1,35 @@
-from typing import List, TypedDict, Optional
-from langchain_core.documents import Document
+from typing import Annotated, Dict, List, TypedDict, Optional
+
+
+def merge_sub_results(left: Optional[list], right: Optional[list]) -> list:
+    """Reducer của sub_results: các nhánh retrieve_sub nối kết quả, None xoá kết quả đã gộp"""
+    if right is None:
+        return []
+    return (left or []) + right
+
+
+def merge_candidate_pool(left: Optional[dict], right: Optional[dict]) -> dict:
+    """Reducer của candidate_pool: thêm verdict mới (các nhánh song song ghi đồng thời), None xoá pool"""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
+
 
 class GraphState(TypedDict):
     question: str
     generation: str
-    documents: List[Document]
+    documents: List[dict]  # Tham chiếu chunk {"id", "score"}, Document nằm trong chunk store (src/components/chunk_store.py)
     retrieve: str # YES/NO
     loop_step: int # Step count for loops
     no_relevant_count: int # Count retrieves with no relevant docs
+    image_path: Optional[str]  # File tạm chứa ảnh upload (chỉ giữ đường dẫn, không giữ bytes ảnh)
     document_context: Optional[str]  # Nội dung tài liệu đã OCR (Markdown format)
-    citations: List[dict]  # Danh sách các điều luật được trích dẫn
-    contradictions: Optional[List[str]]  # Các điểm mâu thuẫn phát hiện được
\ No newline at end of file
+    citations: List[dict]  # Tham chiếu chunk của các điều luật được trích dẫn (dựng citation khi trả response)
+    contradictions: Optional[List[str]]  # Các điểm mâu thuẫn phát hiện được
+    history: List[str]  # Các câu hỏi gốc trong phiên (session_id), gồm cả câu hiện tại
+    speculative_generation: Optional[str]  # Câu trả lời sinh song song với bước grade (cfg.speculative)
+    sub_questions: List[str]  # Câu hỏi con khi câu hỏi được tách (cfg.decompose)
+    sub_results: Annotated[List[dict], merge_sub_results]  # {"question", "documents"} của từng nhánh retrieve_sub
+    # chunk id -> {"score", "relevant"}: verdict ISREL của mọi chunk đã grade trong request (cfg.candidate_pool)
+    candidate_pool: Annotated[Dict[str, dict], merge_candidate_pool]
+    stale_rounds: int  # Số vòng retrieve liên tiếp không có chunk mới và không có điều luật relevant
@@ -0,0 +1,24 @@
+"""
+Cấu hình chung cho test: biến môi trường giả (không gọi OpenAI/DeepSeek/Qdrant thật) và cache SQLite tạm.
+
+    uv run --group dev pytest
+"""
+import os
+
+for key, value in {"OPENAI_API_KEY": "test", "DEEPSEEK_API_KEY": "test", "QDRANT_HOST": "localhost",
+                   "QDRANT_HTTP_PORT": "6333", "QDRANT_API_KEY": "", "RECORDER_MODE": "off"}.items():
+    os.environ.setdefault(key, value)
+
+import pytest
+
+from src.components.cache import get_cache
+from src.config import cfg
+
+
+@pytest.fixture
+def tmp_cache(tmp_path, monkeypatch):
+    """cfg.cache.path trỏ tới file SQLite tạm của test"""
+    monkeypatch.setattr(cfg.cache, "path", str(tmp_path / "cache.sqlite"))
+    get_cache.cache_clear()  # get_cache memoize theo namespace, không theo path
+    yield cfg.cache.path
+    get_cache.cache_clear()
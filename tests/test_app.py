@@ -0,0 +1,24 @@
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from src.components.metrics import HTTP_INFLIGHT
+from src.config import cfg
+from src.server import routes
+
+
+def test_inflight_gauge_labelled_by_route(monkeypatch):
+    monkeypatch.setattr(cfg.server, "warmup", False)
+    from src.server.app import app
+
+    during = {}
+
+    async def run_chat(*args, **kwargs):
+        during["chat"] = HTTP_INFLIGHT.value(path="/chat")
+        raise HTTPException(status_code=418)
+
+    monkeypatch.setattr(routes, "run_chat", run_chat)
+    client = TestClient(app)
+    assert client.post("/api/v1/chat", json={"question": "q"}).status_code == 418
+    assert during["chat"] == 1
+    assert HTTP_INFLIGHT.value(path="/chat") == 0
+    assert 'rag_http_inflight_requests{path="/chat"} 0.0' in client.get("/metrics").text
@@ -0,0 +1,25 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.chains.modules import build_chain
+
+CHAIN = "question_rewriter"  # Có trong cfg.cache.chains, temperature 0
+
+
+def _chain(template: str, llm):
+    return build_chain(ChatPromptTemplate.from_messages([("human", template)]) | llm, CHAIN)
+
+
+def test_same_prompt_hits_cache(tmp_cache):
+    llm = FakeListChatModel(responses=["a", "b"])
+    chain = _chain("Viết lại: {question}", llm)
+    assert chain.invoke({"question": "q"}).content == "a"
+    assert chain.invoke({"question": "q"}).content == "a"
+    assert chain.invoke({"question": "q khác"}).content == "b"
+
+
+def test_template_change_misses_cache(tmp_cache):
+    llm = FakeListChatModel(responses=["cũ", "mới"])
+    assert _chain("Viết lại: {question}", llm).invoke({"question": "q"}).content == "cũ"
+    # Cùng input, template khác -> key khác (prompt đã render), không trả kết quả cũ
+    assert _chain("Viết lại câu hỏi pháp lý: {question}", llm).invoke({"question": "q"}).content == "mới"
@@ -0,0 +1,80 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from src.components import vectordb
+from src.components.chunk_store import ChunkNotFoundError, ChunkStore, chunk_id, chunk_scope, get_chunk_store
+
+STORED_ID = "5f1c7c2e-8d2a-4c1e-9b8e-0d6f3f3f2a11"
+
+
+class FakeClient:
+    """Collection Qdrant một point"""
+
+    def __init__(self):
+        self.requested = []
+        self.aliases = {}
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        self.requested.append(list(ids))
+        return [SimpleNamespace(id=STORED_ID, payload={"page_content": "Điều 1", "metadata": {"source": "luat.pdf"}})
+                for point_id in ids if self.aliases.get(point_id, point_id) == STORED_ID]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(vectordb, "get_vectorstore", lambda: SimpleNamespace(
+        client=client, content_payload_key="page_content", metadata_payload_key="metadata"))
+    return client
+
+
+def test_chunk_id_is_point_id():
+    assert chunk_id(Document(page_content="x", metadata={"_id": STORED_ID})) == STORED_ID
+
+
+def test_chunk_id_without_point_id_is_stable_uuid():
+    first = chunk_id(Document(page_content="Điều 2"))
+    assert str(uuid.UUID(first)) == first  # Định dạng point id hợp lệ của Qdrant
+    assert chunk_id(Document(page_content="Điều 2")) == first
+    assert chunk_id(Document(page_content="Điều 3")) != first
+
+
+def test_pairs_keep_order_and_scores():
+    store = ChunkStore()
+    docs = [Document(page_content=f"Điều {i}", metadata={"_id": str(i), "score": i / 10}) for i in range(3)]
+    refs = store.add(docs)
+    assert refs == [{"id": "0", "score": 0.0}, {"id": "1", "score": 0.1}, {"id": "2", "score": 0.2}]
+    assert store.resolve(reversed(refs)) == docs[::-1]
+
+
+def test_missing_refs_are_fetched_from_qdrant(client):
+    store = ChunkStore()
+    [(ref, doc)] = store.pairs([{"id": STORED_ID, "score": 0.5}])
+    assert doc.page_content == "Điều 1"
+    assert doc.metadata["source"] == "luat.pdf"
+    store.pairs([ref])
+    assert client.requested == [[STORED_ID]]  # Lần sau lấy từ store
+
+
+def test_unknown_ref_raises(client):
+    with pytest.raises(ChunkNotFoundError):
+        ChunkStore().pairs([{"id": STORED_ID, "score": 0.5}, {"id": str(uuid.uuid4()), "score": 0.4}])
+
+
+def test_hex_ref_matches_dashed_point_id(client):
+    # Qdrant server nhận id dạng hex nhưng trả về dạng có gạch nối; tham chiếu giữ nguyên id
+    hex_id = uuid.UUID(STORED_ID).hex
+    client.aliases = {hex_id: STORED_ID}
+    [(ref, doc)] = ChunkStore().pairs([{"id": hex_id, "score": 0.5}])
+    assert ref["id"] == hex_id
+    assert doc.page_content == "Điều 1"
+
+
+def test_scope_store_is_shared_while_empty():
+    with chunk_scope() as store:
+        assert get_chunk_store() is store
+        refs = get_chunk_store().add([Document(page_content="Điều 4")])
+        assert get_chunk_store().resolve(refs)[0].page_content == "Điều 4"
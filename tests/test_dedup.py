@@ -0,0 +1,36 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from src.components import dedup
+from src.components.dedup import dedup_chunks, find_duplicates, jaccard
+
+BOILERPLATE = ("Luật này có hiệu lực thi hành kể từ ngày 01 tháng 7 năm 2025. Chính phủ, các Bộ, cơ quan "
+               "ngang Bộ và Ủy ban nhân dân các cấp trong phạm vi nhiệm vụ, quyền hạn của mình có trách nhiệm "
+               "tổ chức thực hiện Luật này")
+OTHER = ("Người lao động có quyền đơn phương chấm dứt hợp đồng lao động nhưng phải báo trước cho người "
+         "sử dụng lao động ít nhất 45 ngày nếu làm việc theo hợp đồng không xác định thời hạn")
+
+
+def test_near_duplicates_share_owner():
+    texts = [BOILERPLATE, OTHER, BOILERPLATE.replace("01 tháng 7", "01 tháng 01")]
+    assert jaccard(texts[0], texts[2]) >= 0.7
+    assert find_duplicates(texts, threshold=0.7) == [0, 1, 0]
+
+
+def test_lsh_candidates_are_verified(monkeypatch):
+    # Chữ ký giống hệt nhau: mọi cặp là ứng viên và ước lượng MinHash = 1.0
+    monkeypatch.setattr(dedup, "signatures", lambda texts: np.zeros((len(texts), 128), dtype=np.uint64))
+    texts = [BOILERPLATE, OTHER, BOILERPLATE]
+    assert find_duplicates(texts, threshold=0.8) == [0, 1, 0]
+
+
+def test_dedup_chunks_keeps_all_references():
+    chunks = [Document(page_content=BOILERPLATE, metadata={"source": "a.pdf", "page": 3}),
+              Document(page_content=OTHER, metadata={"source": "a.pdf", "page": 4}),
+              Document(page_content=BOILERPLATE, metadata={"source": "b.pdf", "page": 9})]
+    kept, stats = dedup_chunks(chunks)
+    assert [chunk.page_content for chunk in kept] == [BOILERPLATE, OTHER]
+    assert kept[0].metadata["references"] == [{"source": "a.pdf", "page": 3}, {"source": "b.pdf", "page": 9}]
+    assert kept[0].metadata["duplicates"] == 1
+    assert stats["chunks_after"] == 2
+    assert stats["cross_source_groups"] == 1
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from src.components import metrics
+from src.components.metrics import RETRIES
+
+
+def _fork_worker():
+    """Worker giống src/server/serve.py: xoá số liệu copy từ master, đếm một lần, ghi snapshot"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            metrics.reset_after_fork()
+            RETRIES.inc(provider="test")
+            metrics.write_snapshot()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+# Thread của loguru/pytest không dùng trong process con
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")
+def test_master_counters_counted_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_multiprocess_dir", None)
+    metrics.enable_multiprocess(str(tmp_path))
+    before = RETRIES.value(provider="test")
+    RETRIES.inc(5, provider="test")  # Trong master, trước khi fork
+    metrics.write_snapshot()
+    for _ in range(3):
+        _fork_worker()
+    assert metrics.current_registry().get(RETRIES.name).value(provider="test") == before + 5 + 3
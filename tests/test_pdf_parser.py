@@ -0,0 +1,29 @@
+import warnings
+
+import pytest
+
+from src.components.pdf_parser import _document_info, load_pdf_pages
+
+PDF = "data/112_2025_QH15_586814.pdf"
+
+
+def _pypdf_loader_metadata():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        from langchain_community.document_loaders import PyPDFLoader
+
+        return [doc.metadata for doc in PyPDFLoader(PDF).load()]
+
+
+@pytest.mark.parametrize("backend", ["pypdf", "pymupdf"])
+def test_metadata_matches_pypdf_loader(backend):
+    if backend == "pymupdf":
+        pytest.importorskip("pymupdf")
+    metadata = [doc.metadata for doc in load_pdf_pages([PDF], backend=backend, workers=1)]
+    assert metadata == _pypdf_loader_metadata()
+    assert metadata[0]["creationdate"] == "2026-01-19T17:52:42-08:00"
+
+
+def test_document_info_normalizes_keys_and_dates():
+    assert _document_info({"/Title": " Luật ", "/ModDate": "D:20250101120000+07'00'", "/CreationDate": "hôm qua"}) == {
+        "title": "Luật", "moddate": "2025-01-01T12:00:00+07:00", "creationdate": "hôm qua"}
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from src.components import reflection
+from src.components.chunk_store import ChunkStore
+from src.config import cfg
+from src.logger import logger
+
+ARTICLE = ("Người lao động có quyền đơn phương chấm dứt hợp đồng lao động không xác định thời hạn "
+           "nhưng phải báo trước cho người sử dụng lao động ít nhất 45 ngày")
+
+
+@pytest.fixture
+def refs(monkeypatch):
+    """Tham chiếu tới một điều luật có điểm retrieval 0.9 trong ChunkStore của test"""
+    store = ChunkStore()
+    monkeypatch.setattr(reflection, "get_chunk_store", lambda: store)
+    monkeypatch.setattr(cfg.reflection, "log_decisions", False)
+    return store.add([Document(page_content=ARTICLE, metadata={"_id": "1", "score": 0.9})])
+
+
+@pytest.fixture
+def gated(monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "mode", "gated")
+    monkeypatch.setattr(cfg.reflection, "sample_rate", 0.0)
+
+
+def test_quoting_answer_is_confident(refs, gated):
+    decision = reflection.decide("issup", ARTICLE, refs)
+    assert decision["confident"]
+    assert decision["action"] == "skip"
+    assert not decision["run"]
+
+
+def test_unsupported_answer_is_checked(refs, gated):
+    decision = reflection.decide("issup", "Người lao động được nghỉ việc ngay mà không cần báo trước", refs)
+    assert not decision["confident"]
+    assert decision["action"] == "check"
+    assert decision["run"]
+
+
+def test_low_retrieval_score_is_checked(refs, gated, monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "min_score", 0.95)
+    assert reflection.decide("issup", ARTICLE, refs)["action"] == "check"
+
+
+def test_long_answer_is_checked(refs, gated, monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "max_answer_chars", 20)
+    assert reflection.decide("issup", ARTICLE, refs)["action"] == "check"
+
+
+def test_confident_answer_is_sampled(refs, gated, monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "sample_rate", 1.0)
+    decision = reflection.decide("isuse", ARTICLE, refs)
+    assert decision["action"] == "sample"
+    assert decision["run"]
+
+
+def test_shadow_always_runs(refs, monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "mode", "shadow")
+    monkeypatch.setattr(cfg.reflection, "sample_rate", 0.0)
+    decision = reflection.decide("issup", ARTICLE, refs)
+    assert decision["action"] == "skip"
+    assert decision["run"]
+
+
+def test_always_mode_skips_assessment(refs, monkeypatch):
+    monkeypatch.setattr(cfg.reflection, "mode", "always")
+    assert reflection.decide("issup", ARTICLE, refs) == {"check": "issup", "mode": "always", "action": "check",
+                                                         "run": True}
+
+
+def test_report_counts_would_change():
+    entries = [
+        {"check": "issup", "action": "skip", "confident": True, "passed": None},
+        {"check": "issup", "action": "sample", "confident": True, "passed": False},
+        {"check": "issup", "action": "check", "confident": False, "passed": True},
+    ]
+    result = reflection.report(entries)["issup"]
+    assert result["skippable"] == 1
+    assert result["audited"] == 1
+    assert result["would_change"] == 1
+
+
+def test_decision_log_hashes_question(tmp_path, refs, gated, monkeypatch):
+    path = str(tmp_path / "reflection_decisions.jsonl")
+    monkeypatch.setattr(cfg.reflection, "log_decisions", True)
+    monkeypatch.setattr(cfg.reflection, "log_path", path)
+    reflection.log_decision(reflection.decide("issup", ARTICLE, refs), "Thời hạn báo trước?", None)
+    logger.complete()
+    with open(path, encoding="utf-8") as f:
+        [row] = [json.loads(line) for line in f]
+    assert "question" not in row and row["question_hash"]
+    assert row["action"] == "skip"
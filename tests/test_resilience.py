@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+
+from src.components import resilience
+from src.components.resilience import CircuitBreaker, CircuitOpenError, call, resilient_runnable
+from src.config import cfg
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    """Breaker/cửa sổ latency riêng cho từng test, không backoff"""
+    monkeypatch.setattr(cfg.resilience, "enabled", True)
+    monkeypatch.setattr(cfg.resilience, "hedge", True)
+    monkeypatch.setattr(cfg.resilience, "max_attempts", 3)
+    monkeypatch.setattr(cfg.resilience, "backoff_base", 0.0)
+    monkeypatch.setattr(cfg.resilience, "hedge_min_samples", 1)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_windows", {})
+
+
+def _expire(breaker: CircuitBreaker):
+    breaker._opened_at = time.monotonic() - breaker.reset_seconds
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("p", failure_threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.check() is False
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("p", failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_admits_single_probe():
+    breaker = CircuitBreaker("p", failure_threshold=1, reset_seconds=60)
+    _open(breaker)
+    _expire(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.check() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = CircuitBreaker("p", failure_threshold=1, reset_seconds=60)
+    _open(breaker)
+    _expire(breaker)
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+    _open(breaker)
+    _expire(breaker)
+    breaker.check()
+    breaker.record_failure()  # Lời gọi thăm dò lỗi -> mở lại ngay
+    assert breaker.state == "open"
+
+
+def test_non_retryable_error_releases_probe():
+    breaker = resilience.get_breaker("p")
+    _open(breaker)
+    _expire(breaker)
+
+    def fail():
+        raise ValueError("lỗi không tạm thời")
+
+    with pytest.raises(ValueError):
+        call("p", fail)
+    assert breaker.check() is True  # Lượt half-open được trả lại
+
+
+def test_non_probe_error_keeps_probe_of_other_call():
+    breaker = resilience.get_breaker("p")
+
+    def fail():
+        # Lời gọi đã qua khi breaker đóng; trong lúc nó chạy breaker mở rồi hết hạn, một lời gọi khác thăm dò
+        _open(breaker)
+        _expire(breaker)
+        assert breaker.check() is True
+        raise ValueError("lỗi không tạm thời")
+
+    with pytest.raises(ValueError):
+        call("p", fail)
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+# --- Retry ---
+
+def test_retries_transient_errors():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TimeoutError()
+        return "ok"
+
+    assert call("p", flaky) == "ok"
+    assert len(attempts) == 3
+
+
+def test_does_not_retry_permanent_errors():
+    attempts = []
+
+    def fail():
+        attempts.append(1)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        call("p", fail)
+    assert len(attempts) == 1
+
+
+def test_exhausted_error_is_not_retried_by_outer_call():
+    attempts = []
+
+    def inner():
+        attempts.append(1)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError) as info:
+        call("outer", lambda: call("inner", inner))
+    assert info.value.resilience_exhausted
+    assert len(attempts) == 3
+
+
+# --- Hedging ---
+
+def test_hedge_returns_first_result():
+    resilience._window("slow").add(0.01)
+    release = threading.Event()
+
+    def slow():
+        release.wait(2)
+        return "primary"
+
+    try:
+        assert call("p", slow, name="slow", hedge=True, hedge_fn=lambda: "hedge") == "hedge"
+    finally:
+        release.set()
+
+
+def test_hedge_bounded_by_timeout():
+    resilience._window("slow").add(0.01)
+    release = threading.Event()
+    start = time.monotonic()
+    try:
+        with pytest.raises(TimeoutError):
+            resilience._hedged("p", lambda: release.wait(2), delay=0.01, timeout=0.1)
+    finally:
+        release.set()
+    assert time.monotonic() - start < 1
+
+
+def test_hedge_attempt_does_not_report_callbacks():
+    resilience._window("chain").add(0.01)
+    first = threading.Event()
+    done = threading.Event()
+
+    def inner(inputs):
+        if not first.is_set():
+            first.set()
+            time.sleep(0.3)  # Lần chính chậm -> bản sao hedge về trước
+            done.set()
+        return inputs
+
+    class Starts(BaseCallbackHandler):
+        def __init__(self):
+            self.names = []
+
+        def on_chain_start(self, serialized, inputs, **kwargs):
+            self.names.append(kwargs.get("name"))
+
+    handler = Starts()
+    chain = resilient_runnable(RunnableLambda(inner, name="inner"), "chain", "p", hedge=True)
+    assert chain.invoke("x", config={"callbacks": [handler]}) == "x"
+    done.wait(2)
+    assert handler.names.count("inner") == 1
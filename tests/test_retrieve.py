@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.config import cfg
+from src.graph import nodes
+
+
+def test_retrieval_query_is_capped(monkeypatch):
+    queries = []
+    monkeypatch.setattr(nodes, "chains", SimpleNamespace(hyde_generator=RunnableLambda(
+        lambda inputs: queries.append(inputs["question"]) or AIMessage(content="hyde"))))
+    monkeypatch.setattr(nodes, "get_retriever", lambda: RunnableLambda(lambda query: []))
+    # Các section liên quan của một tài liệu OCR dài (prompt generate vẫn dùng đủ)
+    monkeypatch.setattr(nodes, "select_sections", lambda question, document_context: "section " * 1000)
+
+    nodes._retrieve("Thời hạn báo trước?", "tài liệu dài")
+    [query] = queries
+    assert query.startswith("Thời hạn báo trước?")
+    assert len(query) <= len("Thời hạn báo trước?") + 40 + cfg.document.retrieval_query_chars
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from src.components import router
+from src.config import cfg
+from src.logger import logger
+
+QUESTION = "Tôi bị công ty nợ lương ba tháng thì khởi kiện ở đâu?"
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "router_decisions.jsonl")
+    monkeypatch.setattr(cfg.router, "log_path", path)
+    monkeypatch.setattr(cfg.router, "log_decisions", True)
+    return path
+
+
+def _rows(path):
+    logger.complete()  # Chờ sink queue ghi xong
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_question_is_hashed_by_default(log_path, monkeypatch):
+    monkeypatch.setattr(cfg.router, "log_questions", False)
+    router.log_decision(QUESTION, "yes", "llm", 0.5)
+    [row] = _rows(log_path)
+    assert "question" not in row
+    assert len(row["question_hash"]) == 16
+    assert QUESTION not in open(log_path, encoding="utf-8").read()
+    # Dòng chỉ có hash không dùng được làm nhãn
+    assert router.load_samples(None, log_path) == []
+
+
+def test_full_question_behind_flag(log_path, monkeypatch):
+    monkeypatch.setattr(cfg.router, "log_questions", True)
+    router.log_decision(QUESTION, "yes", "llm", 0.5)
+    router.log_decision("Xin chào", "no", "local", 0.01)
+    assert _rows(log_path)[0]["question"] == QUESTION
+    # Chỉ quyết định của LLM làm nhãn
+    assert router.load_samples(None, log_path) == [(QUESTION, 1)]
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.components.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return "kết quả"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)  # Các follower đang chờ leader
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(2)
+
+    assert results == ["kết quả"] * 5
+    assert len(calls) == 1
+    assert len(flight) == 0
+
+
+def test_error_is_shared_and_key_released():
+    flight = SingleFlight("test")
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError()))
+    assert flight.do("k", lambda: 1) == 1
+
+
+def test_async_calls_share_one_execution():
+    flight = AsyncSingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "kết quả"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["kết quả"] * 5
+    assert len(calls) == 1
+    assert len(flight) == 0
+
+
+def test_async_cancelled_waiter_does_not_cancel_leader():
+    flight = AsyncSingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "kết quả"
+
+    async def main():
+        leader = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == "kết quả"
@@ -0,0 +1,123 @@
+import json
+import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from src.components import snapshot
+from src.config import cfg
+
+SNAPSHOT_BYTES = b"qdrant-snapshot" * 100
+
+
+class FakeClient:
+    """Qdrant admin client: một collection với metadata cho trước"""
+
+    def __init__(self, metadata, timeout):
+        self.metadata = metadata
+        self.timeout = timeout
+        self.deleted = []
+
+    def collection_exists(self, collection_name):
+        return self.metadata is not None
+
+    def get_collection(self, collection_name):
+        return SimpleNamespace(config=SimpleNamespace(metadata=self.metadata), points_count=42)
+
+    def create_snapshot(self, collection_name, wait):
+        return SimpleNamespace(name="server-side.snapshot", checksum="abc")
+
+    def delete_snapshot(self, collection_name, name, wait):
+        self.deleted.append(name)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def qdrant(tmp_path, monkeypatch):
+    """cfg.snapshot.dir tạm, _admin_client giả; clients ghi lại các client đã tạo (và timeout)"""
+    monkeypatch.setattr(cfg.snapshot, "dir", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(cfg.snapshot, "server_dir", None)
+    monkeypatch.setattr(cfg.snapshot, "corpus_glob", str(tmp_path / "*.pdf"))
+    monkeypatch.setattr(cfg.qdrant, "location", None)
+    monkeypatch.setattr(cfg.hierarchy, "enabled", False)
+    state = SimpleNamespace(metadata={**snapshot.index_config(), "index_version": "v1", "corpus_hash": "h1"},
+                            clients=[])
+
+    def admin_client(timeout=None):
+        client = FakeClient(state.metadata, timeout)
+        state.clients.append(client)
+        return client
+
+    monkeypatch.setattr(snapshot, "_admin_client", admin_client)
+    return state
+
+
+@pytest.fixture
+def http(monkeypatch):
+    """httpx.stream trả về snapshot, httpx.post ghi lại upload"""
+    uploads = []
+
+    @contextmanager
+    def stream(method, url, headers, timeout):
+        yield SimpleNamespace(raise_for_status=lambda: None, iter_bytes=lambda size: [SNAPSHOT_BYTES])
+
+    def post(url, params, files, headers, timeout):
+        name, f, _ = files["snapshot"]
+        uploads.append({"url": url, "params": params, "name": name, "content": f.read()})
+        return SimpleNamespace(raise_for_status=lambda: None)
+
+    monkeypatch.setattr(httpx, "stream", stream)
+    monkeypatch.setattr(httpx, "post", post)
+    return uploads
+
+
+def test_create_snapshot_writes_file_and_manifest(qdrant, http):
+    manifest = snapshot.create_snapshot([])
+    assert manifest["version"] == "v1"
+    assert manifest["points"] == 42
+    assert manifest["config"] == snapshot.index_config()
+    with open(os.path.join(cfg.snapshot.dir, manifest["snapshot"]), "rb") as f:
+        assert f.read() == SNAPSHOT_BYTES
+    with open(os.path.join(cfg.snapshot.dir, f"{cfg.qdrant.collection_name}-v1.json"), encoding="utf-8") as f:
+        assert json.load(f) == manifest
+    assert qdrant.clients[0].deleted == ["server-side.snapshot"]  # Bản phía server được xoá
+
+
+def test_create_requires_collection(qdrant, http):
+    qdrant.metadata = None
+    with pytest.raises(ValueError):
+        snapshot.create_snapshot([])
+
+
+def test_restore_uploads_matching_snapshot(qdrant, http):
+    manifest = snapshot.create_snapshot([])
+    qdrant.metadata = None  # Node mới: collection chưa có
+    assert snapshot.restore_if_needed()
+    [upload] = http
+    assert upload["name"] == manifest["snapshot"]
+    assert upload["content"] == SNAPSHOT_BYTES
+    assert upload["params"]["checksum"] == manifest["snapshot_sha256"]
+
+
+def test_current_collection_is_not_restored(qdrant, http):
+    snapshot.create_snapshot([])
+    assert not snapshot.restore_if_needed()
+    assert http == []
+
+
+def test_startup_check_uses_qdrant_timeout(qdrant, http):
+    snapshot.restore_if_needed()
+    assert qdrant.clients[0].timeout == cfg.resilience.qdrant_timeout
+
+
+def test_unreachable_qdrant_does_not_block_startup(qdrant, monkeypatch):
+    def unreachable(timeout=None):
+        raise ConnectionError("Qdrant không phản hồi")
+
+    monkeypatch.setattr(snapshot, "_admin_client", unreachable)
+    monkeypatch.setattr(cfg.snapshot, "restore_on_startup", True)
+    snapshot.restore_on_startup()  # Chỉ log cảnh báo
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.components.chunk_store import chunk_scope
+from src.config import cfg
+from src.graph import nodes
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Grader coi điều luật có chữ 'liên quan' là relevant; generator trả lời bằng nội dung đã nhận"""
+    monkeypatch.setattr(cfg.speculative, "enabled", True)
+    monkeypatch.setattr(cfg.speculative, "top_k", 2)
+    monkeypatch.setattr(nodes, "chains", SimpleNamespace(
+        retrieval_grader=RunnableLambda(lambda inputs: SimpleNamespace(
+            score="relevant" if "liên quan" in inputs["document"] else "no")),
+        generator=RunnableLambda(lambda inputs: AIMessage(content=inputs["context"])),
+    ))
+    with chunk_scope() as store:
+        yield store
+
+
+def _refs(store, *contents):
+    return store.add([Document(page_content=content, metadata={"_id": str(i), "score": 1 - i / 10})
+                      for i, content in enumerate(contents)])
+
+
+def test_hit_when_all_candidates_relevant(graph):
+    refs = _refs(graph, "Điều 1 liên quan", "Điều 2 liên quan", "Điều 3 liên quan")
+    result = nodes.grade_documents_node({"question": "q", "documents": refs})
+    assert "Điều 2" in result["speculative_generation"]
+    # Citations/ISSUP dùng đúng các điều luật đã dùng để sinh câu trả lời
+    assert result["documents"] == refs[:2]
+    assert nodes.generate_node({"question": "q", **result})["citations"] == refs[:2]
+
+
+def test_miss_when_a_candidate_is_filtered_out(graph):
+    refs = _refs(graph, "Điều 1 liên quan", "Điều 2 không", "Điều 3 liên quan")
+    result = nodes.grade_documents_node({"question": "q", "documents": refs})
+    assert result["speculative_generation"] is None
+    assert result["documents"] == [refs[0], refs[2]]
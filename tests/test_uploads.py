@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.config import cfg
+from src.server.routes import router
+
+LIMIT = 1000
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(cfg.upload, "max_body_bytes", LIMIT)
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def _chunks(body: bytes, size: int = 100):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def test_json_rejected_by_content_length(client):
+    body = json.dumps({"question": "x" * LIMIT}).encode()
+    response = client.post("/api/v1/chat", content=body, headers={"content-type": "application/json"})
+    assert response.status_code == 413
+
+
+def test_chunked_json_rejected_while_reading(client):
+    # Generator -> Transfer-Encoding: chunked, không có Content-Length
+    body = json.dumps({"question": "x" * LIMIT}).encode()
+    response = client.post("/api/v1/chat", content=_chunks(body), headers={"content-type": "application/json"})
+    assert response.status_code == 413
+
+
+def test_multipart_rejected_by_content_length(client):
+    response = client.post("/api/v1/chat", data={"question": "q"},
+                           files={"image": ("scan.png", b"\x89PNG" + b"0" * LIMIT, "image/png")})
+    assert response.status_code == 413
+
+
+def test_chunked_multipart_rejected_while_reading(client):
+    boundary = "b0undary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"question\"\r\n\r\nq\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"scan.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode() + b"0" * LIMIT + f"\r\n--{boundary}--\r\n".encode()
+    response = client.post("/api/v1/chat", content=_chunks(body),
+                           headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+
+
+def test_small_invalid_json_is_validated(client):
+    response = client.post("/api/v1/chat", content=b"{}", headers={"content-type": "application/json"})
+    assert response.status_code == 422
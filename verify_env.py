@@ -1,7 +1,7 @@
 import hydra
 from omegaconf import DictConfig, OmegaConf
 
-@hydra.main(version_base=None, config_path="conf", config_name="config")
+@hydra.main(version_base=None, config_path="src/conf", config_name="config")
 def verify_env(cfg : DictConfig) -> None:
     print(OmegaConf.to_yaml(cfg))
 